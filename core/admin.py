@@ -16,6 +16,7 @@ from .models import (
     Reply,
     Like,
     Report,
+    OutboxEmail,
 )
 
 
@@ -24,7 +25,7 @@ from .models import (
 @admin.register(CustomUser)
 class CustomUserAdmin(UserAdmin):
     fieldsets = UserAdmin.fieldsets + (
-        ('Additional Info', {'fields': ('bio', 'department', 'profile_picture', 'role')}),
+        ('Additional Info', {'fields': ('bio', 'department', 'profile_picture', 'role', 'email_notifications')}),
     )
     list_display = ['email', 'first_name', 'last_name', 'department', 'role', 'is_staff']
     search_fields = ['email', 'first_name', 'last_name', 'department']
@@ -114,3 +115,18 @@ class ReportAdmin(admin.ModelAdmin):
     def mark_dismissed(self, request, queryset):
         queryset.update(status='dismissed', moderator=request.user, resolved_at=timezone.now())
     mark_dismissed.short_description = "Mark selected as dismissed"
+
+
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ['to_email', 'subject', 'status', 'attempts', 'next_attempt_at', 'sent_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['to_email', 'subject']
+    readonly_fields = ['created_at', 'sent_at', 'last_error']
+
+    actions = ['retry_now']
+
+    def retry_now(self, request, queryset):
+        queryset.exclude(status='sent').update(status='pending', next_attempt_at=timezone.now())
+    retry_now.short_description = "Retry selected now"
@@ -0,0 +1,132 @@
+"""
+JWT authentication without a user query per request.
+
+Access tokens carry the user's `auth_version` (bumped by core.signals when
+role, the staff flags or is_active change, or the password is set).
+CachedJWTAuthentication resolves the user from the cache, keyed by user id
+and that version, and only reads the database on a miss; a token whose
+version is behind the user's is rejected, so a password change or demotion
+revokes outstanding tokens.
+
+With JWT_ROLE_CLAIMS on, tokens also carry email, username, role and the
+staff flags, and safe (read-only) requests build the user from those claims
+alone. Such tokens stay trusted for reads until they expire unless the
+worker's cache has seen the version bump, so keep ACCESS_TOKEN_LIFETIME
+short and point CACHES at a shared backend (Redis, Memcached) when running
+several workers.
+
+Either way request.user is a CustomUser with only USER_CACHE_FIELDS loaded;
+other fields are fetched on first access, so views that read or save the
+full profile should load it explicitly.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import CustomUser
+
+VERSION_CLAIM = 'ver'
+ROLE_CLAIMS = ('email', 'username', 'role', 'is_staff', 'is_superuser')
+
+USER_CACHE_FIELDS = (
+    'id', 'email', 'username', 'role', 'is_active', 'is_staff', 'is_superuser', 'auth_version',
+    'unread_notification_count',
+)
+
+
+def user_cache_key(user_id, version):
+    return f'auth:user:{user_id}:{version}'
+
+
+def version_cache_key(user_id):
+    return f'auth:user:{user_id}:version'
+
+
+def add_token_claims(token, user):
+    """Stamp a freshly issued token with the user's auth version (and role claims if enabled)"""
+    token[VERSION_CLAIM] = user.auth_version
+    if getattr(settings, 'JWT_ROLE_CLAIMS', False):
+        for claim in ROLE_CLAIMS:
+            token[claim] = getattr(user, claim)
+    return token
+
+
+def auth_version_changed(user_id, version):
+    """Drop cached entries for older versions; called by core.signals after commit"""
+    timeout = getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 60)
+    cache.delete_many([user_cache_key(user_id, v) for v in range(max(version - 5, 0), version)])
+    # Outlives every access token issued before the bump
+    cache.set(version_cache_key(user_id), version, max(timeout, int(api_settings.ACCESS_TOKEN_LIFETIME.total_seconds())))
+
+
+def forget_cached_users(user_ids):
+    """Drop the cached rows of `user_ids` (e.g. after their unread count moved)"""
+    versions = CustomUser.objects.filter(pk__in=user_ids).values_list('pk', 'auth_version')
+    cache.delete_many([user_cache_key(pk, version) for pk, version in versions])
+
+
+def partial_user(values):
+    """A CustomUser with only USER_CACHE_FIELDS loaded; the rest is deferred"""
+    # from_db expects the loaded values in model field order
+    fields = [f.attname for f in CustomUser._meta.concrete_fields if f.attname in values]
+    return CustomUser.from_db(None, fields, [values[field] for field in fields])
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+
+        if request.method in SAFE_METHODS and all(claim in validated_token for claim in ROLE_CLAIMS):
+            return self.get_claims_user(validated_token), validated_token
+        return self.get_user(validated_token), validated_token
+
+    def get_user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+    def check_version(self, user_id, version):
+        current = cache.get(version_cache_key(user_id))
+        if current is not None and current > version:
+            raise AuthenticationFailed(_("Token has been revoked"), code="token_revoked")
+
+    def get_claims_user(self, validated_token):
+        """Build the user from the token's claims without touching the database"""
+        user_id = self.get_user_id(validated_token)
+        version = validated_token.get(VERSION_CLAIM, 0)
+        self.check_version(user_id, version)
+        values = {claim: validated_token[claim] for claim in ROLE_CLAIMS}
+        # Inactive users can't obtain tokens, and deactivation bumps the version
+        values.update(id=CustomUser._meta.pk.to_python(user_id), is_active=True, auth_version=version)
+        return partial_user(values)
+
+    def get_user(self, validated_token):
+        user_id = self.get_user_id(validated_token)
+        version = validated_token.get(VERSION_CLAIM, 0)
+        key = user_cache_key(user_id, version)
+
+        values = cache.get(key)
+        if values is None:
+            self.check_version(user_id, version)
+            values = CustomUser.objects.filter(pk=user_id).values(*USER_CACHE_FIELDS).first()
+            if values is None:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            if values['auth_version'] != version:
+                raise AuthenticationFailed(_("Token has been revoked"), code="token_revoked")
+            cache.set(key, values, getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 60))
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not values['is_active']:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return partial_user(values)
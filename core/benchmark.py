@@ -0,0 +1,153 @@
+"""
+In-process load benchmark of the API.
+
+`run_benchmark` sends each scenario's GET request straight into the WSGI
+application from a pool of threads and reports latency percentiles and
+throughput per scenario. Scenarios cover every GET route in core.urls,
+plus the thread-list variants that hit different plans, with arguments
+picked from the data (the hottest thread, the busiest and a long-tail
+tag). Run it against a database filled by `manage.py seed_forum` and keep
+the JSON to compare runs across commits.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.test import RequestFactory
+from django.urls import reverse
+
+from . import urls
+from .models import Category, Course, Reply, Resource, Tag, Thread
+
+# Never-ending responses can't be timed
+STREAMING_ROUTES = {'thread-events', 'report-events'}
+
+QUANTILES = (('p50_ms', 0.50), ('p95_ms', 0.95), ('p99_ms', 0.99))
+
+
+class Scenario:
+    def __init__(self, label, path, params=None):
+        self.label = label
+        self.path = path
+        self.params = params or {}
+
+
+def get_routes():
+    return [
+        pattern for pattern in urls.urlpatterns
+        if pattern.name not in STREAMING_ROUTES and hasattr(getattr(pattern.callback, 'cls', None), 'get')
+    ]
+
+
+def build_scenarios():
+    """One scenario per GET route, plus thread-list sorts and filters"""
+    thread = Thread.objects.order_by('-reply_count', 'pk').only('pk').first()
+    tags = Tag.objects.filter(thread_count__gt=0).order_by('-thread_count', 'pk')
+    busy_tag, tail_tag = tags.first(), tags.last()
+    category = Category.objects.order_by('-thread_count', 'pk').first()
+    resource = Resource.objects.order_by('-rating_count', 'pk').only('pk').first()
+    course = Course.objects.only('code').first()
+    if not (thread and busy_tag and category and resource and course):
+        raise ValueError("No data to benchmark; run `manage.py seed_forum` first")
+
+    arguments = {
+        'thread_id': thread.pk,
+        'reply_id': Reply.objects.filter(thread=thread).values_list('pk', flat=True).first(),
+        'id': resource.pk,
+    }
+    slugs = {'category-detail': category.slug, 'tag-threads': busy_tag.slug}
+    params = {'course-search': {'q': course.code.split()[0]}}
+
+    scenarios = []
+    for pattern in get_routes():
+        kwargs = {
+            name: slugs[pattern.name] if name == 'slug' else arguments[name]
+            for name in pattern.pattern.converters
+        }
+        scenarios.append(Scenario(pattern.name, reverse(pattern.name, kwargs=kwargs), params.get(pattern.name)))
+
+    thread_list = reverse('thread-list')
+    scenarios += [
+        Scenario('thread-list popular', thread_list, {'sort': 'popular'}),
+        Scenario('thread-list busy tag', thread_list, {'tag': busy_tag.slug}),
+        Scenario('thread-list long-tail tag', thread_list, {'tag': tail_tag.slug}),
+        Scenario('thread-list search', thread_list, {'q': 'cache memory'}),
+        Scenario('tag-threads long-tail', reverse('tag-threads', kwargs={'slug': tail_tag.slug})),
+    ]
+    return scenarios
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+class Runner:
+    def __init__(self, concurrency=8, requests=200, warmup=10, headers=None):
+        self.application = get_wsgi_application()
+        self.factory = RequestFactory()
+        self.concurrency = concurrency
+        self.requests = requests
+        self.warmup = warmup
+        self.headers = headers or {}
+
+    def request(self, scenario):
+        """Time one request through the WSGI app; returns (seconds, status, body bytes)"""
+        environ = self.factory.get(scenario.path, scenario.params, secure=True, **self.headers).environ
+        statuses = []
+
+        def start_response(status, headers, exc_info=None):
+            statuses.append(int(status.split()[0]))
+
+        start = time.perf_counter()
+        body = self.application(environ, start_response)
+        try:
+            size = sum(len(chunk) for chunk in body)
+        finally:
+            # Fires request_finished, which releases the thread's DB connection
+            if hasattr(body, 'close'):
+                body.close()
+        return time.perf_counter() - start, statuses[0], size
+
+    def run(self, scenario):
+        for _ in range(self.warmup):
+            self.request(scenario)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            start = time.perf_counter()
+            results = list(pool.map(lambda _: self.request(scenario), range(self.requests)))
+            wall = time.perf_counter() - start
+
+        latencies = sorted(seconds * 1000 for seconds, _, _ in results)
+        statuses = {}
+        for _, status_code, _ in results:
+            statuses[str(status_code)] = statuses.get(str(status_code), 0) + 1
+        return {
+            'scenario': scenario.label,
+            'path': scenario.path,
+            'params': scenario.params,
+            'requests': len(results),
+            'statuses': statuses,
+            'errors': sum(1 for _, status_code, _ in results if status_code >= 500),
+            **{name: round(percentile(latencies, q), 2) for name, q in QUANTILES},
+            'mean_ms': round(sum(latencies) / len(latencies), 2),
+            'max_ms': round(latencies[-1], 2),
+            'throughput_rps': round(len(results) / wall, 1),
+            'mean_bytes': sum(size for _, _, size in results) // len(results),
+        }
+
+
+def run_benchmark(scenarios, concurrency=8, requests=200, warmup=10, headers=None, log=None):
+    runner = Runner(concurrency, requests, warmup, headers)
+    results = []
+    for scenario in scenarios:
+        result = runner.run(scenario)
+        if log:
+            log(result)
+        results.append(result)
+    return {
+        'database': connection.vendor,
+        'concurrency': concurrency,
+        'requests_per_scenario': requests,
+        'scenarios': results,
+    }
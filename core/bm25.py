@@ -0,0 +1,254 @@
+"""
+In-process BM25 inverted index used by BM25SearchBackend (core.search).
+
+Documents are identified by an external integer id (the Thread pk) and are
+made of weighted text fields, so a title hit can count more than a reply
+hit. Postings are kept per term as NumPy arrays and scored in one
+vectorized pass per query term.
+
+`from_documents` and `load` build the whole index at once: they collect a
+forward index (per-document term ids and frequencies) and transpose it into
+postings with one sort. `add` and `remove` copy the postings of the terms
+they touch, so they are meant for incremental updates only.
+"""
+import re
+import threading
+from array import array
+from collections import defaultdict
+
+import numpy as np
+
+TOKEN_RE = re.compile(r'\w+')
+
+STOPWORDS = frozenset("""
+a an and are as at be but by do does for from has have how i if in into is it its
+me my no not of on or our so that the their them then there these they this to
+was we what when where which who why will with you your
+""".split())
+
+SNAPSHOT_VERSION = 1
+
+
+def tokenize(text):
+    return [t for t in TOKEN_RE.findall((text or '').lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+def term_counts(fields):
+    """Weighted term frequencies of an iterable of (text, weight) pairs"""
+    counts = defaultdict(float)
+    for text, weight in fields:
+        for token in tokenize(text):
+            counts[token] += weight
+    return counts
+
+
+class BM25Index:
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.built_at = None
+        self._lock = threading.RLock()
+        self._terms = []                # term id -> term
+        self._vocab = {}                # term -> term id
+        self._slots = {}                # external id -> slot
+        self._free = []                 # reusable slots of removed documents
+        self._doc_ids = np.zeros(0, dtype=np.int64)     # slot -> external id
+        self._doc_len = np.zeros(0, dtype=np.float32)   # slot -> weighted length
+        self._total_len = 0.0
+        self._forward = {}              # slot -> (term ids, term frequencies)
+        self._postings = {}             # term id -> (slots, term frequencies)
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._slots
+
+    def doc_ids(self):
+        with self._lock:
+            return list(self._slots)
+
+    # --- Writes ---
+
+    @classmethod
+    def from_documents(cls, documents, k1=1.2, b=0.75):
+        """Build an index from an iterable of (doc_id, fields) in one pass"""
+        index = cls(k1=k1, b=b)
+        doc_ids, doc_ptr, term_ids, tfs = array('q'), array('q', [0]), array('i'), array('f')
+        for doc_id, fields in documents:
+            counts = term_counts(fields)
+            if not counts:
+                continue
+            doc_ids.append(doc_id)
+            term_ids.extend(index._term_id(t) for t in counts)
+            tfs.extend(counts.values())
+            doc_ptr.append(len(term_ids))
+        index._set_forward(
+            np.frombuffer(doc_ids, dtype=np.int64), np.frombuffer(doc_ptr, dtype=np.int64),
+            np.frombuffer(term_ids, dtype=np.int32), np.frombuffer(tfs, dtype=np.float32),
+        )
+        return index
+
+    def add(self, doc_id, fields):
+        """Index (or re-index) `doc_id` from an iterable of (text, weight) pairs"""
+        counts = term_counts(fields)
+
+        with self._lock:
+            self.remove(doc_id)
+            if not counts:
+                return
+            term_ids = np.fromiter((self._term_id(t) for t in counts), dtype=np.int32, count=len(counts))
+            tfs = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+            slot = self._allocate(doc_id)
+            self._doc_len[slot] = tfs.sum()
+            self._total_len += float(self._doc_len[slot])
+            self._forward[slot] = (term_ids, tfs)
+            for term_id, tf in zip(term_ids.tolist(), tfs.tolist()):
+                slots, freqs = self._postings.get(term_id, (None, None))
+                if slots is None:
+                    self._postings[term_id] = (np.array([slot], dtype=np.int32), np.array([tf], dtype=np.float32))
+                else:
+                    self._postings[term_id] = (np.append(slots, np.int32(slot)), np.append(freqs, np.float32(tf)))
+
+    def remove(self, doc_id):
+        with self._lock:
+            slot = self._slots.pop(doc_id, None)
+            if slot is None:
+                return
+            term_ids, _ = self._forward.pop(slot)
+            for term_id in term_ids.tolist():
+                slots, freqs = self._postings[term_id]
+                keep = slots != slot
+                if keep.any():
+                    self._postings[term_id] = (slots[keep], freqs[keep])
+                else:
+                    del self._postings[term_id]
+            self._total_len -= float(self._doc_len[slot])
+            self._doc_len[slot] = 0
+            self._doc_ids[slot] = 0
+            self._free.append(slot)
+
+    def _term_id(self, term):
+        term_id = self._vocab.get(term)
+        if term_id is None:
+            term_id = self._vocab[term] = len(self._terms)
+            self._terms.append(term)
+        return term_id
+
+    def _allocate(self, doc_id):
+        if self._free:
+            slot = self._free.pop()
+        else:
+            slot = len(self._slots)
+            if slot >= len(self._doc_ids):
+                size = max(64, 2 * len(self._doc_ids))
+                self._doc_ids = np.resize(self._doc_ids, size)
+                self._doc_len = np.resize(self._doc_len, size)
+                self._doc_ids[slot:] = 0
+                self._doc_len[slot:] = 0
+        self._slots[doc_id] = slot
+        self._doc_ids[slot] = doc_id
+        return slot
+
+    # --- Reads ---
+
+    def search(self, query, limit=500, candidates=None):
+        """
+        Return [(doc_id, score), ...] best first, at most `limit` long. When
+        `candidates` (an iterable of doc ids) is given, only those documents
+        compete for the `limit` places.
+        """
+        with self._lock:
+            term_ids = {self._vocab.get(t) for t in tokenize(query)} & self._postings.keys()
+            n_docs = len(self._slots)
+            if not term_ids or not n_docs:
+                return []
+            avgdl = self._total_len / n_docs
+            k1, b = self.k1, self.b
+
+            hit_slots, hit_scores = [], []
+            for term_id in term_ids:
+                slots, tfs = self._postings[term_id]
+                df = len(slots)
+                idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+                norm = k1 * (1 - b + b * self._doc_len[slots] / avgdl)
+                hit_slots.append(slots)
+                hit_scores.append(idf * tfs * (k1 + 1) / (tfs + norm))
+
+            slots, inverse = np.unique(np.concatenate(hit_slots), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate(hit_scores))
+            if candidates is not None:
+                keep = np.isin(self._doc_ids[slots], np.fromiter(candidates, dtype=np.int64))
+                slots, scores = slots[keep], scores[keep]
+                if not len(scores):
+                    return []
+            if len(scores) > limit:
+                top = np.argpartition(-scores, limit - 1)[:limit]
+            else:
+                top = np.arange(len(scores))
+            top = top[np.lexsort((self._doc_ids[slots[top]], -scores[top]))]
+            return list(zip(self._doc_ids[slots[top]].tolist(), scores[top].tolist()))
+
+    # --- Snapshots ---
+
+    def save(self, path):
+        """Write a compact .npz snapshot (vocabulary + forward index in CSR form)"""
+        with self._lock:
+            slots = sorted(self._forward)
+            lengths = [len(self._forward[s][0]) for s in slots]
+            empty_i, empty_f = np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+            with open(path, 'wb') as fh:
+                np.savez(
+                    fh,
+                    version=np.array([SNAPSHOT_VERSION]),
+                    params=np.array([self.k1, self.b, self.built_at or 0.0]),
+                    terms=np.frombuffer('\n'.join(self._terms).encode(), dtype=np.uint8),
+                    doc_ids=self._doc_ids[slots] if slots else np.zeros(0, dtype=np.int64),
+                    doc_ptr=np.concatenate(([0], np.cumsum(lengths))).astype(np.int64),
+                    term_ids=np.concatenate([self._forward[s][0] for s in slots]) if slots else empty_i,
+                    tfs=np.concatenate([self._forward[s][1] for s in slots]) if slots else empty_f,
+                )
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        if int(data['version'][0]) != SNAPSHOT_VERSION:
+            raise ValueError(f'Unsupported search snapshot version in {path}')
+        k1, b, built_at = data['params'].tolist()
+        index = cls(k1=k1, b=b)
+        index.built_at = built_at or None
+
+        raw_terms = data['terms'].tobytes().decode()
+        index._terms = raw_terms.split('\n') if raw_terms else []
+        index._vocab = {t: i for i, t in enumerate(index._terms)}
+
+        index._set_forward(
+            data['doc_ids'].astype(np.int64), data['doc_ptr'].astype(np.int64),
+            data['term_ids'].astype(np.int32), data['tfs'].astype(np.float32),
+        )
+        return index
+
+    def _set_forward(self, doc_ids, doc_ptr, term_ids, tfs):
+        """Replace the documents with a forward index in CSR form (slot i = doc_ids[i])"""
+        n_docs = len(doc_ids)
+        self._doc_ids = doc_ids.copy()
+        self._slots = dict(zip(doc_ids.tolist(), range(n_docs)))
+        self._free = []
+        if len(tfs):
+            self._doc_len = np.add.reduceat(tfs, doc_ptr[:-1]).astype(np.float32)
+        else:
+            self._doc_len = np.zeros(n_docs, dtype=np.float32)
+        self._total_len = float(self._doc_len.sum())
+        self._forward = {
+            slot: (term_ids[doc_ptr[slot]:doc_ptr[slot + 1]], tfs[doc_ptr[slot]:doc_ptr[slot + 1]])
+            for slot in range(n_docs)
+        }
+
+        # Transpose the forward index into per-term postings in one sort
+        self._postings = {}
+        doc_of = np.repeat(np.arange(n_docs, dtype=np.int32), np.diff(doc_ptr))
+        order = np.argsort(term_ids, kind='stable')
+        bounds = np.flatnonzero(np.diff(term_ids[order])) + 1
+        for chunk in np.split(order, bounds):
+            if len(chunk):
+                self._postings[int(term_ids[chunk[0]])] = (doc_of[chunk], tfs[chunk])
@@ -0,0 +1,171 @@
+"""
+Incremental maintenance of the denormalized totals on Category and Tag.
+
+`like_count` totals are the sum of Thread.like_count: likes on threads, not
+on replies, and not deltas still pending in like shards (core.likes adds
+those when it folds them). Every helper issues set-based `F()` updates and
+is meant to run inside the same transaction as the write it accounts for.
+`manage.py reconcile_counters` recomputes these, the thread counters, the
+resource rating aggregates and unread notification counts from scratch if
+they ever drift.
+"""
+from collections import defaultdict
+
+from django.db.models import F, Q, Case, When, Value, IntegerField, Count, Sum, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import (
+    Category, Tag, Thread, Reply, Like, ThreadLikeShard, Resource, ResourceRating, CustomUser, Notification
+)
+
+
+def _changes(threads=0, replies=0, likes=0):
+    changes = {}
+    if threads:
+        changes['thread_count'] = F('thread_count') + threads
+    if replies:
+        changes['reply_count'] = F('reply_count') + replies
+    if likes:
+        changes['like_count'] = F('like_count') + likes
+    return changes
+
+
+def adjust_category(category_id, threads=0, replies=0, likes=0):
+    changes = _changes(threads, replies, likes)
+    if changes and category_id:
+        Category.objects.filter(pk=category_id).update(**changes)
+
+
+def adjust_tags(tag_ids, threads=0, replies=0, likes=0):
+    changes = _changes(threads, replies, likes)
+    if changes and tag_ids:
+        Tag.objects.filter(pk__in=tag_ids).update(**changes)
+
+
+def _tag_ids(thread):
+    return list(thread.tags.values_list('pk', flat=True))
+
+
+def thread_added(thread):
+    """Count a new `thread` (with its current replies and likes) in its category and tags"""
+    adjust_category(thread.category_id, 1, thread.reply_count, thread.like_count)
+    adjust_tags(_tag_ids(thread), 1, thread.reply_count, thread.like_count)
+
+
+def thread_removed(thread):
+    """Call before deleting `thread`, while its tags are still attached"""
+    adjust_category(thread.category_id, -1, -thread.reply_count, -thread.like_count)
+    adjust_tags(_tag_ids(thread), -1, -thread.reply_count, -thread.like_count)
+
+
+def thread_moved(thread, old_category_id):
+    adjust_category(old_category_id, -1, -thread.reply_count, -thread.like_count)
+    adjust_category(thread.category_id, 1, thread.reply_count, thread.like_count)
+
+
+def thread_retagged(thread, added_tag_ids, removed_tag_ids):
+    adjust_tags(list(added_tag_ids), 1, thread.reply_count, thread.like_count)
+    adjust_tags(list(removed_tag_ids), -1, -thread.reply_count, -thread.like_count)
+
+
+def thread_activity(thread, replies=0, likes=0):
+    """Propagate a change in a thread's replies or likes to its category and tags"""
+    adjust_category(thread.category_id, replies=replies, likes=likes)
+    if _changes(replies=replies, likes=likes):
+        Tag.objects.filter(threads=thread).update(**_changes(replies=replies, likes=likes))
+
+
+def _by_key(deltas):
+    """CASE expression mapping pk -> delta, for one UPDATE across many rows"""
+    return Case(*[When(pk=pk, then=Value(delta)) for pk, delta in deltas.items()], output_field=IntegerField())
+
+
+def threads_replies_removed(removed):
+    """
+    Bulk version of thread_activity for {thread_id: replies removed}: takes
+    the replies off Thread.reply_count and the category and tag totals.
+    """
+    removed = {pk: n for pk, n in removed.items() if n}
+    if not removed:
+        return
+    Thread.objects.filter(pk__in=removed).update(
+        reply_count=Greatest(F('reply_count') - _by_key(removed), 0)
+    )
+    per_category = defaultdict(int)
+    for pk, category_id in Thread.objects.filter(pk__in=removed).values_list('pk', 'category_id'):
+        per_category[category_id] += removed[pk]
+    per_tag = defaultdict(int)
+    for thread_id, tag_id in Thread.tags.through.objects.filter(thread_id__in=removed).values_list('thread_id', 'tag_id'):
+        per_tag[tag_id] += removed[thread_id]
+    if per_category:
+        Category.objects.filter(pk__in=per_category).update(
+            reply_count=F('reply_count') - _by_key(per_category)
+        )
+    if per_tag:
+        Tag.objects.filter(pk__in=per_tag).update(reply_count=F('reply_count') - _by_key(per_tag))
+
+
+def _recount(model, scope, fields):
+    """
+    Rewrite `fields` (name -> expression) on every `model` row whose stored
+    value disagrees with the recomputed one. Returns the number of rows fixed.
+    """
+    annotations = {f'actual_{name}': Coalesce(expr, 0) for name, expr in fields.items()}
+    drift = Q()
+    for name in fields:
+        drift |= ~Q(**{name: F(f'actual_{name}')})
+    stale = list(scope.annotate(**annotations).filter(drift).values_list('pk', flat=True))
+    if stale:
+        model.objects.filter(pk__in=stale).update(
+            **{name: Coalesce(expr, 0) for name, expr in fields.items()}
+        )
+    return len(stale)
+
+
+def _sum(queryset, column, group_by):
+    return Subquery(
+        queryset.values(group_by).annotate(total=Sum(column)).values('total')[:1]
+    )
+
+
+def _count(queryset, group_by):
+    return Subquery(
+        queryset.values(group_by).annotate(total=Count('pk')).values('total')[:1]
+    )
+
+
+def reconcile():
+    """Recompute thread, category, tag, resource and user counters; returns rows fixed per model"""
+    # Like rows are the source of truth, so pending shard deltas are obsolete
+    ThreadLikeShard.objects.exclude(count=0).update(count=0)
+    fixed = {}
+    fixed['thread'] = _recount(Thread, Thread.objects.all(), {
+        'reply_count': _count(Reply.objects.filter(thread=OuterRef('pk'), is_deleted=False), 'thread'),
+        'like_count': _count(Like.objects.filter(thread=OuterRef('pk'), content_type='thread'), 'thread'),
+    })
+    by_category = Thread.objects.filter(category=OuterRef('pk'))
+    fixed['category'] = _recount(Category, Category.objects.all(), {
+        'thread_count': _count(by_category, 'category'),
+        'reply_count': _sum(by_category, 'reply_count', 'category'),
+        'like_count': _sum(by_category, 'like_count', 'category'),
+    })
+    by_tag = Thread.tags.through.objects.filter(tag=OuterRef('pk'))
+    fixed['tag'] = _recount(Tag, Tag.objects.all(), {
+        'thread_count': _count(by_tag, 'tag'),
+        'reply_count': _sum(by_tag, 'thread__reply_count', 'tag'),
+        'like_count': _sum(by_tag, 'thread__like_count', 'tag'),
+    })
+    fixed['resource'] = _recount(Resource, Resource.objects.all(), {
+        'rating_sum': _sum(ResourceRating.objects.filter(resource=OuterRef('pk')), 'rating', 'resource'),
+        'rating_count': _count(ResourceRating.objects.filter(resource=OuterRef('pk')), 'resource'),
+        **{
+            f'rating_{stars}_count': _count(ResourceRating.objects.filter(resource=OuterRef('pk'), rating=stars), 'resource')
+            for stars in range(1, 6)
+        },
+    })
+    fixed['user'] = _recount(CustomUser, CustomUser.objects.all(), {
+        'unread_notification_count': _count(
+            Notification.objects.filter(recipient=OuterRef('pk'), is_read=False), 'recipient'
+        ),
+    })
+    return fixed
@@ -0,0 +1,125 @@
+"""
+Per-user email notification preferences and digests.
+
+`notify_user` routes a notification by CustomUser.email_notifications:
+'off' drops it, anything else parks it as a PendingNotification.
+`flush_due_digests` (run by the send_outbox worker) turns a user's pending
+notifications into one outbox email once the oldest has waited the user's
+interval: EMAIL_COALESCE_WINDOW for 'instant', an hour or a day for digests.
+A lone notification goes out unchanged; several are coalesced per thread.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from .models import OutboxEmail, PendingNotification
+
+THREAD_URL = "http://127.0.0.1:8000/thread/{}/"
+
+DIGEST_INTERVALS = {'hourly': 60 * 60, 'daily': 24 * 60 * 60}
+
+FLUSH_BATCH_SIZE = 200
+
+KIND_LABELS = {
+    'reply': ('new reply', 'new replies'),
+    'mention': ('mention', 'mentions'),
+    'status': ('status change', 'status changes'),
+}
+
+
+def interval_for(preference):
+    if preference == 'instant':
+        return getattr(settings, 'EMAIL_COALESCE_WINDOW', 120)
+    return DIGEST_INTERVALS[preference]
+
+
+def notify_user(user, thread, kind, subject, body):
+    notify_users([(user, thread, kind, subject, body)])
+
+
+def notify_users(entries):
+    """Route many (user, thread, kind, subject, body) notifications with one INSERT per table"""
+    coalesce = interval_for('instant') > 0
+    pending, emails = [], []
+    for user, thread, kind, subject, body in entries:
+        preference = user.email_notifications
+        if preference == 'off' or not user.email:
+            continue
+        if preference == 'instant' and not coalesce:
+            emails.append(OutboxEmail(to_email=user.email, subject=subject[:255], body=body))
+        else:
+            pending.append(PendingNotification(user=user, thread=thread, kind=kind, subject=subject[:255], body=body))
+    PendingNotification.objects.bulk_create(pending)
+    OutboxEmail.objects.bulk_create(emails)
+
+
+def due_user_ids(now=None):
+    """Users whose oldest pending notification has waited out their interval"""
+    now = now or timezone.now()
+    user_ids = []
+    for preference in ('instant', *DIGEST_INTERVALS):
+        cutoff = now - timedelta(seconds=interval_for(preference))
+        user_ids += (
+            PendingNotification.objects.filter(user__email_notifications=preference)
+            .values('user')
+            .annotate(oldest=Min('created_at'))
+            .filter(oldest__lte=cutoff)
+            .values_list('user', flat=True)
+        )
+    return user_ids
+
+
+def render(user, items):
+    """(subject, body) of the email covering `items`, oldest first"""
+    if len(items) == 1:
+        return items[0].subject, items[0].body
+
+    by_thread = {}
+    for item in items:
+        by_thread.setdefault(item.thread_id, (item.thread, Counter()))[1][item.kind] += 1
+
+    lines = [f"Hello {user.username},", "", "Here is what happened on StudyDeck since your last update:", ""]
+    for thread, kinds in by_thread.values():
+        summary = ', '.join(
+            f"{count} {KIND_LABELS[kind][count != 1]}" for kind, count in kinds.items()
+        )
+        if thread is None:
+            lines.append(f"- {summary}")
+        else:
+            lines += [f"- {thread.title}: {summary}", f"  {THREAD_URL.format(thread.id)}"]
+    subject = f"StudyDeck: {len(items)} notifications in {len(by_thread)} thread(s)"
+    return subject, '\n'.join(lines)
+
+
+def flush_due_digests():
+    """Queue one outbox email per due user; returns how many were queued"""
+    PendingNotification.objects.filter(user__email_notifications='off').delete()
+    user_ids = due_user_ids()
+    queued = 0
+    for start in range(0, len(user_ids), FLUSH_BATCH_SIZE):
+        with transaction.atomic():
+            items = list(
+                PendingNotification.objects.select_for_update(skip_locked=True, of=('self',))
+                .filter(user_id__in=user_ids[start:start + FLUSH_BATCH_SIZE])
+                .select_related('user', 'thread')
+                .order_by('user_id', 'created_at', 'id')
+            )
+            by_user = {}
+            for item in items:
+                by_user.setdefault(item.user_id, []).append(item)
+
+            emails = []
+            for user_items in by_user.values():
+                user = user_items[0].user
+                if not user.email:
+                    continue
+                subject, body = render(user, user_items)
+                emails.append(OutboxEmail(to_email=user.email, subject=subject[:255], body=body))
+            OutboxEmail.objects.bulk_create(emails)
+            PendingNotification.objects.filter(pk__in=[item.pk for item in items]).delete()
+            queued += len(emails)
+    return queued
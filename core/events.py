@@ -0,0 +1,140 @@
+"""
+Publish/subscribe for the live event streams in core.streams.
+
+Views call `publish(channel, type, data)`; the event is handed to the
+configured EVENT_BROKER once the surrounding transaction commits. The
+default LocalBroker delivers within this process only, so run a single
+ASGI worker process or plug in a broker that fans out across processes
+(any EventBroker subclass, named by dotted path).
+"""
+import asyncio
+import logging
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+def thread_channel(thread_id):
+    return f'thread:{thread_id}'
+
+
+MODERATION_CHANNEL = 'moderation'
+
+
+class Subscription:
+    """
+    Bounded queue of events for one stream, owned by the event loop that
+    created it. When a slow client lets the queue fill up, further events
+    are dropped and `overflowed` tells the stream to ask for a resync.
+    """
+
+    def __init__(self, broker, channels, maxsize):
+        self.broker = broker
+        self.channels = tuple(channels)
+        self.overflowed = False
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize)
+
+    def deliver(self, event):
+        """Thread-safe; called by the broker from whichever thread published"""
+        try:
+            self._loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # The loop has gone away; the stream is dead
+            self.close()
+
+    def _put(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout):
+        """Next event, or None after `timeout` seconds without one"""
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def drain(self):
+        """Drop everything queued (after a resync the client refetches anyway)"""
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self.overflowed = False
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class EventBroker:
+    def publish(self, channel, event):
+        raise NotImplementedError
+
+    def subscribe(self, channels):
+        """Return a Subscription; must be called from the consuming event loop"""
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        raise NotImplementedError
+
+
+class LocalBroker(EventBroker):
+    """Fan out to subscribers in this process"""
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    @property
+    def queue_size(self):
+        return getattr(settings, 'SSE_QUEUE_SIZE', 100)
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.deliver(event)
+        return len(subscribers)
+
+    def subscribe(self, channels):
+        subscription = Subscription(self, channels, self.queue_size)
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[channel]
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        _broker = import_string(getattr(settings, 'EVENT_BROKER', 'core.events.LocalBroker'))()
+    return _broker
+
+
+def publish(channel, event_type, data):
+    """Broadcast `data` as an `event_type` event once the current transaction commits"""
+    event = {'type': event_type, 'data': data}
+
+    def send():
+        try:
+            get_broker().publish(channel, event)
+        except Exception:
+            logger.exception("Failed to publish %s event on %s", event_type, channel)
+
+    transaction.on_commit(send)
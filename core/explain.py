@@ -0,0 +1,285 @@
+"""
+Query-plan audit of the querysets behind the list views.
+
+Each AuditCase rebuilds the exact page query a view runs (through the same
+helpers the views use) for representative arguments picked from the data,
+and asks the database for its plan: EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)
+on PostgreSQL, EXPLAIN QUERY PLAN on SQLite. Plans are checked for
+sequential scans and sorts over at least `min_rows` rows and, on
+PostgreSQL, for row estimates off by 10x or more. A flagged case names
+the index that would serve it, or says it already exists.
+
+Meant to run against a database filled by `manage.py seed_forum`.
+"""
+import json
+
+from django.apps import apps
+from django.db import connection
+from django.db.models import Count, Q
+
+from .moderation import QUEUE_ORDERING, pending_groups
+from .models import Category, Like, Notification, Report, Resource, Tag, Thread
+from .pagination import PAGE_SIZE, encode_cursor, keyset_queryset
+from .serializers import REPLY_ORDERING, visible_replies
+from .views import (
+    LATEST_ORDERING, PINNED_ORDERING, RESOURCE_LIST_FIELDS, RESOURCE_ORDERING, filter_threads, with_list_relations
+)
+
+ESTIMATE_FACTOR = 10
+
+
+class Proposal:
+    """The index that serves an AuditCase: `fields` as in models.Index"""
+
+    def __init__(self, model, fields, name, condition=None):
+        self.model = model
+        self.fields = fields
+        self.name = name
+        self.condition = condition
+
+    @property
+    def columns(self):
+        return [self.model._meta.get_field(field.lstrip('-')).column for field in self.fields]
+
+    def exists(self):
+        """Whether some index on the table starts with these columns"""
+        columns = self.columns
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, self.model._meta.db_table)
+        return any(
+            (c['index'] or c['unique'] or c['primary_key']) and c['columns'][:len(columns)] == columns
+            for c in constraints.values()
+        )
+
+    def __str__(self):
+        condition = f", condition=Q({', '.join(f'{k}={v!r}' for k, v in self.condition.children)})" \
+            if self.condition else ''
+        return (
+            f"{self.model.__name__}.Meta.indexes: "
+            f"models.Index(fields={self.fields!r}, name={self.name!r}{condition})"
+        )
+
+
+class AuditCase:
+    def __init__(self, label, queryset, proposal=None):
+        self.label = label
+        self.queryset = queryset
+        self.proposal = proposal
+
+
+def page(queryset, ordering, cursor=None, page_size=PAGE_SIZE):
+    """The query paginate_keyset runs for one page"""
+    return keyset_queryset(queryset, ordering, cursor)[:page_size + 1]
+
+
+def deep_cursor(queryset, ordering, depth):
+    """Cursor for the page starting `depth` rows in, as a client paging that far would hold"""
+    row = queryset.order_by(*ordering).values(*(term.lstrip('-') for term in ordering))[depth:depth + 1].first()
+    if row is None:
+        return None
+    return encode_cursor([
+        value.isoformat() if hasattr(value, 'isoformat') else value for value in row.values()
+    ])
+
+
+def build_cases(page_size=PAGE_SIZE):
+    tags = Tag.objects.filter(thread_count__gt=0).order_by('-thread_count', 'pk')
+    busy_tag, tail_tag = tags.first(), tags.last()
+    category = Category.objects.order_by('-thread_count', 'pk').first()
+    thread = Thread.objects.order_by('-reply_count', 'pk').only('pk').first()
+    reporter = Report.objects.values('reporter').annotate(n=Count('id')).order_by('-n').first()
+    recipient = Notification.objects.values('recipient').annotate(n=Count('id')).order_by('-n').first()
+    liker = Like.objects.values('user').annotate(n=Count('id')).order_by('-n').first()
+    resource = Resource.objects.only('course_id').first()
+    if not (busy_tag and category and thread and resource):
+        raise ValueError("No data to audit; run `manage.py seed_forum` first")
+
+    latest = Proposal(Thread, ['-created_at', 'id'], 'core_thread_created')
+    pinned = Proposal(Thread, ['-is_pinned', '-created_at', 'id'], 'core_thread_pinned')
+
+    def threads(params, cursor=None):
+        queryset, ordering, _ = filter_threads(params)
+        return page(with_list_relations(queryset), ordering, cursor, page_size)
+
+    cases = [
+        AuditCase('thread-list latest', threads({}), latest),
+        AuditCase(
+            'thread-list latest, page 100',
+            threads({}, deep_cursor(Thread.objects.all(), LATEST_ORDERING, 100 * page_size)),
+            latest,
+        ),
+        AuditCase(
+            'thread-list popular', threads({'sort': 'popular'}),
+            Proposal(Thread, ['-like_count', '-created_at', 'id'], 'core_thread_popular'),
+        ),
+        AuditCase(
+            'thread-list category', threads({'category': category.slug}),
+            Proposal(Thread, ['category', '-created_at', 'id'], 'core_thread_category_created'),
+        ),
+        AuditCase(
+            'thread-list category popular', threads({'category': category.slug, 'sort': 'popular'}),
+            Proposal(Thread, ['category', '-like_count', '-created_at', 'id'], 'core_thread_category_popular'),
+        ),
+        AuditCase('thread-list busy tag', threads({'tag': busy_tag.slug}), latest),
+        AuditCase('thread-list long-tail tag', threads({'tag': tail_tag.slug}), latest),
+        AuditCase(
+            'category-detail', page(with_list_relations(category.threads.all()), PINNED_ORDERING, page_size=page_size),
+            Proposal(Thread, ['category', '-is_pinned', '-created_at', 'id'], 'core_thread_category_pinned'),
+        ),
+        AuditCase('tag-threads', page(with_list_relations(busy_tag.threads.all()), PINNED_ORDERING, page_size=page_size), pinned),
+        AuditCase(
+            'thread replies', page(visible_replies(thread), REPLY_ORDERING, page_size=page_size),
+            Proposal(
+                visible_replies(thread).model, ['thread', '-is_answer', '-created_at', 'id'], 'core_reply_thread_visible',
+                condition=Q(is_deleted=False),
+            ),
+        ),
+        AuditCase(
+            'pending reports',
+            page(Report.objects.filter(status='pending').select_related('reporter', 'thread', 'reply'), LATEST_ORDERING,
+                 page_size=page_size),
+            Proposal(Report, ['-created_at', 'id'], 'core_report_pending_created', condition=Q(status='pending')),
+        ),
+        # Sorted on aggregates, so no index can serve the ORDER BY; only the grouping scan matters
+        AuditCase('moderation queue', page(pending_groups(), QUEUE_ORDERING, page_size=page_size)),
+        AuditCase(
+            'resource list', page(
+                Resource.objects.select_related('course', 'uploaded_by').only(*RESOURCE_LIST_FIELDS),
+                RESOURCE_ORDERING, page_size=page_size,
+            ),
+            Proposal(Resource, ['-created_at', 'id'], 'core_resource_created'),
+        ),
+        AuditCase(
+            'resource list by course', page(
+                Resource.objects.filter(course_id=resource.course_id).only(*RESOURCE_LIST_FIELDS)
+                .select_related('course', 'uploaded_by'), RESOURCE_ORDERING, page_size=page_size,
+            ),
+            Proposal(Resource, ['course', '-created_at', 'id'], 'core_resource_course_created'),
+        ),
+    ]
+    if reporter:
+        cases.append(AuditCase(
+            'user reports', Report.objects.filter(reporter_id=reporter['reporter']).select_related('reporter', 'thread', 'reply'),
+            Proposal(Report, ['reporter'], 'core_report_reporter_id'),
+        ))
+    if recipient:
+        cases.append(AuditCase(
+            'notification inbox', page(
+                Notification.objects.filter(recipient_id=recipient['recipient']).select_related('actor', 'thread'),
+                LATEST_ORDERING, page_size=page_size,
+            ),
+            Proposal(Notification, ['recipient', '-created_at', 'id'], 'core_notification_inbox'),
+        ))
+    if liker:
+        thread_ids = list(Thread.objects.order_by(*LATEST_ORDERING).values_list('pk', flat=True)[:page_size])
+        cases.append(AuditCase(
+            'viewer likes', Like.objects.filter(
+                user_id=liker['user'], content_type='thread', thread_id__in=thread_ids
+            ).values_list('content_type', 'thread_id', 'reply_id'),
+            Proposal(Like, ['user', 'content_type', 'thread'], 'core_like_user_thread'),
+        ))
+    return cases
+
+
+def table_sizes():
+    sizes = {}
+    for model in apps.get_app_config('core').get_models(include_auto_created=True):
+        sizes[model._meta.db_table] = model._default_manager.count()
+    return sizes
+
+
+class Auditor:
+    def __init__(self, min_rows=1000, analyze=True):
+        self.min_rows = min_rows
+        self.analyze = analyze and connection.vendor == 'postgresql'
+        self.sizes = table_sizes() if connection.vendor != 'postgresql' else {}
+
+    def explain(self, queryset):
+        if connection.vendor == 'postgresql':
+            options = {'analyze': True, 'buffers': True} if self.analyze else {}
+            plan = json.loads(queryset.explain(format='json', **options))[0]
+            return plan, self.postgres_findings(plan['Plan'])
+        plan = queryset.explain()
+        return plan, self.sqlite_findings(plan)
+
+    def postgres_findings(self, node, limited=False):
+        findings = []
+        loops = node.get('Actual Loops', 1)
+        actual = node.get('Actual Rows')
+        planned = node.get('Plan Rows', 0)
+        node_type = node['Node Type']
+
+        if node_type == 'Seq Scan':
+            examined = (actual + node.get('Rows Removed by Filter', 0)) * loops if actual is not None else planned
+            if examined >= self.min_rows:
+                findings.append(('seq scan', f"Seq Scan on {node['Relation Name']} ({examined} rows examined)"))
+        if node_type == 'Sort':
+            child = node['Plans'][0]
+            rows = child.get('Actual Rows', child['Plan Rows']) * child.get('Actual Loops', 1)
+            if rows >= self.min_rows:
+                method = node.get('Sort Method', 'sort')
+                findings.append(('sort', f"Sort on {', '.join(node['Sort Key'])} over {rows} rows ({method})"))
+
+        limited_below = limited or node_type == 'Limit'
+        below = []
+        for child in node.get('Plans', ()):
+            below += self.postgres_findings(child, limited_below)
+
+        # A misestimate carries up to every parent; report only the node where it starts
+        if actual is not None and max(actual, planned) >= 100 and not any(kind == 'estimate' for kind, _ in below):
+            # Under a LIMIT a node may stop early, so only underestimates count there
+            over = not limited and planned >= ESTIMATE_FACTOR * max(actual, 1)
+            under = actual >= ESTIMATE_FACTOR * max(planned, 1)
+            if over or under:
+                findings.append((
+                    'estimate', f"{node_type}{' on ' + node['Relation Name'] if 'Relation Name' in node else ''}: "
+                    f"planned {planned} rows, got {actual}",
+                ))
+        return findings + below
+
+    def sqlite_findings(self, plan):
+        """
+        EXPLAIN QUERY PLAN has no row counts, so scans are judged by table
+        size and sorts by the size of the largest table the plan reads
+        other than by primary key.
+        """
+        findings, sorts, largest = [], [], 0
+        for line in plan.splitlines():
+            detail = line.split(maxsplit=3)[-1] if line[:1].isdigit() else line.strip()
+            words = detail.split()
+            if words[:1] in (['SCAN'], ['SEARCH']) and len(words) > 1:
+                rows = self.sizes.get(words[1], 0)
+                # Joined rows looked up one by one by primary key add nothing to sort
+                if 'PRIMARY' not in words:
+                    largest = max(largest, rows)
+                if words[0] == 'SCAN' and 'USING' not in words and rows >= self.min_rows:
+                    findings.append(('seq scan', f"Full scan of {words[1]} ({rows} rows)"))
+            elif detail.startswith('USE TEMP B-TREE FOR') and 'ORDER BY' in detail:
+                sorts.append(detail)
+        if largest >= self.min_rows:
+            findings += [('sort', f"Sort without an index ({detail}, reading up to {largest} rows)") for detail in sorts]
+        return findings
+
+    def audit(self, case):
+        plan, findings = self.explain(case.queryset)
+        result = {'case': case.label, 'findings': [{'kind': kind, 'detail': detail} for kind, detail in findings]}
+        if findings and case.proposal:
+            result['index'] = str(case.proposal)
+            result['index_exists'] = case.proposal.exists()
+        result['plan'] = plan
+        return result
+
+
+def format_result(result, verbose=False):
+    lines = [f"{'!!' if result['findings'] else 'ok'}  {result['case']}"]
+    for finding in result['findings']:
+        lines.append(f"      {finding['kind']}: {finding['detail']}")
+    if 'index' in result:
+        if result['index_exists']:
+            lines.append(f"      index already exists ({result['index']}); check statistics and selectivity")
+        else:
+            lines.append(f"      add to {result['index']}")
+    if verbose:
+        plan = result['plan'] if isinstance(result['plan'], str) else json.dumps(result['plan'], indent=2)
+        lines += ['      ' + line for line in plan.splitlines()]
+    return '\n'.join(lines)
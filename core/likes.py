@@ -0,0 +1,129 @@
+"""
+Like toggling with contention-safe counters.
+
+A toggle is one transaction: a DELETE of the user's Like (a hit means
+"unlike"), otherwise an INSERT guarded by the unique constraint, then a
+single relative UPDATE of the counter that returns the new value. No
+counter is ever read into Python and written back, so concurrent likes
+cannot overwrite each other.
+
+With LIKE_SHARD_PINNED_THREADS enabled, pinned threads record their delta
+in one of LIKE_COUNTER_SHARDS ThreadLikeShard rows picked at random instead
+of updating the thread row, and `manage.py fold_like_shards` moves the
+pending deltas into Thread.like_count. A sharded toggle touches only the
+Like row and one shard row; the category and tag totals, which every like
+in the category would otherwise queue on, take the summed delta at the fold.
+"""
+import random
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Greatest
+
+from . import counters
+from .models import Like, Thread, Reply, ThreadLikeShard
+from .thread_cache import thread_changed
+
+
+def _toggle(user, content_type, **target):
+    """Flip the user's Like; returns (liked, delta)"""
+    deleted, _ = Like.objects.filter(user=user, content_type=content_type, **target).delete()
+    if deleted:
+        return False, -1
+    try:
+        with transaction.atomic():
+            Like.objects.create(user=user, content_type=content_type, **target)
+    except IntegrityError:
+        # A concurrent request from the same user already inserted it
+        return True, 0
+    return True, 1
+
+
+def _can_update_returning():
+    # PostgreSQL, and SQLite from 3.35 (the release that added RETURNING to
+    # both INSERT and UPDATE); MySQL and MariaDB have no UPDATE ... RETURNING
+    if connection.vendor == 'postgresql':
+        return True
+    return connection.vendor == 'sqlite' and connection.features.can_return_columns_from_insert
+
+
+def _bump(model, pk, delta):
+    """Add `delta` to model.like_count (floored at 0) and return the new value"""
+    if delta and _can_update_returning():
+        # One round trip instead of an UPDATE and a SELECT
+        quote = connection.ops.quote_name
+        table, pk_column = quote(model._meta.db_table), quote(model._meta.pk.column)
+        count = quote(model._meta.get_field('like_count').column)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {table} SET {count} = CASE WHEN {count} + %s < 0 THEN 0 "
+                f"ELSE {count} + %s END WHERE {pk_column} = %s RETURNING {count}",
+                [delta, delta, pk],
+            )
+            row = cursor.fetchone()
+        return row[0] if row else 0
+    if delta:
+        model.objects.filter(pk=pk).update(like_count=Greatest(F('like_count') + delta, 0))
+    return model.objects.filter(pk=pk).values_list('like_count', flat=True).first() or 0
+
+
+def is_hot(thread):
+    return thread.is_pinned and getattr(settings, 'LIKE_SHARD_PINNED_THREADS', False)
+
+
+def _bump_shard(thread, delta):
+    """Record `delta` on a random shard; returns the estimated like count"""
+    if delta:
+        shard = random.randrange(getattr(settings, 'LIKE_COUNTER_SHARDS', 8))
+        shards = ThreadLikeShard.objects.filter(thread=thread, shard=shard)
+        if not shards.update(count=F('count') + delta):
+            try:
+                with transaction.atomic():
+                    ThreadLikeShard.objects.create(thread=thread, shard=shard, count=delta)
+            except IntegrityError:
+                shards.update(count=F('count') + delta)
+    pending = thread.like_shards.aggregate(total=Sum('count'))['total'] or 0
+    return max(0, thread.like_count + pending)
+
+
+def toggle_thread_like(user, thread):
+    """Returns (liked, like_count); the count is an estimate for sharded threads"""
+    with transaction.atomic():
+        liked, delta = _toggle(user, 'thread', thread=thread)
+        if is_hot(thread):
+            like_count = _bump_shard(thread, delta)
+        else:
+            like_count = _bump(Thread, thread.pk, delta)
+            counters.thread_activity(thread, likes=delta)
+        thread_changed(thread.pk)
+    return liked, like_count
+
+
+def toggle_reply_like(user, reply):
+    with transaction.atomic():
+        liked, delta = _toggle(user, 'reply', reply=reply)
+        like_count = _bump(Reply, reply.pk, delta)
+        thread_changed(reply.thread_id)
+    return liked, like_count
+
+
+def fold_like_shards():
+    """
+    Move pending shard deltas into Thread.like_count and the category and
+    tag totals; returns threads folded.
+    """
+    folded = 0
+    thread_ids = ThreadLikeShard.objects.exclude(count=0).values_list('thread_id', flat=True).distinct()
+    for thread_id in list(thread_ids):
+        with transaction.atomic():
+            shards = list(ThreadLikeShard.objects.select_for_update().filter(thread_id=thread_id).exclude(count=0))
+            delta = sum(s.count for s in shards)
+            ThreadLikeShard.objects.filter(pk__in=[s.pk for s in shards]).update(count=0)
+            if delta:
+                _bump(Thread, thread_id, delta)
+                thread = Thread.objects.only('category_id').get(pk=thread_id)
+                counters.thread_activity(thread, likes=delta)
+                thread_changed(thread_id)
+                folded += 1
+    return folded
@@ -0,0 +1,86 @@
+import json
+import subprocess
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from django.utils import timezone
+
+from core.benchmark import build_scenarios, run_benchmark
+from core.models import CustomUser
+from core.serializers import ForumTokenObtainPairSerializer
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = "Load-test every GET API route in process and report latency percentiles and throughput as JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="Timed requests per scenario")
+        parser.add_argument('--concurrency', type=int, default=8, help="Concurrent request threads")
+        parser.add_argument('--warmup', type=int, default=10, help="Untimed requests per scenario first")
+        parser.add_argument('--only', action='append', default=[], help="Run scenarios whose name contains this")
+        parser.add_argument('--user', help="Authenticate as the user with this email (JWT)")
+        parser.add_argument('--throttle', action='store_true', help="Keep request throttling on")
+        parser.add_argument('--output', help="Write the JSON report here instead of stdout")
+        parser.add_argument('--compare', help="Earlier JSON report to diff p50/p95 against")
+
+    def handle(self, *args, **options):
+        headers = {}
+        if options['user']:
+            user = CustomUser.objects.filter(email=options['user']).first()
+            if user is None:
+                raise CommandError(f"No user with email {options['user']}")
+            access = ForumTokenObtainPairSerializer.get_token(user).access_token
+            headers['HTTP_AUTHORIZATION'] = f'Bearer {access}'
+
+        try:
+            scenarios = build_scenarios()
+        except ValueError as e:
+            raise CommandError(str(e))
+        if options['only']:
+            scenarios = [s for s in scenarios if any(name in s.label for name in options['only'])]
+
+        baseline = {}
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = {result['scenario']: result for result in json.load(f)['scenarios']}
+
+        def log(result):
+            line = (
+                f"{result['scenario']:<32} p50 {result['p50_ms']:>8.2f}ms  p95 {result['p95_ms']:>8.2f}ms  "
+                f"p99 {result['p99_ms']:>8.2f}ms  {result['throughput_rps']:>8.1f} req/s  {result['statuses']}"
+            )
+            before = baseline.get(result['scenario'])
+            if before:
+                line += "  p50 {:+.0%} p95 {:+.0%}".format(
+                    result['p50_ms'] / before['p50_ms'] - 1, result['p95_ms'] / before['p95_ms'] - 1
+                )
+            self.stderr.write(line)
+
+        # Production-like: no query log, and throttling would only measure 429s
+        overrides = {'DEBUG': False}
+        if not options['throttle']:
+            overrides['THROTTLE_STORE'] = 'core.throttling.NullStore'
+        with override_settings(**overrides):
+            report = run_benchmark(
+                scenarios, concurrency=options['concurrency'], requests=options['requests'],
+                warmup=options['warmup'], headers=headers, log=log,
+            )
+        report.update(commit=current_commit(), user=options['user'], finished_at=timezone.now().isoformat())
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+            self.stderr.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+        else:
+            self.stdout.write(output)
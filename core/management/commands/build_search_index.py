@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.search import BM25SearchBackend
+
+
+class Command(BaseCommand):
+    help = "Build the in-process BM25 search index and write it to SEARCH_INDEX_PATH"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=None, help="Snapshot file (defaults to SEARCH_INDEX_PATH)")
+
+    def handle(self, *args, **options):
+        path = options['path'] or getattr(settings, 'SEARCH_INDEX_PATH', None)
+        if not path:
+            raise CommandError("Set SEARCH_INDEX_PATH or pass --path")
+        index = BM25SearchBackend().build()
+        index.save(path)
+        self.stdout.write(self.style.SUCCESS(f"Indexed {len(index)} threads into {path}"))
@@ -0,0 +1,47 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core.explain import Auditor, build_cases, format_result
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN the list views' page queries and flag scans, sorts and misestimates that need an index"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-rows', type=int, default=1000, help="Ignore scans and sorts over fewer rows")
+        parser.add_argument('--no-analyze', action='store_true', help="Plan only; don't execute the queries (PostgreSQL)")
+        parser.add_argument('--refresh-stats', action='store_true', help="Run ANALYZE first so estimates are current")
+        parser.add_argument('--only', action='append', default=[], help="Audit cases whose name contains this")
+        parser.add_argument('--verbose', action='store_true', help="Print every plan in full")
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+        parser.add_argument('--fail-on-findings', action='store_true', help="Exit non-zero if anything is flagged")
+
+    def handle(self, *args, **options):
+        if options['refresh_stats']:
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+        try:
+            cases = build_cases()
+        except ValueError as e:
+            raise CommandError(str(e))
+        if options['only']:
+            cases = [c for c in cases if any(name in c.label for name in options['only'])]
+
+        auditor = Auditor(min_rows=options['min_rows'], analyze=not options['no_analyze'])
+        results = []
+        for case in cases:
+            result = auditor.audit(case)
+            results.append(result)
+            if not options['json']:
+                self.stdout.write(format_result(result, verbose=options['verbose']))
+
+        flagged = [result['case'] for result in results if result['findings']]
+        if options['json']:
+            self.stdout.write(json.dumps({'database': connection.vendor, 'cases': results}, indent=2))
+        else:
+            self.stderr.write(f"{len(flagged)} of {len(results)} queries flagged")
+        if flagged and options['fail_on_findings']:
+            raise CommandError(f"Flagged: {', '.join(flagged)}")
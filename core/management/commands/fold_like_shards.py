@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core.likes import fold_like_shards
+
+
+class Command(BaseCommand):
+    help = "Fold pending sharded like counts into Thread.like_count and the category and tag totals"
+
+    def handle(self, *args, **options):
+        folded = fold_like_shards()
+        self.stdout.write(self.style.SUCCESS(f"Folded like shards for {folded} thread(s)"))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.counters import reconcile
+
+
+class Command(BaseCommand):
+    help = "Recompute denormalized counters on Thread, Category, Tag, Resource and CustomUser"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            fixed = reconcile()
+        for model, rows in fixed.items():
+            self.stdout.write(f"{model}: {rows} row(s) repaired")
+        self.stdout.write(self.style.SUCCESS("Counters reconciled"))
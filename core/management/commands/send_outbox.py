@@ -0,0 +1,86 @@
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from core.digests import flush_due_digests
+from core.models import OutboxEmail
+from core.outbox import DeliveryStats, claim_batch, deliver
+
+logger = logging.getLogger(__name__)
+
+
+def deliver_batch(batch):
+    try:
+        return deliver(batch)
+    except Exception:
+        # The batch stays leased and is retried once the lease expires
+        logger.exception("Outbox batch of %d failed", len(batch))
+        return 0, 0, 0
+    finally:
+        # Each pool thread has its own DB connection; don't leak them
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = "Deliver queued outbox email in batches over reused mail connections"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help="Batches sent concurrently")
+        parser.add_argument(
+            '--batch-size', type=int, default=getattr(settings, 'EMAIL_OUTBOX_BATCH_SIZE', 50),
+            help="Messages sent per mail connection",
+        )
+        parser.add_argument('--poll-interval', type=float, default=5.0, help="Seconds to sleep when the outbox is empty")
+        parser.add_argument(
+            '--digest-interval', type=float, default=30.0,
+            help="Seconds between checks for due notification digests",
+        )
+        parser.add_argument('--report-interval', type=float, default=60.0, help="Seconds between throughput reports")
+        parser.add_argument('--once', action='store_true', help="Exit once no message is due")
+
+    def handle(self, *args, **options):
+        workers, batch_size = max(1, options['workers']), max(1, options['batch_size'])
+        stats = DeliveryStats()
+        last_report = time.monotonic()
+        last_digest = None
+        in_flight = set()
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='outbox') as pool:
+            try:
+                while True:
+                    if last_digest is None or time.monotonic() - last_digest >= options['digest_interval']:
+                        last_digest = time.monotonic()
+                        stats.digests += flush_due_digests()
+
+                    while len(in_flight) < workers:
+                        batch = claim_batch(batch_size)
+                        if not batch:
+                            break
+                        in_flight.add(pool.submit(deliver_batch, batch))
+
+                    if in_flight:
+                        done, in_flight = wait(in_flight, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                        for future in done:
+                            stats.add(*future.result())
+                    elif options['once']:
+                        break
+                    else:
+                        time.sleep(options['poll_interval'])
+
+                    if time.monotonic() - last_report >= options['report_interval']:
+                        last_report = time.monotonic()
+                        self.report(stats)
+            except KeyboardInterrupt:
+                self.stdout.write("Interrupted; waiting for batches in flight")
+                for future in in_flight:
+                    stats.add(*future.result())
+
+        self.stdout.write(self.style.SUCCESS(f"Outbox drained: {stats.summary()}"))
+
+    def report(self, stats):
+        backlog = OutboxEmail.objects.filter(status='pending').count()
+        self.stdout.write(f"{stats.summary()}; {backlog} pending")
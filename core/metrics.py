@@ -0,0 +1,250 @@
+"""
+Per-view request metrics.
+
+MetricsMiddleware times every request and records, under the URL name of
+the view that served it, the total time, the time spent in the database
+and in serializers, the number of queries and the response size. Each
+response gets a Server-Timing header with the same breakdown, and the
+histograms are aggregated in process for the staff-only /metrics endpoint
+(Prometheus text format). Every worker process keeps its own histograms,
+so scrape each worker or sum across scrapes.
+
+Set REQUEST_METRICS=0 to drop the middleware entirely.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from rest_framework import serializers
+from rest_framework.serializers import LIST_SERIALIZER_KWARGS, LIST_SERIALIZER_KWARGS_REMOVE
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+BYTES_BUCKETS = (1_000, 10_000, 50_000, 100_000, 500_000, 1_000_000, 5_000_000)
+
+# name: (help text, buckets)
+HISTOGRAMS = {
+    'request_duration_seconds': ('Time spent handling the request', SECONDS_BUCKETS),
+    'db_duration_seconds': ('Time spent executing SQL', SECONDS_BUCKETS),
+    'serializer_duration_seconds': ('Time spent producing serializer data, including queries it ran', SECONDS_BUCKETS),
+    'db_queries': ('SQL queries per request', QUERY_BUCKETS),
+    'response_size_bytes': ('Response body size', BYTES_BUCKETS),
+}
+
+PREFIX = 'studydeck_'
+
+_sample = ContextVar('request_metrics_sample', default=None)
+
+
+class Sample:
+    """What one request spent, filled in while it runs"""
+    __slots__ = ('queries', 'db', 'serializer', 'serializer_depth')
+
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.serializer = 0.0
+        self.serializer_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        """Time one query; called by record_query"""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - start
+            self.queries += 1
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self._histograms = {}
+        self._requests = {}
+        self._lock = threading.Lock()
+
+    def record(self, view, status_code, values):
+        with self._lock:
+            key = (view, status_code)
+            self._requests[key] = self._requests.get(key, 0) + 1
+            for name, value in values.items():
+                histogram = self._histograms.get((name, view))
+                if histogram is None:
+                    histogram = self._histograms[name, view] = Histogram(HISTOGRAMS[name][1])
+                histogram.observe(value)
+
+    def render(self):
+        """Everything recorded so far in Prometheus text exposition format"""
+        with self._lock:
+            requests = sorted(self._requests.items())
+            histograms = {
+                key: (list(h.counts), h.sum, h.count) for key, h in sorted(self._histograms.items())
+            }
+
+        lines = [
+            f'# HELP {PREFIX}requests_total Requests handled, by view and status code',
+            f'# TYPE {PREFIX}requests_total counter',
+        ]
+        for (view, status_code), count in requests:
+            lines.append(f'{PREFIX}requests_total{{view="{view}",status="{status_code}"}} {count}')
+
+        for name, (help_text, buckets) in HISTOGRAMS.items():
+            lines += [f'# HELP {PREFIX}{name} {help_text}', f'# TYPE {PREFIX}{name} histogram']
+            for (metric, view), (counts, total, count) in histograms.items():
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip((*buckets, '+Inf'), counts):
+                    cumulative += bucket_count
+                    lines.append(f'{PREFIX}{name}_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+                lines += [
+                    f'{PREFIX}{name}_sum{{view="{view}"}} {total}',
+                    f'{PREFIX}{name}_count{{view="{view}"}} {count}',
+                ]
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return (match.view_name or match.route or 'unnamed').replace('"', '')
+
+
+def record_query(execute, sql, params, many, context):
+    """Connection execute_wrapper charging queries to the current request's Sample"""
+    sample = _sample.get()
+    if sample is None:
+        return execute(sql, params, many, context)
+    return sample(execute, sql, params, many, context)
+
+
+def instrument_connection(sender=None, connection=None, **kwargs):
+    # Installed on every connection rather than per request: connections are
+    # per thread, and async requests run their queries in sync_to_async threads
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def measure():
+    """Collect the queries and serializer time of the code run inside into a new Sample"""
+    sample = Sample()
+    token = _sample.set(sample)
+    try:
+        yield sample
+    finally:
+        _sample.reset(token)
+
+
+def server_timing(sample, total):
+    return (
+        f'db;dur={sample.db * 1000:.1f};desc="{sample.queries} queries", '
+        f'ser;dur={sample.serializer * 1000:.1f}, total;dur={total * 1000:.1f}'
+    )
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_METRICS', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        connection_created.connect(instrument_connection)
+        for connection in connections.all(initialized_only=True):
+            instrument_connection(connection=connection)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        start = time.perf_counter()
+        with measure() as sample:
+            response = self.get_response(request)
+        return self.finish(request, response, sample, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        with measure() as sample:
+            response = await self.get_response(request)
+        return self.finish(request, response, sample, time.perf_counter() - start)
+
+    def finish(self, request, response, sample, total):
+        values = {
+            'request_duration_seconds': total,
+            'db_duration_seconds': sample.db,
+            'serializer_duration_seconds': sample.serializer,
+            'db_queries': sample.queries,
+        }
+        if not response.streaming:
+            values['response_size_bytes'] = len(response.content)
+        registry.record(view_name(request), response.status_code, values)
+        response['Server-Timing'] = server_timing(sample, total)
+        return response
+
+
+class TimedSerializerMixin:
+    """
+    Counts the time spent producing .data towards the request's serializer
+    time. Mixed into core.serializers' classes; many=True builds a
+    TimedListSerializer so whole pages are timed too.
+    """
+
+    @property
+    def data(self):
+        sample = _sample.get()
+        if sample is None:
+            return super().data
+        # Serializers nested through .data (e.g. reply pages) count once, in the outermost
+        sample.serializer_depth += 1
+        start = time.perf_counter()
+        try:
+            return super().data
+        finally:
+            sample.serializer_depth -= 1
+            if not sample.serializer_depth:
+                sample.serializer += time.perf_counter() - start
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        # BaseSerializer.many_init, with the list class fixed
+        list_kwargs = {}
+        for key in LIST_SERIALIZER_KWARGS_REMOVE:
+            value = kwargs.pop(key, None)
+            if value is not None:
+                list_kwargs[key] = value
+        list_kwargs['child'] = cls(*args, **kwargs)
+        list_kwargs.update({key: value for key, value in kwargs.items() if key in LIST_SERIALIZER_KWARGS})
+        return TimedListSerializer(*args, **list_kwargs)
+
+
+class TimedListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    pass
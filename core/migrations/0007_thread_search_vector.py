@@ -0,0 +1,56 @@
+# Generated by Django 5.2 on 2026-10-18 04:32
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+BACKFILL_BATCH_SIZE = 2000
+
+
+def backfill_search_vector(apps, schema_editor):
+    """Populate search_vector for existing threads in primary-key batches"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Thread = apps.get_model('core', 'Thread')
+    vector = (
+        SearchVector('title', weight='A', config='english')
+        + SearchVector('content', weight='B', config='english')
+    )
+    last_id = 0
+    while True:
+        ids = list(
+            Thread.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:BACKFILL_BATCH_SIZE]
+        )
+        if not ids:
+            break
+        Thread.objects.filter(pk__in=ids).update(search_vector=vector)
+        last_id = ids[-1]
+
+
+class Migration(migrations.Migration):
+    # Let each backfill batch commit on its own instead of holding one long transaction
+    atomic = False
+
+    dependencies = [
+        ('core', '0006_alter_reply_like_count_alter_report_content_type'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='thread',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_search_vector, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='thread',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='core_thread_search_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='thread',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['title'], name='core_thread_title_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2 on 2026-10-18 04:37
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Category = apps.get_model('core', 'Category')
+    Tag = apps.get_model('core', 'Tag')
+    Thread = apps.get_model('core', 'Thread')
+
+    def total(queryset, group_by, aggregate):
+        return Coalesce(Subquery(queryset.values(group_by).annotate(total=aggregate).values('total')[:1]), 0)
+
+    by_category = Thread.objects.filter(category=OuterRef('pk'))
+    Category.objects.update(
+        thread_count=total(by_category, 'category', Count('pk')),
+        reply_count=total(by_category, 'category', Sum('reply_count')),
+        like_count=total(by_category, 'category', Sum('like_count')),
+    )
+    by_tag = Thread.tags.through.objects.filter(tag=OuterRef('pk'))
+    Tag.objects.update(
+        thread_count=total(by_tag, 'tag', Count('pk')),
+        reply_count=total(by_tag, 'tag', Sum('thread__reply_count')),
+        like_count=total(by_tag, 'tag', Sum('thread__like_count')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_thread_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='like_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='reply_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='thread_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='like_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='reply_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='thread_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
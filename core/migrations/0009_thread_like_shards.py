@@ -0,0 +1,27 @@
+# Generated by Django 5.2 on 2026-10-18 04:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_category_tag_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThreadLikeShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('count', models.IntegerField(default=0)),
+                ('thread', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='like_shards', to='core.thread')),
+            ],
+            options={
+                'db_table': 'core_threadlikeshard',
+                'unique_together': {('thread', 'shard')},
+            },
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2 on 2026-10-18 04:40
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Resource = apps.get_model('core', 'Resource')
+    ResourceRating = apps.get_model('core', 'ResourceRating')
+
+    def total(aggregate, **filters):
+        ratings = ResourceRating.objects.filter(resource=OuterRef('pk'), **filters).values('resource')
+        return Coalesce(Subquery(ratings.annotate(total=aggregate).values('total')[:1]), 0)
+
+    Resource.objects.update(
+        rating_sum=total(Sum('rating')),
+        rating_count=total(Count('pk')),
+        **{f'rating_{stars}_count': total(Count('pk'), rating=stars) for stars in range(1, 6)},
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_thread_like_shards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resource',
+            name='rating_1_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='resource',
+            name='rating_2_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='resource',
+            name='rating_3_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='resource',
+            name='rating_4_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='resource',
+            name='rating_5_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='resource',
+            name='rating_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='resource',
+            name='rating_sum',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-18 04:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_resource_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['department', 'code'], name='core_course_dept_code'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['semester', 'code'], name='core_course_semester_code'),
+        ),
+        migrations.AddIndex(
+            model_name='resource',
+            index=models.Index(fields=['-created_at', 'id'], name='core_resource_created'),
+        ),
+        migrations.AddIndex(
+            model_name='resource',
+            index=models.Index(fields=['course', '-created_at', 'id'], name='core_resource_course_created'),
+        ),
+        migrations.AddIndex(
+            model_name='resource',
+            index=models.Index(fields=['resource_type', '-created_at', 'id'], name='core_resource_type_created'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2 on 2026-10-18 04:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_outbox_email'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='email_notifications',
+            field=models.CharField(choices=[('instant', 'Instant'), ('hourly', 'Hourly digest'), ('daily', 'Daily digest'), ('off', 'Off')], default='instant', max_length=10),
+        ),
+        migrations.CreateModel(
+            name='PendingNotification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('reply', 'Reply'), ('mention', 'Mention'), ('status', 'Status change')], max_length=20)),
+                ('subject', models.CharField(max_length=255)),
+                ('body', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('thread', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.thread')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_notifications', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'core_pendingnotification',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['user', 'created_at'], name='core_pendingnotif_user')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-18 04:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_notification_inbox'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['content_type', 'thread', 'reply', '-created_at'], name='core_report_pending_target'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2 on 2026-10-18 05:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_user_auth_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reply',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['thread', '-is_answer', '-created_at', 'id'], name='core_reply_thread_visible'),
+        ),
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['-created_at', 'id'], name='core_report_pending_created'),
+        ),
+        migrations.AddIndex(
+            model_name='thread',
+            index=models.Index(fields=['-created_at', 'id'], name='core_thread_created'),
+        ),
+        migrations.AddIndex(
+            model_name='thread',
+            index=models.Index(fields=['-like_count', '-created_at', 'id'], name='core_thread_popular'),
+        ),
+        migrations.AddIndex(
+            model_name='thread',
+            index=models.Index(fields=['-is_pinned', '-created_at', 'id'], name='core_thread_pinned'),
+        ),
+        migrations.AddIndex(
+            model_name='thread',
+            index=models.Index(fields=['category', '-created_at', 'id'], name='core_thread_category_created'),
+        ),
+        migrations.AddIndex(
+            model_name='thread',
+            index=models.Index(fields=['category', '-like_count', '-created_at', 'id'], name='core_thread_category_popular'),
+        ),
+        migrations.AddIndex(
+            model_name='thread',
+            index=models.Index(fields=['category', '-is_pinned', '-created_at', 'id'], name='core_thread_category_pinned'),
+        ),
+        # Only once the category-first composites exist to take over its lookups
+        migrations.AlterField(
+            model_name='thread',
+            name='category',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='threads', to='core.category'),
+        ),
+    ]
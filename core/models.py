@@ -1,5 +1,7 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 
@@ -17,6 +19,18 @@ class CustomUser(AbstractUser):
         ('admin', 'Admin'),
     ]
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='student')
+
+    EMAIL_NOTIFICATION_CHOICES = [
+        ('instant', 'Instant'),
+        ('hourly', 'Hourly digest'),
+        ('daily', 'Daily digest'),
+        ('off', 'Off'),
+    ]
+    email_notifications = models.CharField(max_length=10, choices=EMAIL_NOTIFICATION_CHOICES, default='instant')
+    # Maintained by core.notifications so the inbox badge never counts rows
+    unread_notification_count = models.IntegerField(default=0)
+    # Bumped by core.signals when role, is_active or the password changes; see core.authentication
+    auth_version = models.PositiveIntegerField(default=0)
     email = models.EmailField(unique=True)
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
@@ -50,6 +64,10 @@ class Course(models.Model):
     class Meta:
         db_table = 'core_course'
         ordering = ['code']
+        indexes = [
+            models.Index(fields=['department', 'code'], name='core_course_dept_code'),
+            models.Index(fields=['semester', 'code'], name='core_course_semester_code'),
+        ]
 
     def __str__(self):
         return f"{self.code} - {self.title}"
@@ -76,16 +94,40 @@ class Resource(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Rating aggregates, maintained by core.ratings
+    rating_sum = models.IntegerField(default=0)
+    rating_count = models.IntegerField(default=0)
+    rating_1_count = models.IntegerField(default=0)
+    rating_2_count = models.IntegerField(default=0)
+    rating_3_count = models.IntegerField(default=0)
+    rating_4_count = models.IntegerField(default=0)
+    rating_5_count = models.IntegerField(default=0)
+
     class Meta:
         db_table = 'core_resource'
         ordering = ['-created_at']
+        indexes = [
+            # Match the keyset ordering of resource_list, overall and per filter
+            models.Index(fields=['-created_at', 'id'], name='core_resource_created'),
+            models.Index(fields=['course', '-created_at', 'id'], name='core_resource_course_created'),
+            models.Index(fields=['resource_type', '-created_at', 'id'], name='core_resource_type_created'),
+        ]
 
     def __str__(self):
         return f"{self.title} - {self.course.code}"
 
+    @property
+    def avg_rating(self):
+        return self.rating_sum / self.rating_count if self.rating_count else 0
+
+    @property
+    def rating_histogram(self):
+        return {stars: getattr(self, f'rating_{stars}_count') for stars in range(1, 6)}
+
     def increment_view_count(self):
-        self.view_count += 1
-        self.save(update_fields=['view_count'])
+        """Buffered in core.viewcounts; view_count becomes this process's estimate"""
+        from .viewcounts import view_buffer
+        self.view_count += view_buffer.record(self.pk)
 
 
 class ResourceRating(models.Model):
@@ -113,6 +155,11 @@ class Category(models.Model):
     description = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Denormalized totals, maintained by core.counters
+    thread_count = models.IntegerField(default=0)
+    reply_count = models.IntegerField(default=0)
+    like_count = models.IntegerField(default=0)
+
     class Meta:
         db_table = 'core_category'
         verbose_name_plural = 'Categories'
@@ -128,6 +175,11 @@ class Tag(models.Model):
     slug = models.SlugField(max_length=50, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Denormalized totals, maintained by core.counters
+    thread_count = models.IntegerField(default=0)
+    reply_count = models.IntegerField(default=0)
+    like_count = models.IntegerField(default=0)
+
     class Meta:
         db_table = 'core_tag'
         ordering = ['name']
@@ -138,7 +190,8 @@ class Tag(models.Model):
 
 class Thread(models.Model):
     """Forum thread (main discussion)"""
-    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='threads')
+    # Indexed by the category-first composites in Meta.indexes
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='threads', db_index=False)
     course = models.ForeignKey(Course, on_delete=models.SET_NULL, null=True, blank=True, related_name='forum_threads')
     author = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='threads_created')
     title = models.CharField(max_length=200)
@@ -157,9 +210,24 @@ class Thread(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Full-text search (title weighted A, content B), kept fresh by core.signals
+    search_vector = SearchVectorField(null=True, editable=False)
+
     class Meta:
         db_table = 'core_thread'
         ordering = ['-is_pinned', '-created_at']
+        indexes = [
+            GinIndex(fields=['search_vector'], name='core_thread_search_gin'),
+            GinIndex(fields=['title'], name='core_thread_title_trgm', opclasses=['gin_trgm_ops']),
+            # One per list ordering (core.views), site-wide and per category; `id` makes
+            # each a unique keyset so cursor pages are a single range scan
+            models.Index(fields=['-created_at', 'id'], name='core_thread_created'),
+            models.Index(fields=['-like_count', '-created_at', 'id'], name='core_thread_popular'),
+            models.Index(fields=['-is_pinned', '-created_at', 'id'], name='core_thread_pinned'),
+            models.Index(fields=['category', '-created_at', 'id'], name='core_thread_category_created'),
+            models.Index(fields=['category', '-like_count', '-created_at', 'id'], name='core_thread_category_popular'),
+            models.Index(fields=['category', '-is_pinned', '-created_at', 'id'], name='core_thread_category_pinned'),
+        ]
 
     def __str__(self):
         return f"{self.title} (in {self.category.name})"
@@ -197,21 +265,37 @@ class Reply(models.Model):
     class Meta:
         db_table = 'core_reply'
         ordering = ['-is_answer', '-created_at']
+        indexes = [
+            # Reply pages (core.serializers.reply_page) never show soft-deleted replies
+            models.Index(
+                fields=['thread', '-is_answer', '-created_at', 'id'],
+                condition=models.Q(is_deleted=False),
+                name='core_reply_thread_visible',
+            ),
+        ]
 
     def __str__(self):
         return f"Reply by {self.author.email} on {self.thread.title}"
 
     def soft_delete(self):
+        from . import counters  # imports this module
+
         if not self.is_deleted:
-            self.is_deleted = True
-            self.save(update_fields=['is_deleted'])
-            self.thread.decrement_reply_count()
+            with transaction.atomic():
+                self.is_deleted = True
+                self.save(update_fields=['is_deleted'])
+                self.thread.decrement_reply_count()
+                counters.thread_activity(self.thread, replies=-1)
 
     def restore(self):
+        from . import counters
+
         if self.is_deleted:
-            self.is_deleted = False
-            self.save(update_fields=['is_deleted'])
-            self.thread.increment_reply_count()
+            with transaction.atomic():
+                self.is_deleted = False
+                self.save(update_fields=['is_deleted'])
+                self.thread.increment_reply_count()
+                counters.thread_activity(self.thread, replies=1)
 
 
 class Like(models.Model):
@@ -240,6 +324,23 @@ class Like(models.Model):
         return f"{self.user.email} liked a reply"
 
 
+class ThreadLikeShard(models.Model):
+    """
+    Pending like-count delta for a hot thread, spread over several rows so
+    concurrent likes don't queue on one row lock (see core.likes).
+    """
+    thread = models.ForeignKey(Thread, on_delete=models.CASCADE, related_name='like_shards')
+    shard = models.PositiveSmallIntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'core_threadlikeshard'
+        unique_together = ['thread', 'shard']
+
+    def __str__(self):
+        return f"{self.thread_id}#{self.shard}: {self.count:+d}"
+
+
 class Report(models.Model):
     """Content reporting system"""
     STATUS_CHOICES = [
@@ -278,6 +379,17 @@ class Report(models.Model):
     class Meta:
         db_table = 'core_report'
         ordering = ['-created_at']
+        indexes = [
+            # Grouping of the moderation queue (core.moderation) only reads pending reports
+            models.Index(
+                fields=['content_type', 'thread', 'reply', '-created_at'],
+                condition=models.Q(status='pending'),
+                name='core_report_pending_target',
+            ),
+            models.Index(
+                fields=['-created_at', 'id'], condition=models.Q(status='pending'), name='core_report_pending_created'
+            ),
+        ]
 
     def __str__(self):
         content = self.thread if self.content_type == 'thread' else self.reply
@@ -288,4 +400,90 @@ class Report(models.Model):
         self.status = action
         self.resolution_notes = notes
         self.resolved_at = timezone.now()
-        self.save()
\ No newline at end of file
+        self.save()
+
+class OutboxEmail(models.Model):
+    """
+    Email queued by a request and delivered by `manage.py send_outbox`.
+
+    Rows are written in the same transaction as the post that triggers
+    them, so a rolled-back post sends nothing and a committed one is never lost.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    to_email = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'core_outboxemail'
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='core_outbox_due'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {self.to_email} ({self.status})"
+
+
+class PendingNotification(models.Model):
+    """A notification waiting to be coalesced into the user's next email (see core.digests)"""
+    KIND_CHOICES = [
+        ('reply', 'Reply'),
+        ('mention', 'Mention'),
+        ('status', 'Status change'),
+    ]
+
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='pending_notifications')
+    thread = models.ForeignKey(Thread, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'core_pendingnotification'
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='core_pendingnotif_user'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} for {self.user}: {self.subject}"
+
+
+class Notification(models.Model):
+    """In-app notification shown in the user's inbox (see core.notifications)"""
+    KIND_CHOICES = PendingNotification.KIND_CHOICES
+
+    recipient = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='notifications')
+    actor = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    thread = models.ForeignKey(Thread, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    message = models.CharField(max_length=255)
+    is_read = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'core_notification'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['recipient', '-created_at', 'id'], name='core_notification_inbox'),
+            models.Index(
+                fields=['recipient'], condition=models.Q(is_read=False), name='core_notification_unread'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} for {self.recipient}: {self.message}"
@@ -0,0 +1,135 @@
+"""
+Moderation queue and bulk moderation actions.
+
+Pending reports are grouped per reported thread or reply, so a raid of a
+thousand reports against one post is a single queue entry. Groups are
+ordered by report count, then by their newest report, and paginated with
+a keyset cursor over those aggregates.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Q, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from . import counters
+from .events import MODERATION_CHANNEL, publish, thread_channel
+from .models import Report, Thread, Reply
+from .pagination import PAGE_SIZE, paginate_keyset
+from .search import get_search_backend
+from .thread_cache import thread_changed
+from .utils import notify_threads_status
+
+# `first_id` (the group's oldest report) is unique per group and breaks ties
+QUEUE_ORDERING = ('-report_count', '-latest_at', 'first_id')
+
+RECENT_REPORTS = 3
+
+
+def pending_groups():
+    return (
+        Report.objects.filter(status='pending')
+        .values('content_type', 'thread', 'reply')
+        .annotate(report_count=Count('id'), latest_at=Max('created_at'), first_id=Min('id'))
+    )
+
+
+def queue_page(cursor=None, page_size=PAGE_SIZE):
+    """Return (groups, next_cursor) with targets and recent reports attached"""
+    groups, next_cursor = paginate_keyset(pending_groups(), QUEUE_ORDERING, cursor, page_size)
+    attach_targets(groups)
+    return groups, next_cursor
+
+
+def attach_targets(groups):
+    """Load every group's thread/reply and latest reports: three queries per page"""
+    thread_ids = {g['thread'] for g in groups if g['thread']}
+    reply_ids = {g['reply'] for g in groups if g['reply']}
+
+    threads = Thread.objects.select_related('author').only(
+        'id', 'title', 'is_locked', 'is_pinned', 'author', 'author__email'
+    ).in_bulk(thread_ids)
+    replies = Reply.objects.select_related('author').only(
+        'id', 'thread_id', 'content', 'is_deleted', 'author', 'author__email'
+    ).in_bulk(reply_ids)
+
+    recent = {}
+    if groups:
+        ranked = Report.objects.filter(
+            Q(thread_id__in=thread_ids) | Q(reply_id__in=reply_ids), status='pending'
+        ).annotate(
+            position=Window(
+                RowNumber(),
+                partition_by=[F('content_type'), F('thread_id'), F('reply_id')],
+                order_by=F('created_at').desc(),
+            )
+        ).filter(position__lte=RECENT_REPORTS).select_related('reporter').only(
+            'id', 'content_type', 'thread_id', 'reply_id', 'reason', 'created_at', 'reporter', 'reporter__email'
+        ).order_by('-created_at')
+        for report in ranked:
+            recent.setdefault((report.content_type, report.thread_id, report.reply_id), []).append(report)
+
+    for group in groups:
+        group['target_thread'] = threads.get(group['thread'])
+        group['target_reply'] = replies.get(group['reply'])
+        group['recent_reports'] = recent.get((group['content_type'], group['thread'], group['reply']), [])
+    return groups
+
+
+def apply_bulk_action(moderator, action, report_ids=(), thread_ids=(), reply_ids=(), notes=''):
+    """
+    Apply one action to many reports, threads and replies in a single
+    transaction of set-based UPDATEs. Content actions (lock, pin, delete)
+    also resolve the pending reports against the targets they were given.
+    Returns the number of rows changed per kind.
+    """
+    now = timezone.now()
+    changed = {'reports': 0, 'threads': 0, 'replies': 0}
+    with transaction.atomic():
+        if action in ('lock', 'pin'):
+            field = 'is_locked' if action == 'lock' else 'is_pinned'
+            threads = list(
+                Thread.objects.select_for_update(of=('self',)).select_related('author')
+                .filter(pk__in=thread_ids, **{field: False})
+            )
+            Thread.objects.filter(pk__in=[t.pk for t in threads]).update(**{field: True, 'updated_at': now})
+            for thread in threads:
+                setattr(thread, field, True)
+                publish(thread_channel(thread.pk), 'status', {'is_locked': thread.is_locked, 'is_pinned': thread.is_pinned})
+            notify_threads_status(threads, 'LOCKED' if action == 'lock' else 'PINNED', moderator)
+            thread_changed(*[thread.pk for thread in threads])
+            changed['threads'] = len(threads)
+
+        elif action == 'delete':
+            replies = list(
+                Reply.objects.select_for_update().filter(pk__in=reply_ids, is_deleted=False)
+                .values_list('pk', 'thread_id')
+            )
+            Reply.objects.filter(pk__in=[pk for pk, _ in replies]).update(is_deleted=True, updated_at=now)
+            removed = Counter(thread_id for _, thread_id in replies)
+            counters.threads_replies_removed(removed)
+            thread_changed(*removed)
+            for pk, thread_id in replies:
+                publish(thread_channel(thread_id), 'reply_deleted', {'reply': pk})
+
+            def reindex():
+                backend = get_search_backend()
+                for thread_id in removed:
+                    backend.replies_changed(thread_id)
+            transaction.on_commit(reindex)
+            changed['replies'] = len(replies)
+
+        report_status = 'dismissed' if action == 'dismiss' else 'resolved'
+        resolution = {'status': report_status, 'moderator': moderator, 'resolved_at': now}
+        if notes:
+            resolution['resolution_notes'] = notes
+        changed['reports'] = Report.objects.filter(
+            Q(pk__in=report_ids)
+            | Q(content_type='thread', thread_id__in=thread_ids)
+            | Q(content_type='reply', reply_id__in=reply_ids),
+            status='pending',
+        ).update(**resolution)
+        if changed['reports']:
+            publish(MODERATION_CHANNEL, 'reports_resolved', {'count': changed['reports'], 'status': report_status})
+    return changed
@@ -0,0 +1,60 @@
+"""
+In-app notification inbox.
+
+Each user's unread total lives on CustomUser.unread_notification_count and
+is moved by the same transaction that inserts or reads notifications, so
+the navbar badge is a column on the already-loaded user instead of a COUNT.
+The column is one of the USER_CACHE_FIELDS JWT requests read from the
+cache (core.authentication), so every change drops the cached rows it moved.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Greatest
+
+from .authentication import forget_cached_users
+from .models import CustomUser, Notification
+
+
+def notify(recipients, kind, message, thread=None, actor=None):
+    """Fan one notification out to `recipients`"""
+    return notify_each([
+        Notification(recipient_id=pk, actor=actor, kind=kind, thread=thread, message=message)
+        for pk in {user.pk for user in recipients}
+    ])
+
+
+def notify_each(notifications):
+    """Insert unsaved Notification objects: one INSERT and one counter UPDATE"""
+    if not notifications:
+        return 0
+    per_user = Counter(n.recipient_id for n in notifications)
+    for n in notifications:
+        n.message = n.message[:255]
+    with transaction.atomic():
+        Notification.objects.bulk_create(notifications)
+        # Sorted so concurrent fan-outs lock user rows in the same order
+        CustomUser.objects.filter(pk__in=sorted(per_user)).update(
+            unread_notification_count=F('unread_notification_count') + Case(
+                *[When(pk=pk, then=Value(count)) for pk, count in per_user.items()],
+                output_field=IntegerField(),
+            )
+        )
+        transaction.on_commit(lambda: forget_cached_users(sorted(per_user)))
+    return len(notifications)
+
+
+def mark_read(user, notification_ids=None):
+    """Mark the given (default: all) unread notifications of `user` read; returns how many changed"""
+    unread = Notification.objects.filter(recipient=user, is_read=False)
+    if notification_ids is not None:
+        unread = unread.filter(pk__in=notification_ids)
+    with transaction.atomic():
+        changed = unread.update(is_read=True)
+        if changed:
+            CustomUser.objects.filter(pk=user.pk).update(
+                unread_notification_count=Greatest(F('unread_notification_count') - changed, 0)
+            )
+            transaction.on_commit(lambda: forget_cached_users([user.pk]))
+    return changed
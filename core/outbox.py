@@ -0,0 +1,130 @@
+"""
+Durable email outbox.
+
+Notifications are queued as OutboxEmail rows inside the caller's
+transaction. `manage.py send_outbox` claims due rows in batches, sends
+each batch over one reused mail connection and retries failures with
+exponential backoff until EMAIL_OUTBOX_MAX_ATTEMPTS is reached.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+logger = logging.getLogger(__name__)
+
+MAX_RETRY_DELAY = 6 * 60 * 60
+
+
+def enqueue_email(subject, body, recipient_list):
+    """Queue one message per distinct recipient; returns how many were queued"""
+    recipients = sorted({email for email in recipient_list if email})
+    OutboxEmail.objects.bulk_create([
+        OutboxEmail(to_email=email, subject=subject[:255], body=body) for email in recipients
+    ])
+    return len(recipients)
+
+
+def retry_delay(attempts):
+    base = getattr(settings, 'EMAIL_OUTBOX_RETRY_DELAY', 60)
+    return timedelta(seconds=min(base * 2 ** max(attempts - 1, 0), MAX_RETRY_DELAY))
+
+
+def claim_batch(limit):
+    """
+    Lease up to `limit` due messages to the calling worker.
+
+    Claimed rows get their next attempt pushed out by EMAIL_OUTBOX_LEASE
+    seconds, so a batch held by a worker that dies is picked up again later;
+    SKIP LOCKED keeps concurrent workers on disjoint batches.
+    """
+    now = timezone.now()
+    lease = timedelta(seconds=getattr(settings, 'EMAIL_OUTBOX_LEASE', 300))
+    with transaction.atomic():
+        batch = list(
+            OutboxEmail.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:limit]
+        )
+        if batch:
+            OutboxEmail.objects.filter(pk__in=[m.pk for m in batch]).update(
+                attempts=F('attempts') + 1, next_attempt_at=now + lease
+            )
+    for message in batch:
+        message.attempts += 1
+    return batch
+
+
+def deliver(batch):
+    """Send a claimed batch over a single connection; returns (sent, retried, failed)"""
+    sent, errors = [], {}
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        errors = {message: e for message in batch}
+    else:
+        try:
+            for message in batch:
+                email = EmailMessage(
+                    message.subject, message.body, settings.DEFAULT_FROM_EMAIL, [message.to_email],
+                    connection=connection,
+                )
+                try:
+                    connection.send_messages([email])
+                    sent.append(message.pk)
+                except Exception as e:
+                    errors[message] = e
+        finally:
+            connection.close()
+
+    now = timezone.now()
+    if sent:
+        OutboxEmail.objects.filter(pk__in=sent).update(status='sent', sent_at=now, last_error='')
+
+    max_attempts = getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 5)
+    retried = failed = 0
+    for message, error in errors.items():
+        if message.attempts >= max_attempts:
+            failed += 1
+            new_status = 'failed'
+            logger.error("Giving up on outbox email %s to %s: %s", message.pk, message.to_email, error)
+        else:
+            retried += 1
+            new_status = 'pending'
+        OutboxEmail.objects.filter(pk=message.pk).update(
+            status=new_status, next_attempt_at=now + retry_delay(message.attempts), last_error=str(error)[:2000]
+        )
+    return len(sent), retried, failed
+
+
+class DeliveryStats:
+    """Running totals for a send_outbox worker"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.batches = self.sent = self.retried = self.failed = 0
+        self.digests = 0
+        self._lock = threading.Lock()
+
+    def add(self, sent, retried, failed):
+        with self._lock:
+            self.batches += 1
+            self.sent += sent
+            self.retried += retried
+            self.failed += failed
+
+    def summary(self):
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        return (
+            f"{self.sent} sent, {self.retried} retrying, {self.failed} failed in {self.batches} batch(es); "
+            f"{self.digests} notification email(s) composed; {elapsed:.1f}s, {self.sent / elapsed:.1f} msg/s"
+        )
@@ -0,0 +1,142 @@
+import base64
+import binascii
+import json
+from bisect import bisect_right
+from datetime import datetime
+
+from django.core.exceptions import FieldDoesNotExist, FieldError, ValidationError
+from django.db.models import Q, FloatField, BigIntegerField
+
+PAGE_SIZE = 10
+MAX_PAGE_SIZE = 50
+
+
+class InvalidCursor(ValueError):
+    """Raised when a client sends a cursor we did not issue"""
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, ordering, queryset=None):
+    """
+    The values of `cursor` for `ordering`, each parsed by the field (or
+    annotation) of `queryset` it orders on. Anything a client could have
+    altered raises InvalidCursor rather than reaching the query.
+    """
+    padded = cursor + '=' * (-len(cursor) % 4)
+    try:
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor('Invalid cursor')
+    if not isinstance(values, list) or len(values) != len(ordering):
+        raise InvalidCursor('Invalid cursor')
+    if any(value is None or not isinstance(value, (str, int, float)) for value in values):
+        raise InvalidCursor('Invalid cursor')
+    if queryset is None:
+        return values
+    try:
+        return [_parse(_ordering_field(queryset, term), value) for term, value in zip(ordering, values)]
+    except (ValidationError, FieldDoesNotExist, FieldError, TypeError, ValueError):
+        raise InvalidCursor('Invalid cursor')
+
+
+def _parse(field, value):
+    value = field.to_python(value)
+    # e.g. integers beyond the column's range, which the database would reject
+    field.run_validators(value)
+    return value
+
+
+def _ordering_field(queryset, term):
+    name = term.lstrip('-')
+    annotation = queryset.query.annotations.get(name)
+    if annotation is not None:
+        return annotation.output_field
+    return queryset.model._meta.get_field(name)
+
+
+def get_page_size(request, default=PAGE_SIZE):
+    try:
+        size = int(request.query_params.get('page_size', default))
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def wants_total(request):
+    """Totals cost a full COUNT(*) over the filtered set, so they are opt-in"""
+    return request.query_params.get('count', '').lower() in ('1', 'true', 'yes')
+
+
+def _cursor_value(obj, field):
+    # Rows are model instances, or dicts for values() querysets
+    value = obj[field] if isinstance(obj, dict) else getattr(obj, field)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def keyset_filter(ordering, values):
+    """
+    Build the WHERE clause selecting rows strictly after `values` for an
+    ordering such as ('-is_pinned', '-created_at', 'id').
+    """
+    condition = Q()
+    equal = Q()
+    for term, value in zip(ordering, values):
+        field = term.lstrip('-')
+        lookup = 'lt' if term.startswith('-') else 'gt'
+        condition |= equal & Q(**{f'{field}__{lookup}': value})
+        equal &= Q(**{field: value})
+    return condition
+
+
+def keyset_queryset(queryset, ordering, cursor=None):
+    """`queryset` ordered by `ordering` and starting after `cursor` (unsliced)"""
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        queryset = queryset.filter(keyset_filter(ordering, decode_cursor(cursor, ordering, queryset)))
+    return queryset
+
+
+def paginate_keyset(queryset, ordering, cursor=None, page_size=PAGE_SIZE):
+    """
+    Return (items, next_cursor) for one page of `queryset`.
+
+    The last term of `ordering` must be unique (normally the primary key) so
+    every row has a stable position; page N then costs one index range scan
+    instead of an OFFSET over the N-1 pages before it.
+    """
+    items = list(keyset_queryset(queryset, ordering, cursor)[:page_size + 1])
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        last = items[-1]
+        next_cursor = encode_cursor([_cursor_value(last, term.lstrip('-')) for term in ordering])
+    return items, next_cursor
+
+
+def paginate_ranked(hits, cursor=None, page_size=PAGE_SIZE):
+    """
+    Return (hits, next_cursor) for one page of `hits`, a [(pk, score), ...]
+    list already ranked best first (score descending, then pk). Cursors have
+    the same shape as a ('-rank', 'id') keyset page's.
+    """
+    start = 0
+    if cursor:
+        score, pk = decode_cursor(cursor, ('-rank', 'id'))
+        try:
+            after = (-_parse(FloatField(), score), _parse(BigIntegerField(), pk))
+        except (ValidationError, TypeError, ValueError):
+            raise InvalidCursor('Invalid cursor')
+        start = bisect_right(hits, after, key=lambda hit: (-hit[1], hit[0]))
+    page = hits[start:start + page_size + 1]
+    next_cursor = None
+    if len(page) > page_size:
+        page = page[:page_size]
+        pk, score = page[-1]
+        next_cursor = encode_cursor([score, pk])
+    return page, next_cursor
@@ -0,0 +1,47 @@
+"""
+Resource ratings as an upsert that keeps Resource's aggregate columns
+(rating_sum, rating_count and the per-star histogram) in step, so the
+average never needs the ResourceRating rows.
+"""
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import Resource, ResourceRating
+
+
+def _adjust(resource_id, added=None, removed=None):
+    """Count rating `added` and/or uncount rating `removed` in one UPDATE"""
+    deltas = defaultdict(int)
+    for stars, sign in ((added, 1), (removed, -1)):
+        if stars is not None:
+            deltas['rating_sum'] += sign * stars
+            deltas['rating_count'] += sign
+            deltas[f'rating_{stars}_count'] += sign
+    changes = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    if changes:
+        Resource.objects.filter(pk=resource_id).update(**changes)
+
+
+def rate_resource(resource, user, rating, review=None):
+    """Create or replace `user`'s rating of `resource`; returns (rating, created)"""
+    with transaction.atomic():
+        existing = ResourceRating.objects.select_for_update().filter(resource=resource, user=user).first()
+        if existing is None:
+            try:
+                with transaction.atomic():
+                    created = ResourceRating.objects.create(resource=resource, user=user, rating=rating, review=review)
+            except IntegrityError:
+                # Lost a race with a concurrent first rating from the same user
+                existing = ResourceRating.objects.select_for_update().get(resource=resource, user=user)
+            else:
+                _adjust(resource.pk, added=rating)
+                return created, True
+
+        old = existing.rating
+        existing.rating = rating
+        existing.review = review
+        existing.save(update_fields=['rating', 'review', 'updated_at'])
+        _adjust(resource.pk, added=rating, removed=old)
+        return existing, False
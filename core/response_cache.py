@@ -0,0 +1,85 @@
+"""
+Versioned response cache for the catalog endpoints.
+
+Each cached view names the scopes ('course', 'category', 'tag') its output
+depends on. Every scope has a version counter in the cache that core.signals
+bumps after any save or delete of a model feeding it commits. Responses are
+stored as rendered JSON bytes under a key made of the scope versions and the
+request's query string, so a hit skips both the ORM and serialization and a
+bump orphans every stale entry at once (they age out by RESPONSE_CACHE_TIMEOUT).
+
+Category and tag reply/like totals are maintained with F() updates that
+fire no signals (core.counters), so those figures can lag by up to
+RESPONSE_CACHE_TIMEOUT; thread, category and tag changes show immediately.
+
+Bumps only reach the workers sharing the cache, so the cache is off (a zero
+timeout) unless CACHES points at a shared backend.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+
+def version_key(scope):
+    return f'response:version:{scope}'
+
+
+def _initial_version():
+    # A version key evicted from the cache must not restart at a number old entries used
+    return int(time.time() * 1000)
+
+
+def get_versions(scopes):
+    keys = [version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _initial_version(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump(*scopes):
+    """Invalidate every cached response depending on any of `scopes`"""
+    for scope in scopes:
+        try:
+            cache.incr(version_key(scope))
+        except ValueError:
+            cache.add(version_key(scope), _initial_version(), None)
+
+
+def response_key(view_name, scopes, request):
+    query = request.GET.urlencode() if request.GET else ''
+    versions = '.'.join(str(version) for version in get_versions(scopes))
+    digest = hashlib.blake2b(query.encode(), digest_size=12).hexdigest()
+    return f'response:{view_name}:{versions}:{digest}'
+
+
+def versioned_response(*scopes):
+    """
+    Serve a function view's 200 JSON responses from the cache until one of
+    `scopes` is bumped. Goes under @api_view, so authentication, throttling
+    and content negotiation still run; browsable-API requests bypass the cache.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            timeout = getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 0)
+            if not timeout or getattr(request.accepted_renderer, 'format', None) != 'json':
+                return view(request, *args, **kwargs)
+
+            key = response_key(view.__name__, scopes, request)
+            body = cache.get(key)
+            if body is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                body = request.accepted_renderer.render(response.data)
+                cache.set(key, body, timeout)
+            return HttpResponse(body, content_type=request.accepted_renderer.media_type)
+        return wrapper
+    return decorator
@@ -0,0 +1,250 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+from django.db import connection
+from django.db.models import F, Q, FloatField
+from django.db.models.functions import Cast
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Thread, Reply
+
+logger = logging.getLogger(__name__)
+
+SEARCH_CONFIG = 'english'
+
+RELEVANCE_ORDERING = ('-rank', 'id')
+
+
+def thread_search_vector():
+    """The expression stored in Thread.search_vector"""
+    return (
+        SearchVector('title', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('content', weight='B', config=SEARCH_CONFIG)
+    )
+
+
+class SearchBackend:
+    """
+    Thread search strategy. `search` filters a Thread queryset and may
+    annotate it with a float `rank`; a backend that ranks outside the
+    database returns its ranking from `rank` instead. The other hooks are
+    called from core.signals so the backend can keep its index current.
+    """
+
+    def search(self, threads, query):
+        raise NotImplementedError
+
+    def rank(self, threads, query):
+        """[(pk, score), ...] best first for the matches in `threads`, or None to rank in SQL"""
+        return None
+
+    def thread_saved(self, thread):
+        pass
+
+    def thread_deleted(self, thread_id):
+        pass
+
+    def replies_changed(self, thread_id):
+        pass
+
+
+class SubstringSearchBackend(SearchBackend):
+    """Unindexed icontains match; no ranking"""
+
+    def search(self, threads, query):
+        return threads.filter(Q(title__icontains=query) | Q(content__icontains=query))
+
+
+class PostgresSearchBackend(SearchBackend):
+    """Stored tsvector (GIN) with websearch syntax, plus pg_trgm for title typos"""
+
+    def search(self, threads, query):
+        # `title % query` (pg_trgm) keeps typo tolerance on titles via the trigram index
+        search_query = SearchQuery(query, search_type='websearch', config=SEARCH_CONFIG)
+        # Cast to double so the value round-trips exactly through a pagination cursor
+        rank = Cast(SearchRank(F('search_vector'), search_query) + TrigramSimilarity('title', query), FloatField())
+        return threads.annotate(rank=rank).filter(
+            Q(search_vector=search_query) | Q(title__trigram_similar=query)
+        )
+
+    def thread_saved(self, thread):
+        Thread.objects.filter(pk=thread.pk).update(search_vector=thread_search_vector())
+
+
+class BM25SearchBackend(SearchBackend):
+    """
+    In-memory BM25 index over thread titles, contents and replies.
+
+    The index is built lazily on the first search, from the snapshot at
+    SEARCH_INDEX_PATH when one exists (see `manage.py build_search_index`)
+    and from the database otherwise. Writes in this process update it
+    through signals; writes made by other workers are picked up every
+    SEARCH_SYNC_INTERVAL seconds from `updated_at`, and their deletes by
+    comparing the indexed ids with the table.
+    """
+
+    TITLE_WEIGHT = 2.0
+    CONTENT_WEIGHT = 1.0
+    REPLY_WEIGHT = 0.5
+    MAX_RESULTS = 500
+    BUILD_CHUNK_SIZE = 2000
+
+    def __init__(self):
+        self._index = None
+        self._lock = threading.Lock()
+        self._synced_at = None
+        self._last_sync_check = 0.0
+
+    @property
+    def index(self):
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = self._load()
+        return self._index
+
+    def search(self, threads, query):
+        return threads.filter(pk__in=[pk for pk, _ in self.rank(threads, query)])
+
+    def rank(self, threads, query):
+        self._sync()
+        # A filtered queryset (category, tag) narrows the candidates before the
+        # MAX_RESULTS cut, so a narrow filter isn't starved by matches outside it
+        candidates = threads.values_list('pk', flat=True) if threads.query.has_filters() else None
+        hits = self.index.search(query, limit=self.MAX_RESULTS, candidates=candidates)
+        if candidates is None and hits:
+            # Threads other workers deleted since the last sync are still indexed
+            live = set(threads.filter(pk__in=[pk for pk, _ in hits]).values_list('pk', flat=True))
+            hits = [hit for hit in hits if hit[0] in live]
+        return hits
+
+    def thread_saved(self, thread):
+        if self._index is not None:
+            self.reindex([thread.pk])
+
+    def thread_deleted(self, thread_id):
+        if self._index is not None:
+            self._index.remove(thread_id)
+
+    def replies_changed(self, thread_id):
+        if self._index is not None:
+            self.reindex([thread_id])
+
+    def reindex(self, thread_ids):
+        replies = {}
+        for thread_id, content in Reply.objects.filter(
+            thread_id__in=thread_ids, is_deleted=False
+        ).values_list('thread_id', 'content'):
+            replies.setdefault(thread_id, []).append(content)
+
+        found = set()
+        for pk, title, content in Thread.objects.filter(pk__in=thread_ids).values_list('pk', 'title', 'content'):
+            found.add(pk)
+            self.index.add(pk, self._fields(title, content, replies.get(pk, ())))
+        for pk in set(thread_ids) - found:
+            self.index.remove(pk)
+
+    def build(self):
+        """Index every thread, streaming threads and their replies in primary-key order"""
+        from .bm25 import BM25Index
+
+        built_at = time.time()
+        threads = Thread.objects.order_by('pk').values_list('pk', 'title', 'content').iterator(
+            chunk_size=self.BUILD_CHUNK_SIZE
+        )
+        replies = Reply.objects.filter(is_deleted=False).order_by('thread_id').values_list(
+            'thread_id', 'content'
+        ).iterator(chunk_size=self.BUILD_CHUNK_SIZE)
+
+        def documents():
+            pending = next(replies, None)
+            for pk, title, content in threads:
+                texts = []
+                while pending is not None and pending[0] <= pk:
+                    if pending[0] == pk:
+                        texts.append(pending[1])
+                    pending = next(replies, None)
+                yield pk, self._fields(title, content, texts)
+
+        index = BM25Index.from_documents(documents())
+        index.built_at = built_at
+        return index
+
+    def _fields(self, title, content, replies):
+        return [(title, self.TITLE_WEIGHT), (content, self.CONTENT_WEIGHT)] + [
+            (text, self.REPLY_WEIGHT) for text in replies
+        ]
+
+    def _load(self):
+        from .bm25 import BM25Index
+
+        path = getattr(settings, 'SEARCH_INDEX_PATH', None)
+        if path and os.path.exists(path):
+            try:
+                index = BM25Index.load(path)
+                self._synced_at = datetime.fromtimestamp(index.built_at or 0, tz=dt_timezone.utc)
+                self._last_sync_check = 0.0
+                return index
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning("Ignoring unreadable search snapshot %s: %s", path, e)
+        self._synced_at = timezone.now()
+        self._last_sync_check = time.monotonic()
+        return self.build()
+
+    def _sync(self):
+        """Re-index threads changed, and drop threads deleted, by other processes since the last sync"""
+        interval = getattr(settings, 'SEARCH_SYNC_INTERVAL', 30)
+        index = self.index
+        if time.monotonic() - self._last_sync_check < interval:
+            return
+        self._last_sync_check = time.monotonic()
+        since, self._synced_at = self._synced_at, timezone.now()
+        changed = set(Thread.objects.filter(updated_at__gte=since).values_list('pk', flat=True))
+        changed.update(Reply.objects.filter(updated_at__gte=since).values_list('thread_id', flat=True))
+        if changed:
+            self.reindex(list(changed))
+        # Ids are read before the table so a thread indexed meanwhile can't look deleted
+        deleted = set(index.doc_ids()) - set(Thread.objects.values_list('pk', flat=True))
+        for pk in deleted:
+            index.remove(pk)
+        logger.debug(
+            "Search index synced %d threads, dropped %d (%d indexed)", len(changed), len(deleted), len(index)
+        )
+
+
+_backend = None
+
+
+def get_search_backend():
+    """
+    The configured SEARCH_BACKEND (a dotted path), or PostgreSQL full-text
+    search on PostgreSQL and the in-process BM25 index everywhere else.
+    """
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'SEARCH_BACKEND', None)
+        if path:
+            _backend = import_string(path)()
+        elif connection.vendor == 'postgresql':
+            _backend = PostgresSearchBackend()
+        else:
+            _backend = BM25SearchBackend()
+    return _backend
+
+
+def search_threads(threads, query):
+    return get_search_backend().search(threads, query)
+
+
+def rank_threads(threads, query):
+    return get_search_backend().rank(threads, query)
+
+
+def is_ranked(threads):
+    return 'rank' in threads.query.annotations
@@ -0,0 +1,290 @@
+"""
+Synthetic forum data for load tests and query-plan audits.
+
+`seed_forum` bulk-inserts users, courses, resources, ratings, categories,
+tags, threads, replies, likes and reports in chunks, with the skew real
+forums have: activity follows a Zipf distribution, so a few threads draw
+most replies, likes and reports, a few users write most posts and most
+tags are long tail. Timestamps are spread over the last `days` days.
+Denormalized counters are recomputed with core.counters.reconcile at the
+end, and search vectors are rebuilt on PostgreSQL.
+"""
+import itertools
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import counters
+from .models import (
+    CustomUser, Course, Resource, ResourceRating, Category, Tag, Thread, Reply, Like, Report
+)
+from .search import thread_search_vector
+
+DEFAULT_SIZES = {
+    'users': 1000,
+    'courses': 100,
+    'resources': 2000,
+    'ratings': 10000,
+    'categories': 12,
+    'tags': 200,
+    'threads': 10000,
+    'replies': 50000,
+    'likes': 100000,
+    'reports': 500,
+}
+
+PASSWORD = 'studydeck'
+
+WORDS = (
+    'algorithm array binary cache compiler complexity database deadlock derivative eigenvalue entropy '
+    'exam graph hash heap integral kernel lab lecture matrix memory midsem network pointer probability '
+    'process quiz recursion register scheduling semaphore signal socket stack syllabus thermodynamics '
+    'thread tree tutorial vector voltage'
+).split()
+
+DEPARTMENTS = ('CS', 'EEE', 'ECE', 'MECH', 'CHEM', 'MATH', 'PHY', 'ECON')
+RESOURCE_TYPES = (('PDF', 40), ('LINK', 25), ('NOTE', 20), ('VIDEO', 10), ('ASSIGNMENT', 5))
+STARS = ((1, 5), (2, 5), (3, 15), (4, 35), (5, 40))
+
+
+class ZipfChooser:
+    """Picks items with probability proportional to 1 / rank**exponent"""
+
+    def __init__(self, rng, items, exponent=1.1):
+        self.rng = rng
+        self.items = list(items)
+        self.cum_weights = list(itertools.accumulate(
+            1 / (rank ** exponent) for rank in range(1, len(self.items) + 1)
+        ))
+
+    def pick(self, k=None):
+        if k is None:
+            return self.rng.choices(self.items, cum_weights=self.cum_weights)[0]
+        return self.rng.choices(self.items, cum_weights=self.cum_weights, k=k)
+
+
+def weighted(rng, pairs):
+    values, weights = zip(*pairs)
+    return rng.choices(values, weights)[0]
+
+
+def sentence(rng, low, high):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let bulk_create store the created_at/updated_at values we set"""
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Seeder:
+    def __init__(self, sizes, seed=0, chunk_size=2000, days=365, log=None):
+        self.sizes = {**DEFAULT_SIZES, **sizes}
+        self.rng = random.Random(seed)
+        self.chunk_size = chunk_size
+        self.now = timezone.now()
+        self.start = self.now - timedelta(days=days)
+        self.log = log or (lambda message: None)
+        # Keeps names unique when seeding the same database again (to the millisecond)
+        self.run = self.now.strftime('%y%m%d%H%M%S%f')[:-3]
+
+    def moment(self, after=None):
+        start = max(after or self.start, self.start)
+        return start + (self.now - start) * self.rng.random()
+
+    def insert(self, model, objects):
+        """bulk_create `objects` in chunks; returns the new primary keys in insertion order"""
+        before = model.objects.aggregate(last=Max('pk'))['last'] or 0
+        objects = iter(objects)
+        while True:
+            chunk = list(itertools.islice(objects, self.chunk_size))
+            if not chunk:
+                break
+            model.objects.bulk_create(chunk)
+        pks = list(model.objects.filter(pk__gt=before).order_by('pk').values_list('pk', flat=True))
+        self.log(f"{model.__name__}: {len(pks)}")
+        return pks
+
+    def users(self):
+        password = make_password(PASSWORD)
+        count = self.sizes['users']
+        roles = ['admin'] * 2 + ['moderator'] * max(count // 100, 1)
+
+        def build():
+            for i in range(count):
+                joined = self.moment()
+                yield CustomUser(
+                    username=f'{self.run}-user{i}', email=f'{self.run}-user{i}@example.com', password=password,
+                    role=roles[i] if i < len(roles) else 'student', department=self.rng.choice(DEPARTMENTS),
+                    email_notifications=weighted(self.rng, (('instant', 70), ('daily', 20), ('off', 10))),
+                    date_joined=joined, created_at=joined, updated_at=joined,
+                )
+        self.user_ids = self.insert(CustomUser, build())
+        self.moderator_ids = self.user_ids[:len(roles)]
+        # Posting activity is skewed towards a core of regulars
+        self.authors = ZipfChooser(self.rng, self.rng.sample(self.user_ids, len(self.user_ids)), exponent=0.8)
+
+    def catalog(self):
+        def courses():
+            for i in range(self.sizes['courses']):
+                department = self.rng.choice(DEPARTMENTS)
+                yield Course(
+                    code=f'{department} S{self.run[-6:]}{i}', title=sentence(self.rng, 2, 4).title(),
+                    department=department, semester=self.rng.randint(1, 2), instructor=f'Prof. {i}',
+                    created_at=self.start, updated_at=self.start,
+                )
+        self.course_ids = self.insert(Course, courses())
+        popular_courses = ZipfChooser(self.rng, self.course_ids)
+
+        def resources():
+            for i in range(self.sizes['resources']):
+                created = self.moment()
+                yield Resource(
+                    course_id=popular_courses.pick(), title=sentence(self.rng, 3, 6).capitalize(),
+                    description=sentence(self.rng, 10, 30), resource_type=weighted(self.rng, RESOURCE_TYPES),
+                    url=f'https://example.com/resources/{i}', uploaded_by_id=self.authors.pick(),
+                    view_count=int(self.rng.paretovariate(1.2) * 10), created_at=created, updated_at=created,
+                )
+        resource_ids = self.insert(Resource, resources())
+        popular_resources = ZipfChooser(self.rng, resource_ids)
+
+        def ratings():
+            seen = set()
+            for _ in range(self.sizes['ratings'] * 3):
+                if len(seen) >= self.sizes['ratings']:
+                    break
+                pair = (popular_resources.pick(), self.rng.choice(self.user_ids))
+                if pair in seen:
+                    continue
+                seen.add(pair)
+                created = self.moment()
+                yield ResourceRating(
+                    resource_id=pair[0], user_id=pair[1], rating=weighted(self.rng, STARS),
+                    review=sentence(self.rng, 5, 15) if self.rng.random() < 0.3 else None,
+                    created_at=created, updated_at=created,
+                )
+        self.insert(ResourceRating, ratings())
+
+    def forum(self):
+        self.category_ids = self.insert(Category, (
+            Category(name=f'{word.title()} {self.run}-{i}', slug=f'{word}-{self.run}-{i}', created_at=self.start)
+            for i, word in enumerate(self.rng.choices(WORDS, k=self.sizes['categories']))
+        ))
+        self.tag_ids = self.insert(Tag, (
+            Tag(name=f'{word}-{self.run}-{i}', slug=f'{word}-{self.run}-{i}', created_at=self.start)
+            for i, word in enumerate(self.rng.choices(WORDS, k=self.sizes['tags']))
+        ))
+        categories = ZipfChooser(self.rng, self.category_ids, exponent=0.7)
+        courses = ZipfChooser(self.rng, self.course_ids)
+        tags = ZipfChooser(self.rng, self.tag_ids)
+
+        # Creation times in id order, so newer threads have higher ids as in production
+        moments = sorted(self.moment() for _ in range(self.sizes['threads']))
+
+        def threads():
+            for i, created in enumerate(moments):
+                yield Thread(
+                    category_id=categories.pick(), author_id=self.authors.pick(),
+                    course_id=courses.pick() if self.rng.random() < 0.5 else None,
+                    title=sentence(self.rng, 4, 9).capitalize() + '?', content=sentence(self.rng, 20, 80),
+                    is_pinned=self.rng.random() < 0.002, is_locked=self.rng.random() < 0.01,
+                    created_at=created, updated_at=created,
+                )
+        thread_ids = self.insert(Thread, threads())
+        self.thread_created = dict(zip(thread_ids, moments))
+        # Virality isn't tied to age: rank threads in a random order
+        self.hot_threads = ZipfChooser(self.rng, self.rng.sample(thread_ids, len(thread_ids)))
+
+        through = Thread.tags.through
+        self.insert(through, (
+            through(thread_id=thread_id, tag_id=tag_id)
+            for thread_id in thread_ids
+            for tag_id in set(tags.pick(self.rng.choice((0, 1, 1, 2, 2, 3, 4))))
+        ))
+
+        def replies():
+            for thread_id in self.hot_threads.pick(self.sizes['replies']):
+                created = self.moment(after=self.thread_created[thread_id])
+                yield Reply(
+                    thread_id=thread_id, author_id=self.authors.pick(), content=sentence(self.rng, 5, 60),
+                    is_deleted=self.rng.random() < 0.02, created_at=created, updated_at=created,
+                )
+        reply_ids = self.insert(Reply, replies())
+        self.reply_threads = dict(Reply.objects.filter(pk__in=reply_ids).values_list('pk', 'thread_id'))
+        # Likes on replies cluster on the hot threads' replies too
+        self.hot_replies = ZipfChooser(self.rng, self.rng.sample(reply_ids, len(reply_ids)))
+
+    def reactions(self):
+        likers = ZipfChooser(self.rng, self.user_ids, exponent=0.5)
+
+        def likes():
+            seen = set()
+            for _ in range(self.sizes['likes'] * 3):
+                if len(seen) >= self.sizes['likes']:
+                    break
+                on_thread = self.rng.random() < 0.6 or not self.reply_threads
+                target = self.hot_threads.pick() if on_thread else self.hot_replies.pick()
+                key = (likers.pick(), on_thread, target)
+                if key in seen:
+                    continue
+                seen.add(key)
+                thread_id = target if on_thread else self.reply_threads[target]
+                yield Like(
+                    user_id=key[0], content_type='thread' if on_thread else 'reply',
+                    thread_id=target if on_thread else None, reply_id=None if on_thread else target,
+                    created_at=self.moment(after=self.thread_created[thread_id]),
+                )
+        self.insert(Like, likes())
+
+        def reports():
+            for _ in range(self.sizes['reports']):
+                on_thread = self.rng.random() < 0.7 or not self.reply_threads
+                target = self.hot_threads.pick() if on_thread else self.hot_replies.pick()
+                thread_id = target if on_thread else self.reply_threads[target]
+                status = weighted(self.rng, (('pending', 70), ('resolved', 20), ('dismissed', 10)))
+                created = self.moment(after=self.thread_created[thread_id])
+                handled = status != 'pending'
+                yield Report(
+                    reporter_id=self.rng.choice(self.user_ids), content_type='thread' if on_thread else 'reply',
+                    thread_id=target if on_thread else None, reply_id=None if on_thread else target,
+                    reason=sentence(self.rng, 3, 12), status=status,
+                    moderator_id=self.rng.choice(self.moderator_ids) if handled else None,
+                    resolved_at=self.moment(after=created) if handled else None, created_at=created,
+                )
+        self.insert(Report, reports())
+
+    def run_all(self):
+        with transaction.atomic(), explicit_timestamps(
+            CustomUser, Course, Resource, ResourceRating, Category, Tag, Thread, Reply, Like, Report
+        ):
+            self.users()
+            self.catalog()
+            self.forum()
+            self.reactions()
+        with transaction.atomic():
+            counters.reconcile()
+        if connection.vendor == 'postgresql':
+            Thread.objects.filter(search_vector__isnull=True).update(search_vector=thread_search_vector())
+        self.log("Counters reconciled")
+
+
+def seed_forum(sizes=None, seed=0, chunk_size=2000, days=365, log=None):
+    """Generate a forum of the given `sizes` (see DEFAULT_SIZES)"""
+    Seeder(sizes or {}, seed=seed, chunk_size=chunk_size, days=days, log=log).run_all()
@@ -1,71 +1,116 @@
 from rest_framework import serializers
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from . import counters
+from .authentication import VERSION_CLAIM, add_token_claims
+from .metrics import TimedSerializerMixin
+from .pagination import paginate_keyset, PAGE_SIZE
 from .models import (
-    Course, Resource, ResourceRating, Category, Tag, Thread, Reply, Like, Report
+    Course, Resource, ResourceRating, Category, Tag, Thread, Reply, Like, Report, Notification
 )
 
 User = get_user_model()
 
-class CustomUserSerializer(serializers.ModelSerializer):
+REPLY_ORDERING = ('-is_answer', '-created_at', 'id')
+
+class CustomUserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'role', 'bio', 'department', 'profile_picture']
 
-class CourseSerializer(serializers.ModelSerializer):
+class NotificationPreferencesSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ['email_notifications']
+
+class ForumTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Issues tokens carrying the claims core.authentication checks"""
+
+    @classmethod
+    def get_token(cls, user):
+        return add_token_claims(super().get_token(user), user)
+
+class ForumTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refuses refresh tokens issued before the user's last role/staff/active/password change"""
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        current = User.objects.filter(pk=refresh.payload.get(jwt_settings.USER_ID_CLAIM)).filter(
+            auth_version=refresh.payload.get(VERSION_CLAIM, 0)
+        )
+        if not current.exists():
+            raise InvalidToken("Token has been revoked")
+        return super().validate(attrs)
+
+class NotificationSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    actor = serializers.CharField(source='actor.username', read_only=True, default=None)
+    thread_title = serializers.CharField(source='thread.title', read_only=True, default=None)
+
+    class Meta:
+        model = Notification
+        fields = ['id', 'kind', 'message', 'actor', 'thread', 'thread_title', 'is_read', 'created_at']
+
+class CourseSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Course
         fields = '__all__'
 
-class ResourceRatingSerializer(serializers.ModelSerializer):
+class ResourceRatingSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     user = serializers.StringRelatedField(read_only=True)
     class Meta:
         model = ResourceRating
         fields = ['id', 'user', 'rating', 'review', 'created_at']
 
-class ResourceSerializer(serializers.ModelSerializer):
+class ResourceSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """Ratings themselves are served by /api/resources/<id>/ratings/"""
     uploaded_by = serializers.StringRelatedField(read_only=True)
     course_code = serializers.CharField(source='course.code', read_only=True)
-    ratings = ResourceRatingSerializer(many=True, read_only=True)
-    avg_rating = serializers.SerializerMethodField()
+    avg_rating = serializers.FloatField(read_only=True)
+    rating_histogram = serializers.DictField(child=serializers.IntegerField(), read_only=True)
 
     class Meta:
         model = Resource
-        fields = ['id', 'course', 'course_code', 'title', 'description', 'resource_type', 'file', 'url', 'uploaded_by', 'view_count', 'created_at', 'ratings', 'avg_rating']
-
-    def get_avg_rating(self, obj):
-        ratings = obj.ratings.all()
-        if ratings:
-            return sum(r.rating for r in ratings) / len(ratings)
-        return 0
+        fields = ['id', 'course', 'course_code', 'title', 'description', 'resource_type', 'file', 'url', 'uploaded_by', 'view_count', 'created_at', 'avg_rating', 'rating_count', 'rating_histogram']
+        read_only_fields = ['view_count', 'rating_count']
 
 # --- FORUM SERIALIZERS ---
 
-class CategorySerializer(serializers.ModelSerializer):
-    thread_count = serializers.IntegerField(read_only=True)
+class CategorySerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
-        fields = ['id', 'name', 'slug', 'description', 'thread_count']
+        fields = ['id', 'name', 'slug', 'description', 'thread_count', 'reply_count', 'like_count']
+        read_only_fields = ['thread_count', 'reply_count', 'like_count']
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Tag
-        fields = ['id', 'name', 'slug']
+        fields = ['id', 'name', 'slug', 'thread_count']
+        read_only_fields = ['thread_count']
 
-class ReplySerializer(serializers.ModelSerializer):
-    author_email = serializers.EmailField(source='author.email', read_only=True)
-    user_liked = serializers.SerializerMethodField()
-
-    class Meta:
-        model = Reply
-        fields = ['id', 'author_email', 'content', 'created_at', 'like_count', 'is_answer', 'user_liked']
+class ViewerLikedMixin:
+    """Resolve `user_liked` from the preloaded ViewerState when the view provides one"""
 
     def get_user_liked(self, obj):
+        viewer = self.context.get('viewer')
+        if viewer is not None:
+            return viewer.has_liked(obj)
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return obj.likes.filter(user=request.user).exists()
         return False
 
-class ThreadListSerializer(serializers.ModelSerializer):
+class ReplySerializer(ViewerLikedMixin, TimedSerializerMixin, serializers.ModelSerializer):
+    author_email = serializers.EmailField(source='author.email', read_only=True)
+    user_liked = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Reply
+        fields = ['id', 'author_email', 'content', 'created_at', 'like_count', 'is_answer', 'user_liked']
+
+class ThreadListSerializer(ViewerLikedMixin, TimedSerializerMixin, serializers.ModelSerializer):
     author_email = serializers.EmailField(source='author.email', read_only=True)
     category_name = serializers.CharField(source='category.name', read_only=True)
     tags = TagSerializer(many=True, read_only=True)
@@ -77,17 +122,26 @@ class ThreadListSerializer(serializers.ModelSerializer):
             'id', 'title', 'content', 'author_email', 'category_name', 'tags', 
             'created_at', 'like_count', 'reply_count', 'is_locked', 'is_pinned','user_liked'
         ]
-    def get_user_liked(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return obj.likes.filter(user=request.user).exists()
-        return False
     
-class ThreadDetailSerializer(serializers.ModelSerializer):
+def visible_replies(thread):
+    """Replies shown to readers, with everything ReplySerializer needs"""
+    return Reply.objects.filter(thread=thread, is_deleted=False).select_related('author')
+
+def reply_page(thread, cursor=None, page_size=PAGE_SIZE):
+    """One keyset page of a thread's replies (answer first, newest first)"""
+    return paginate_keyset(visible_replies(thread), REPLY_ORDERING, cursor, page_size)
+
+class ThreadDetailSerializer(ViewerLikedMixin, TimedSerializerMixin, serializers.ModelSerializer):
+    """
+    Thread with only the first page of its replies; `replies_next` is the
+    cursor for /api/threads/<id>/replies/. Views pass the page in as
+    context['reply_page'] so viewer state can be loaded for it up front.
+    """
     author_email = serializers.EmailField(source='author.email', read_only=True)
     category_name = serializers.CharField(source='category.name', read_only=True)
     tags = TagSerializer(many=True, read_only=True)
-    replies = ReplySerializer(many=True, read_only=True)
+    replies = serializers.SerializerMethodField()
+    replies_next = serializers.SerializerMethodField()
     user_liked = serializers.SerializerMethodField()
 
     class Meta:
@@ -95,18 +149,25 @@ class ThreadDetailSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'title', 'content', 'author_email', 'category', 'category_name', 
             'tags', 'created_at', 'like_count', 'reply_count', 'is_locked', 
-            'is_pinned', 'replies', 'user_liked'
+            'is_pinned', 'replies', 'replies_next', 'user_liked'
         ]
 
-    def get_user_liked(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return obj.likes.filter(user=request.user).exists()
-        return False
+    def _reply_page(self, obj):
+        if 'reply_page' not in self.context:
+            self.context['reply_page'] = reply_page(obj)
+        return self.context['reply_page']
+
+    def get_replies(self, obj):
+        replies, _ = self._reply_page(obj)
+        return ReplySerializer(replies, many=True, context=self.context).data
+
+    def get_replies_next(self, obj):
+        _, next_cursor = self._reply_page(obj)
+        return next_cursor
 
 # In core/serializers.py
 
-class ThreadCreateSerializer(serializers.ModelSerializer):
+class ThreadCreateSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     tags = serializers.PrimaryKeyRelatedField(
         many=True, 
         queryset=Tag.objects.all(), 
@@ -116,24 +177,42 @@ class ThreadCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Thread
         fields = ['id', 'title', 'content', 'category', 'tags']
+
+    def create(self, validated_data):
+        with transaction.atomic():
+            thread = super().create(validated_data)
+            counters.thread_added(thread)
+        return thread
+
+    def update(self, instance, validated_data):
+        with transaction.atomic():
+            old_category_id = instance.category_id
+            old_tag_ids = set(instance.tags.values_list('pk', flat=True)) if 'tags' in validated_data else None
+            thread = super().update(instance, validated_data)
+            if thread.category_id != old_category_id:
+                counters.thread_moved(thread, old_category_id)
+            if old_tag_ids is not None:
+                new_tag_ids = {tag.pk for tag in validated_data['tags']}
+                counters.thread_retagged(thread, new_tag_ids - old_tag_ids, old_tag_ids - new_tag_ids)
+        return thread
                
-class LikeSerializer(serializers.ModelSerializer):
+class LikeSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Like
         fields = '__all__'
 
-class ReportCreateSerializer(serializers.ModelSerializer):
+class ReportCreateSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Report
         fields = ['reason', 'content_type', 'thread', 'reply']
 
-class ReportSerializer(serializers.ModelSerializer):
+class ReportSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     reporter_email = serializers.EmailField(source='reporter.email', read_only=True)
     content_object = serializers.SerializerMethodField()
 
     class Meta:
         model = Report
-        fields = ['id', 'reporter_email', 'reason', 'status', 'created_at', 'content_object']
+        fields = ['id', 'reporter_email', 'reason', 'status', 'created_at', 'content_type', 'thread', 'reply', 'content_object']
 
     def get_content_object(self, obj):
         if obj.thread:
@@ -142,7 +221,61 @@ class ReportSerializer(serializers.ModelSerializer):
             return f"Reply: {obj.reply.content[:50]}..."
         return "Unknown Content"
 
-class ReportUpdateSerializer(serializers.ModelSerializer):
+class ReportUpdateSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Report
-        fields = ['status', 'resolution_notes']
\ No newline at end of file
+        fields = ['status', 'resolution_notes']
+
+# --- MODERATION QUEUE (groups come from core.moderation.queue_page) ---
+
+class QueueThreadSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    author_email = serializers.EmailField(source='author.email', read_only=True)
+
+    class Meta:
+        model = Thread
+        fields = ['id', 'title', 'author_email', 'is_locked', 'is_pinned']
+
+class QueueReplySerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    author_email = serializers.EmailField(source='author.email', read_only=True)
+
+    class Meta:
+        model = Reply
+        fields = ['id', 'thread_id', 'author_email', 'content', 'is_deleted']
+
+class QueueReportSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    reporter_email = serializers.EmailField(source='reporter.email', read_only=True)
+
+    class Meta:
+        model = Report
+        fields = ['id', 'reporter_email', 'reason', 'created_at']
+
+class ModerationGroupSerializer(TimedSerializerMixin, serializers.Serializer):
+    content_type = serializers.CharField()
+    thread_id = serializers.IntegerField(source='thread', allow_null=True)
+    reply_id = serializers.IntegerField(source='reply', allow_null=True)
+    report_count = serializers.IntegerField()
+    latest_at = serializers.DateTimeField()
+    thread = QueueThreadSerializer(source='target_thread', allow_null=True)
+    reply = QueueReplySerializer(source='target_reply', allow_null=True)
+    recent_reports = QueueReportSerializer(many=True)
+
+
+class BulkModerationSerializer(TimedSerializerMixin, serializers.Serializer):
+    """Input of POST /api/moderation/bulk/, applied by core.moderation.apply_bulk_action"""
+    ACTIONS = ['resolve', 'dismiss', 'lock', 'pin', 'delete']
+    MAX_IDS = 1000
+
+    action = serializers.ChoiceField(choices=ACTIONS)
+    report_ids = serializers.ListField(child=serializers.IntegerField(), required=False, default=list, max_length=MAX_IDS)
+    thread_ids = serializers.ListField(child=serializers.IntegerField(), required=False, default=list, max_length=MAX_IDS)
+    reply_ids = serializers.ListField(child=serializers.IntegerField(), required=False, default=list, max_length=MAX_IDS)
+    notes = serializers.CharField(required=False, allow_blank=True, default='')
+
+    def validate(self, data):
+        if not (data['report_ids'] or data['thread_ids'] or data['reply_ids']):
+            raise serializers.ValidationError("Nothing to moderate")
+        if data['action'] in ('lock', 'pin') and data['reply_ids']:
+            raise serializers.ValidationError("Only threads can be locked or pinned")
+        if data['action'] == 'delete' and data['thread_ids']:
+            raise serializers.ValidationError("Only replies can be soft-deleted")
+        return data
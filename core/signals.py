@@ -0,0 +1,113 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .authentication import auth_version_changed
+from .models import CustomUser, Course, Category, Tag, Thread, Reply
+from .response_cache import bump
+from .thread_cache import thread_changed
+from .search import get_search_backend
+
+THREAD_SEARCH_FIELDS = {'title', 'content'}
+REPLY_SEARCH_FIELDS = {'content', 'is_deleted'}
+USER_AUTH_FIELDS = {'role', 'is_active', 'is_staff', 'is_superuser'}
+
+# Cached response scopes (core.response_cache) each model's rows feed; threads
+# carry the category and tag totals
+RESPONSE_SCOPES = {
+    Course: ('course',),
+    Category: ('category',),
+    Tag: ('tag',),
+    Thread: ('category', 'tag'),
+}
+
+
+def _touches(update_fields, fields):
+    return update_fields is None or bool(fields & set(update_fields))
+
+
+@receiver(post_save, sender=Thread)
+def index_thread(sender, instance, update_fields=None, **kwargs):
+    """Keep the search index current when the title or content may have changed"""
+    if _touches(update_fields, THREAD_SEARCH_FIELDS):
+        transaction.on_commit(lambda: get_search_backend().thread_saved(instance))
+
+
+@receiver(post_delete, sender=Thread)
+def unindex_thread(sender, instance, **kwargs):
+    thread_id = instance.pk
+    transaction.on_commit(lambda: get_search_backend().thread_deleted(thread_id))
+
+
+@receiver(post_save, sender=Reply)
+def index_reply(sender, instance, update_fields=None, **kwargs):
+    if _touches(update_fields, REPLY_SEARCH_FIELDS):
+        thread_id = instance.thread_id
+        transaction.on_commit(lambda: get_search_backend().replies_changed(thread_id))
+
+
+@receiver(post_delete, sender=Reply)
+def unindex_reply(sender, instance, **kwargs):
+    thread_id = instance.thread_id
+    transaction.on_commit(lambda: get_search_backend().replies_changed(thread_id))
+
+
+@receiver(pre_save, sender=CustomUser)
+def detect_auth_change(sender, instance, update_fields=None, raw=False, **kwargs):
+    """Note whether this save changes anything outstanding tokens vouch for"""
+    instance._auth_changed = False
+    if raw or instance.pk is None:
+        return
+    # set_password() keeps the raw password until the save; the hash upgrade
+    # check_password() does on login clears it first and so revokes nothing
+    if instance._password is not None and _touches(update_fields, {'password'}):
+        instance._auth_changed = True
+        return
+    if not _touches(update_fields, USER_AUTH_FIELDS):
+        return
+    fields = USER_AUTH_FIELDS - instance.get_deferred_fields()
+    previous = CustomUser.objects.filter(pk=instance.pk).values(*fields).first()
+    instance._auth_changed = previous is not None and any(
+        previous[field] != getattr(instance, field) for field in fields
+    )
+
+
+@receiver(post_save, sender=CustomUser)
+def bump_auth_version(sender, instance, created, **kwargs):
+    if created or not getattr(instance, '_auth_changed', False):
+        return
+    instance._auth_changed = False
+    CustomUser.objects.filter(pk=instance.pk).update(auth_version=F('auth_version') + 1)
+    instance.refresh_from_db(fields=['auth_version'])
+    user_id, version = instance.pk, instance.auth_version
+    transaction.on_commit(lambda: auth_version_changed(user_id, version))
+
+
+# Per sender: a receiver for every model would stop deletes cascading
+# without first loading the rows (likes, reports, ...)
+@receiver([post_save, post_delete], sender=Course)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Tag)
+@receiver([post_save, post_delete], sender=Thread)
+def bump_response_versions(sender, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(lambda: bump(*RESPONSE_SCOPES[sender]))
+
+
+@receiver(m2m_changed, sender=Thread.tags.through)
+def bump_tag_versions(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        transaction.on_commit(lambda: bump('tag'))
+
+
+@receiver([post_save, post_delete], sender=Thread)
+def invalidate_thread_detail(sender, instance, raw=False, **kwargs):
+    if not raw:
+        thread_changed(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Reply)
+def invalidate_reply_thread_detail(sender, instance, raw=False, **kwargs):
+    if not raw:
+        thread_changed(instance.thread_id)
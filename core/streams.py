@@ -0,0 +1,104 @@
+"""
+Server-Sent Events streams fed by core.events.
+
+These are plain async Django views (DRF's decorators are sync-only). Serve
+the project through ASGI (studydeck_forum.asgi) so an open stream parks a
+coroutine instead of holding a worker thread.
+
+EventSource can't send an Authorization header, so a client without a
+session first POSTs to /api/streams/ticket/ and opens the stream with the
+returned single-use `?ticket=`; access tokens never appear in URLs (and so
+never in proxy or access logs). Tickets live in the default cache, which
+must be shared when several workers serve streams.
+"""
+import json
+import secrets
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+
+from .events import MODERATION_CHANNEL, get_broker, thread_channel
+from .models import CustomUser, Thread
+
+RECONNECT_DELAY_MS = 5000
+
+
+def format_event(event):
+    data = json.dumps(event['data'], cls=DjangoJSONEncoder, separators=(',', ':'))
+    return f"event: {event['type']}\ndata: {data}\n\n"
+
+
+async def event_stream(subscription):
+    heartbeat = getattr(settings, 'SSE_HEARTBEAT_INTERVAL', 15)
+    try:
+        yield f"retry: {RECONNECT_DELAY_MS}\n\n"
+        while True:
+            event = await subscription.get(heartbeat)
+            if subscription.overflowed:
+                # Events were dropped; the client reloads instead of applying a partial history
+                subscription.drain()
+                yield "event: resync\ndata: {}\n\n"
+            elif event is None:
+                yield ": keepalive\n\n"
+            else:
+                yield format_event(event)
+    finally:
+        subscription.close()
+
+
+def sse_response(channels):
+    response = StreamingHttpResponse(
+        event_stream(get_broker().subscribe(channels)), content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def ticket_key(ticket):
+    return f'stream:ticket:{ticket}'
+
+
+def issue_stream_ticket(user):
+    """A ticket that opens one stream as `user` within STREAM_TICKET_TIMEOUT seconds"""
+    ticket = secrets.token_urlsafe(32)
+    cache.set(ticket_key(ticket), user.pk, getattr(settings, 'STREAM_TICKET_TIMEOUT', 30))
+    return ticket
+
+
+def _redeem_ticket(ticket):
+    key = ticket_key(ticket)
+    user_id = cache.get(key)
+    # Only the request whose delete removed the key may use it
+    if user_id is None or not cache.delete(key):
+        return None
+    return CustomUser.objects.filter(pk=user_id, is_active=True).first()
+
+
+async def get_stream_user(request):
+    """The owner of a `?ticket=` from issue_stream_ticket, else the session user"""
+    ticket = request.GET.get('ticket')
+    if ticket:
+        return await sync_to_async(_redeem_ticket)(ticket)
+    return await request.auser()
+
+
+@require_GET
+async def thread_events(request, thread_id):
+    """New replies, like counts and lock/pin changes for one thread"""
+    if not await Thread.objects.filter(pk=thread_id).aexists():
+        raise Http404
+    return sse_response([thread_channel(thread_id)])
+
+
+@require_GET
+async def moderation_events(request):
+    """New and resolved reports, for moderators"""
+    user = await get_stream_user(request)
+    if not (user and user.is_authenticated and user.is_moderator()):
+        return JsonResponse({'error': 'Only moderators can view reports'}, status=403)
+    return sse_response([MODERATION_CHANNEL])
@@ -1,3 +1,1915 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import re
+import tempfile
+from collections import Counter
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from datetime import timedelta
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.db.models.query import QuerySet
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import serializers as drf_serializers
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from django.utils import timezone
+
+from . import counters, urls
+from .models import (
+    CustomUser, Course, Resource, ResourceRating, Category, Tag, Thread, Reply, Like, ThreadLikeShard, Report,
+    Notification, OutboxEmail, PendingNotification,
+)
+from .outbox import claim_batch, deliver, enqueue_email, retry_delay
+from .pagination import encode_cursor
+from .authentication import CachedJWTAuthentication
+from .benchmark import get_routes
+from .bm25 import BM25Index
+from .digests import flush_due_digests, notify_user
+from .events import LocalBroker
+from .explain import AuditCase, Auditor, Proposal, format_result, page
+from .likes import fold_like_shards, toggle_thread_like
+from .metrics import MetricsMiddleware, Registry, TimedSerializerMixin, measure
+from .notifications import mark_read, notify
+from .ratings import rate_resource
+from .search import BM25SearchBackend, PostgresSearchBackend, SubstringSearchBackend
+from .serializers import ForumTokenObtainPairSerializer, ForumTokenRefreshSerializer
+from .streams import event_stream, issue_stream_ticket
+from .throttling import SharedMemoryStore
+from .viewcounts import ViewCountBuffer
+
+
+@override_settings(THROTTLE_STORE='core.throttling.NullStore', RESPONSE_CACHE_TIMEOUT=0)
+class APITestCase(TestCase):
+    """Unthrottled and uncached; the cache and query budget tests set their own values"""
+
+
+class CatalogQueryCountTests(APITestCase):
+    """Catalog pages must cost the same number of queries however many rows they show"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            CustomUser.objects.create_user(username=f'user{i}', email=f'user{i}@example.com', password='x')
+            for i in range(12)
+        ]
+        cls.courses = [
+            Course.objects.create(code=f'CS F{i:03d}', title=f'Course {i}', department='CS', semester=i % 2 + 1)
+            for i in range(12)
+        ]
+        for i in range(12):
+            Resource.objects.create(
+                course=cls.courses[i % 3],
+                title=f'Resource {i}',
+                resource_type='PDF' if i % 2 else 'LINK',
+                url='https://example.com/',
+                uploaded_by=cls.users[i],
+            )
+
+    def assertQueriesPerPage(self, url, queries, params=None):
+        for page_size in (2, 10):
+            with self.assertNumQueries(queries):
+                response = self.client.get(url, {'page_size': page_size, **(params or {})})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()['results']), page_size)
+
+    def test_resource_list(self):
+        self.assertQueriesPerPage(reverse('resource-list'), 1)
+
+    def test_resource_list_filters(self):
+        response = self.client.get(reverse('resource-list'), {'course': 'CS F000', 'resource_type': 'PDF'})
+        self.assertEqual({r['course_code'] for r in response.json()['results']}, {'CS F000'})
+        self.assertEqual({r['resource_type'] for r in response.json()['results']}, {'PDF'})
+
+    def test_course_list(self):
+        self.assertQueriesPerPage(reverse('course-list'), 1)
+        self.assertQueriesPerPage(reverse('course-search'), 1, {'q': 'CS'})
+
+    def test_users_list(self):
+        self.assertQueriesPerPage(reverse('users-list'), 1)
+
+    def test_cursor_walks_every_resource_once(self):
+        seen, cursor = [], None
+        while True:
+            params = {'page_size': 5, **({'cursor': cursor} if cursor else {})}
+            data = self.client.get(reverse('resource-list'), params).json()
+            seen += [r['id'] for r in data['results']]
+            cursor = data['next']
+            if not cursor:
+                break
+        self.assertEqual(sorted(seen), sorted(Resource.objects.values_list('id', flat=True)))
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_count_is_opt_in(self):
+        response = self.client.get(reverse('course-list'), {'semester': 1, 'count': 1})
+        self.assertEqual(response.json()['count'], 6)
+        self.assertNotIn('count', self.client.get(reverse('course-list')).json())
+
+
+class KeysetCursorTests(APITestCase):
+    """Cursors come back from clients, so anything but one we issued must be a 400"""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = CustomUser.objects.create_user(username='author', email='author@example.com', password='x')
+        category = Category.objects.create(name='General', slug='general')
+        cls.threads = [
+            Thread.objects.create(category=category, author=author, title=f'Thread {i}', content='x', like_count=i % 3)
+            for i in range(7)
+        ]
+
+    def walk(self, params=None):
+        seen, cursor = [], None
+        while True:
+            response = self.client.get(reverse('thread-list'), {
+                'page_size': 3, **(params or {}), **({'cursor': cursor} if cursor else {}),
+            })
+            self.assertEqual(response.status_code, 200)
+            seen += [t['id'] for t in response.json()['results']]
+            cursor = response.json()['next']
+            if not cursor:
+                return seen
+
+    def test_walks_every_row_once(self):
+        for params in ({}, {'sort': 'popular'}):
+            seen = self.walk(params)
+            self.assertEqual(sorted(seen), sorted(t.pk for t in self.threads))
+            self.assertEqual(len(seen), len(set(seen)))
+
+    def test_malformed_and_tampered_cursors_are_rejected(self):
+        created_at = self.threads[0].created_at.isoformat()
+        cursors = [
+            'not a cursor', '!!!!', encode_cursor({'a': 1}), encode_cursor([created_at]),
+            encode_cursor(['abc', 1]), encode_cursor([{'a': 1}, 1]), encode_cursor([None, None]),
+            encode_cursor([created_at, [1]]), encode_cursor([created_at, 'x']), encode_cursor([created_at, 10 ** 30]),
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                response = self.client.get(reverse('thread-list'), {'cursor': cursor})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'error': 'Invalid cursor'})
+        for url in (reverse('course-list'), reverse('category-detail', kwargs={'slug': 'general'})):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url, {'cursor': encode_cursor([None, 1])}).status_code, 400)
+                self.assertEqual(self.client.get(url, {'cursor': encode_cursor(['abc', 'x'])}).status_code, 400)
+
+    def test_stale_cursor_resumes_after_deleted_row(self):
+        first = self.client.get(reverse('thread-list'), {'page_size': 3}).json()
+        last_id = first['results'][-1]['id']
+        Thread.objects.filter(pk=last_id).delete()
+        second = self.client.get(reverse('thread-list'), {'page_size': 3, 'cursor': first['next']}).json()
+        newest_first = [t.pk for t in sorted(self.threads, key=lambda t: (-t.created_at.timestamp(), t.pk))]
+        self.assertEqual([t['id'] for t in second['results']], newest_first[3:6])
+
+
+class ViewerLikedTests(APITestCase):
+    """`user_liked` comes from one Like query per page, whatever the page size"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = CustomUser.objects.create_user(username='reader', email='reader@example.com', password='x')
+        author = CustomUser.objects.create_user(username='author', email='author@example.com', password='x')
+        category = Category.objects.create(name='General', slug='general')
+        tag = Tag.objects.create(name='Exams', slug='exams')
+        cls.threads = []
+        for i in range(6):
+            thread = Thread.objects.create(category=category, author=author, title=f'Thread {i}', content='x')
+            thread.tags.add(tag)
+            cls.threads.append(thread)
+        cls.replies = [Reply.objects.create(thread=cls.threads[0], author=author, content=f'R{i}') for i in range(6)]
+        for thread in cls.threads[::2]:
+            Like.objects.create(user=cls.reader, content_type='thread', thread=thread)
+        Like.objects.create(user=cls.reader, content_type='reply', reply=cls.replies[1])
+        # Someone else's like must not count for the reader
+        Like.objects.create(user=author, content_type='thread', thread=cls.threads[1])
+
+    def setUp(self):
+        self.client.force_login(self.reader)
+
+    def test_thread_list(self):
+        counts = []
+        for page_size in (2, 6):
+            with CaptureQueriesContext(connection) as queries:
+                results = self.client.get(reverse('thread-list'), {'page_size': page_size}).json()['results']
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+        liked = {t.pk for t in self.threads[::2]}
+        self.assertEqual({r['id']: r['user_liked'] for r in results}, {t.pk: t.pk in liked for t in self.threads})
+
+    def test_replies(self):
+        url = reverse('reply-list', kwargs={'thread_id': self.threads[0].pk})
+        with self.assertNumQueries(5):  # session, user, thread, page, likes
+            results = self.client.get(url, {'page_size': 6}).json()['results']
+        self.assertEqual([r['id'] for r in results if r['user_liked']], [self.replies[1].pk])
+
+    def test_anonymous_needs_no_like_query(self):
+        self.client.logout()
+        with CaptureQueriesContext(connection) as queries:
+            results = self.client.get(reverse('thread-list')).json()['results']
+        self.assertFalse(any(r['user_liked'] for r in results))
+        self.assertFalse([q for q in queries if 'core_like' in q['sql']])
+
+
+class LikeToggleTests(APITestCase):
+    """Like counters stay equal to the Like rows however toggles interleave"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            CustomUser.objects.create_user(username=f'user{i}', email=f'user{i}@example.com', password='x')
+            for i in range(3)
+        ]
+        cls.category = Category.objects.create(name='General', slug='general')
+        cls.other = Category.objects.create(name='Exams', slug='exams')
+        cls.tag = Tag.objects.create(name='Algebra', slug='algebra')
+        cls.thread = Thread.objects.create(category=cls.category, author=cls.users[0], title='Thread', content='x')
+        cls.thread.tags.add(cls.tag)
+        counters.thread_added(cls.thread)
+
+    def like(self, user):
+        self.client.force_login(user)
+        response = self.client.post(reverse('thread-like', kwargs={'thread_id': self.thread.pk}))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def assertLikes(self, count, totals=None):
+        self.thread.refresh_from_db()
+        self.category.refresh_from_db()
+        self.tag.refresh_from_db()
+        self.assertEqual(Like.objects.filter(thread=self.thread).count(), count)
+        totals = count if totals is None else totals
+        self.assertEqual((self.category.like_count, self.tag.like_count), (totals, totals))
+
+    def test_toggles(self):
+        self.assertEqual([self.like(user)['like_count'] for user in self.users], [1, 2, 3])
+        self.assertEqual(self.like(self.users[1]), {'message': 'Thread unliked', 'like_count': 2, 'user_liked': False})
+        self.assertLikes(2)
+        self.assertEqual(self.thread.like_count, 2)
+        self.assertEqual(counters.reconcile()['category'], 0)
+
+    def test_concurrent_like(self):
+        real_delete = QuerySet.delete
+        raced = []
+
+        def racing_delete(queryset):
+            # The user's other request inserts between this one's DELETE and INSERT
+            result = real_delete(queryset)
+            if queryset.model is Like and not raced:
+                raced.append(True)
+                toggle_thread_like(self.users[0], self.thread)
+            return result
+
+        with mock.patch.object(QuerySet, 'delete', racing_delete):
+            self.assertEqual(toggle_thread_like(self.users[0], self.thread), (True, 1))
+        self.assertLikes(1)
+        self.assertEqual(self.thread.like_count, 1)
+
+    def test_concurrent_unlike(self):
+        self.like(self.users[0])
+        real_delete = QuerySet.delete
+        raced = []
+
+        def racing_delete(queryset):
+            # The user's other unlike deletes the row first, so this one finds nothing
+            if queryset.model is Like and not raced:
+                raced.append(True)
+                toggle_thread_like(self.users[0], self.thread)
+            return real_delete(queryset)
+
+        with mock.patch.object(QuerySet, 'delete', racing_delete):
+            liked, like_count = toggle_thread_like(self.users[0], self.thread)
+        self.assertEqual((liked, like_count), (True, 1))
+        self.assertLikes(1)
+
+    def test_unlike_with_drifted_counter_stops_at_zero(self):
+        self.like(self.users[0])
+        Thread.objects.filter(pk=self.thread.pk).update(like_count=0)
+        self.assertEqual(self.like(self.users[0])['like_count'], 0)
+
+    @override_settings(LIKE_SHARD_PINNED_THREADS=True, LIKE_COUNTER_SHARDS=2)
+    def test_sharded_thread(self):
+        Thread.objects.filter(pk=self.thread.pk).update(is_pinned=True)
+        self.thread.refresh_from_db()
+        with mock.patch('core.likes.thread_changed') as changed, CaptureQueriesContext(connection) as queries:
+            self.assertEqual([toggle_thread_like(user, self.thread)[1] for user in self.users], [1, 2, 3])
+        changed.assert_called_with(self.thread.pk)
+        # Hot toggles write the Like and a shard row, never the category, tag or thread rows
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE')]
+        self.assertTrue(updates)
+        self.assertEqual([sql for sql in updates if 'core_threadlikeshard' not in sql], [])
+        self.assertLikes(3, totals=0)
+        self.assertEqual(self.thread.like_count, 0)
+
+        self.assertEqual(fold_like_shards(), 1)
+        self.assertLikes(3)
+        self.assertEqual(self.thread.like_count, 3)
+        self.assertFalse(ThreadLikeShard.objects.exclude(count=0).exists())
+        self.assertEqual(counters.reconcile(), {'thread': 0, 'category': 0, 'tag': 0, 'resource': 0, 'user': 0})
+
+    @override_settings(LIKE_SHARD_PINNED_THREADS=True)
+    def test_move_and_delete_with_pending_shards(self):
+        Thread.objects.filter(pk=self.thread.pk).update(is_pinned=True)
+        self.like(self.users[1])
+        self.like(self.users[2])
+        self.client.force_login(self.users[0])
+        url = reverse('thread-update', kwargs={'thread_id': self.thread.pk})
+        self.assertEqual(self.client.patch(url, {'category': self.other.pk}, content_type='application/json').status_code, 200)
+        self.assertLikes(2, totals=0)
+        # Pending likes land in the category the thread is in when they are folded
+        fold_like_shards()
+        self.category.refresh_from_db()
+        self.assertEqual(self.category.like_count, 0)
+        self.category = self.other
+        self.assertLikes(2)
+        self.like(self.users[1])
+
+        self.client.force_login(self.users[0])
+        response = self.client.delete(reverse('thread-delete', kwargs={'thread_id': self.thread.pk}))
+        self.assertEqual(response.status_code, 204)
+        self.other.refresh_from_db()
+        self.tag.refresh_from_db()
+        self.assertEqual((self.other.like_count, self.tag.like_count), (0, 0))
+        self.assertFalse(ThreadLikeShard.objects.exists())
+
+
+@override_settings(VIEW_COUNT_FLUSH_INTERVAL=10)
+class ViewCountBufferTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='reader', email='reader@example.com', password='x')
+        course = Course.objects.create(code='CS F111', title='Computer Programming', department='CS')
+        cls.resources = [
+            Resource.objects.create(course=course, title=f'Resource {i}', url='https://example.com/', uploaded_by=cls.user)
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        self.buffer = ViewCountBuffer()
+        # Flushes run explicitly here rather than on the background thread
+        for patcher in (
+            mock.patch.object(self.buffer, '_ensure_flusher'),
+            mock.patch('core.viewcounts.view_buffer', self.buffer),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def view_counts(self):
+        return list(Resource.objects.filter(pk__in=[r.pk for r in self.resources]).order_by('pk')
+                    .values_list('view_count', flat=True))
+
+    def test_flush_applies_batched_deltas(self):
+        for resource, views in zip(self.resources, (3, 1, 2)):
+            for _ in range(views):
+                self.buffer.record(resource.pk)
+        self.assertEqual(self.buffer.pending(self.resources[0].pk), 3)
+        self.assertEqual(self.view_counts(), [0, 0, 0])
+        with mock.patch('core.viewcounts.FLUSH_BATCH_SIZE', 2), self.assertNumQueries(2):
+            self.assertEqual(self.buffer.flush(), 3)
+        self.assertEqual(self.view_counts(), [3, 1, 2])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.buffer.flush(), 0)
+
+    def test_failed_flush_keeps_views(self):
+        self.buffer.record(self.resources[0].pk, 2)
+        with mock.patch.object(self.buffer, '_apply', side_effect=RuntimeError), self.assertLogs('core.viewcounts'):
+            self.assertEqual(self.buffer.flush(), 0)
+        self.buffer.record(self.resources[0].pk)
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(self.view_counts(), [3, 0, 0])
+
+    def test_endpoint_returns_stored_plus_pending(self):
+        Resource.objects.filter(pk=self.resources[0].pk).update(view_count=10)
+        self.client.force_login(self.user)
+        url = reverse('resource-view', kwargs={'id': self.resources[0].pk})
+        self.assertEqual([self.client.post(url).json()['view_count'] for _ in range(2)], [11, 12])
+        self.assertEqual(self.view_counts()[0], 10)
+        self.buffer.flush()
+        self.assertEqual(self.client.post(url).json()['view_count'], 13)
+
+    @override_settings(VIEW_COUNT_FLUSH_INTERVAL=0)
+    def test_write_through(self):
+        self.assertEqual(self.buffer.record(self.resources[1].pk), 1)
+        self.assertEqual(self.view_counts(), [0, 1, 0])
+        self.assertEqual(self.buffer.pending(self.resources[1].pk), 0)
+
+
+class ResourceRatingTests(APITestCase):
+    """Ratings upsert one row per user and keep Resource's aggregates in step"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            CustomUser.objects.create_user(username=f'user{i}', email=f'user{i}@example.com', password='x')
+            for i in range(2)
+        ]
+        course = Course.objects.create(code='CS F111', title='Computer Programming', department='CS')
+        cls.resource = Resource.objects.create(
+            course=course, title='Notes', url='https://example.com/', uploaded_by=cls.users[0]
+        )
+
+    def rate(self, user, rating):
+        self.client.force_login(user)
+        return self.client.post(reverse('resource-rate', kwargs={'id': self.resource.pk}), {'rating': rating})
+
+    def assertAggregates(self, ratings):
+        self.resource.refresh_from_db()
+        self.assertEqual((self.resource.rating_sum, self.resource.rating_count), (sum(ratings), len(ratings)))
+        self.assertEqual(self.resource.rating_histogram, {stars: ratings.count(stars) for stars in range(1, 6)})
+        self.assertEqual(counters.reconcile()['resource'], 0)
+
+    def test_upsert(self):
+        self.assertEqual(self.rate(self.users[0], 4).status_code, 201)
+        self.assertEqual(self.rate(self.users[1], 2).status_code, 201)
+        self.assertAggregates([4, 2])
+        self.assertEqual(self.rate(self.users[0], 5).status_code, 200)
+        self.assertEqual(self.rate(self.users[0], 5).status_code, 200)
+        self.assertAggregates([5, 2])
+        self.assertEqual(ResourceRating.objects.filter(resource=self.resource).count(), 2)
+        self.assertEqual(self.rate(self.users[1], 6).status_code, 400)
+        self.assertAggregates([5, 2])
+        average = self.client.get(reverse('resource-list')).json()['results'][0]['avg_rating']
+        self.assertEqual(average, 3.5)
+
+    def test_concurrent_first_rating(self):
+        real_first = QuerySet.first
+        raced = []
+
+        def racing_first(queryset):
+            # The user's other request creates the rating after this one found none
+            result = real_first(queryset)
+            if queryset.model is ResourceRating and not raced:
+                raced.append(True)
+                rate_resource(self.resource, self.users[0], 2)
+            return result
+
+        with mock.patch.object(QuerySet, 'first', racing_first):
+            rating, created = rate_resource(self.resource, self.users[0], 4)
+        self.assertEqual((rating.rating, created), (4, False))
+        self.assertAggregates([4])
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', EMAIL_OUTBOX_RETRY_DELAY=60,
+    EMAIL_OUTBOX_MAX_ATTEMPTS=3, EMAIL_OUTBOX_LEASE=300,
+)
+class OutboxTests(TestCase):
+
+    def setUp(self):
+        self.assertEqual(enqueue_email('Hello', 'Body', ['b@example.com', 'a@example.com', '', 'a@example.com']), 2)
+
+    def test_claims_are_leased(self):
+        batch = claim_batch(10)
+        self.assertEqual([m.to_email for m in batch], ['a@example.com', 'b@example.com'])
+        self.assertEqual([m.attempts for m in batch], [1, 1])
+        self.assertEqual(claim_batch(10), [])
+        # A worker that died mid-batch: its lease runs out and the rows come back
+        OutboxEmail.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual([m.attempts for m in claim_batch(1)], [2])
+
+    def test_delivery(self):
+        self.assertEqual(deliver(claim_batch(10)), (2, 0, 0))
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ['a@example.com', 'b@example.com'])
+        self.assertEqual(set(OutboxEmail.objects.values_list('status', flat=True)), {'sent'})
+        self.assertEqual(claim_batch(10), [])
+
+    def test_failures_back_off_then_give_up(self):
+        self.assertEqual([retry_delay(n).total_seconds() for n in (1, 2, 3)], [60, 120, 240])
+        self.assertEqual(retry_delay(30).total_seconds(), 6 * 60 * 60)
+
+        def send_messages(messages):
+            if messages[0].to == ['b@example.com']:
+                raise ConnectionError('refused')
+            return len(messages)
+
+        backend = 'django.core.mail.backends.locmem.EmailBackend.send_messages'
+        with mock.patch(backend, side_effect=send_messages), self.assertLogs('core.outbox', 'ERROR'):
+            for attempt, expected in ((1, (1, 1, 0)), (2, (0, 1, 0)), (3, (0, 0, 1))):
+                OutboxEmail.objects.filter(status='pending').update(next_attempt_at=timezone.now())
+                before = timezone.now()
+                self.assertEqual(deliver(claim_batch(10)), expected)
+                failing = OutboxEmail.objects.get(to_email='b@example.com')
+                self.assertEqual((failing.attempts, failing.last_error), (attempt, 'refused'))
+                self.assertGreaterEqual(failing.next_attempt_at, before + retry_delay(attempt))
+        self.assertEqual(failing.status, 'failed')
+        self.assertEqual(OutboxEmail.objects.get(to_email='a@example.com').status, 'sent')
+
+    def test_connection_failure_retries_the_batch(self):
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.open', side_effect=OSError('down')):
+            self.assertEqual(deliver(claim_batch(10)), (0, 2, 0))
+        self.assertEqual(set(OutboxEmail.objects.values_list('status', flat=True)), {'pending'})
+
+
+@override_settings(EMAIL_COALESCE_WINDOW=120)
+class DigestTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = {
+            preference: CustomUser.objects.create_user(
+                username=preference, email=f'{preference}@example.com', password='x', email_notifications=preference,
+            )
+            for preference in ('instant', 'hourly', 'daily', 'off')
+        }
+        category = Category.objects.create(name='General', slug='general')
+        cls.threads = [
+            Thread.objects.create(category=category, author=cls.users['off'], title=f'Thread {i}', content='x')
+            for i in range(2)
+        ]
+
+    def notify(self, preference, thread=0, kind='reply'):
+        notify_user(self.users[preference], self.threads[thread], kind, f'{kind} on {thread}', 'body')
+
+    def age(self, seconds):
+        PendingNotification.objects.update(created_at=timezone.now() - timedelta(seconds=seconds))
+
+    def test_routing(self):
+        for preference in self.users:
+            self.notify(preference)
+        self.assertEqual(
+            sorted(PendingNotification.objects.values_list('user__username', flat=True)), ['daily', 'hourly', 'instant']
+        )
+        with override_settings(EMAIL_COALESCE_WINDOW=0):
+            self.notify('instant')
+        self.assertEqual(list(OutboxEmail.objects.values_list('to_email', flat=True)), ['instant@example.com'])
+
+    def test_lone_notification_goes_out_unchanged(self):
+        self.notify('instant', kind='mention')
+        self.assertEqual(flush_due_digests(), 0)
+        self.age(121)
+        self.assertEqual(flush_due_digests(), 1)
+        email = OutboxEmail.objects.get()
+        self.assertEqual((email.to_email, email.subject, email.body), ('instant@example.com', 'mention on 0', 'body'))
+        self.assertFalse(PendingNotification.objects.exists())
+
+    def test_coalesces_per_thread(self):
+        for thread, kind in ((0, 'reply'), (0, 'reply'), (1, 'mention'), (0, 'mention')):
+            self.notify('hourly', thread, kind)
+        self.age(30 * 60)
+        self.assertEqual(flush_due_digests(), 0)
+        self.age(60 * 60)
+        self.assertEqual(flush_due_digests(), 1)
+        email = OutboxEmail.objects.get()
+        self.assertEqual(email.subject, 'StudyDeck: 4 notifications in 2 thread(s)')
+        self.assertIn('- Thread 0: 2 new replies, 1 mention', email.body)
+        self.assertIn('- Thread 1: 1 mention', email.body)
+
+    def test_waits_for_each_users_interval(self):
+        for preference in ('instant', 'hourly', 'daily'):
+            self.notify(preference)
+        self.age(2 * 60 * 60)
+        self.assertEqual(flush_due_digests(), 2)
+        self.assertEqual(
+            sorted(OutboxEmail.objects.values_list('to_email', flat=True)), ['hourly@example.com', 'instant@example.com']
+        )
+        self.assertEqual(list(PendingNotification.objects.values_list('user__username', flat=True)), ['daily'])
+
+    def test_switching_off_drops_pending(self):
+        self.notify('daily')
+        CustomUser.objects.filter(pk=self.users['daily'].pk).update(email_notifications='off')
+        self.age(2 * 24 * 60 * 60)
+        self.assertEqual(flush_due_digests(), 0)
+        self.assertFalse(PendingNotification.objects.exists())
+
+
+class InboxTests(APITestCase):
+    """The stored unread count follows every insert and read"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader, cls.other = [
+            CustomUser.objects.create_user(username=name, email=f'{name}@example.com', password='x')
+            for name in ('reader', 'other')
+        ]
+
+    def setUp(self):
+        cache.clear()
+        access = ForumTokenObtainPairSerializer.get_token(self.reader).access_token
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {access}'}
+
+    def notify(self, recipients, count=1):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(count):
+                notify(recipients, 'reply', f'Message {i}')
+
+    def unread(self):
+        return self.client.get(reverse('notification-unread-count'), **self.auth).json()['unread']
+
+    def assertReconciled(self):
+        self.assertEqual(counters.reconcile()['user'], 0)
+
+    def test_counts_follow_inserts_and_reads(self):
+        self.notify([self.reader, self.reader, self.other], count=3)
+        self.assertEqual(self.unread(), 3)
+        self.assertReconciled()
+
+        first, *rest = Notification.objects.filter(recipient=self.reader).order_by('pk')
+        theirs = Notification.objects.filter(recipient=self.other).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('notification-read', kwargs={'notification_id': first.pk}), **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.client.post(reverse('notification-read', kwargs={'notification_id': first.pk}), **self.auth)
+        self.client.post(reverse('notification-read', kwargs={'notification_id': theirs.pk}), **self.auth)
+        self.assertEqual(self.unread(), 2)
+        data = self.client.get(reverse('notification-list'), {'unread': 1}, **self.auth).json()
+        self.assertEqual(([n['id'] for n in data['results']], data['unread']), (sorted((n.pk for n in rest), reverse=True), 2))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('notification-read-all'), **self.auth)
+        self.assertEqual(self.unread(), 0)
+        self.assertEqual(mark_read(self.reader), 0)
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.unread_notification_count, 3)
+        self.assertReconciled()
+
+    def test_badge_is_served_from_the_cached_user(self):
+        self.notify([self.reader], count=2)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.unread(), 2)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.unread(), 2)
+        # A new notification drops the cached row, so the badge never lags
+        self.notify([self.reader])
+        self.assertEqual(self.unread(), 3)
+
+
+class StreamTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.moderator = CustomUser.objects.create_user(
+            username='mod', email='mod@example.com', password='x', role='moderator'
+        )
+        cls.student = CustomUser.objects.create_user(username='student', email='student@example.com', password='x')
+
+    def test_ticket_requires_authentication(self):
+        self.assertIn(self.client.post(reverse('stream-ticket')).status_code, (401, 403))
+        access = ForumTokenObtainPairSerializer.get_token(self.moderator).access_token
+        response = self.client.post(reverse('stream-ticket'), HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['expires_in'], 30)
+
+    async def open(self, **params):
+        response = await self.async_client.get(reverse('report-events'), params)
+        if response.streaming:
+            await response.streaming_content.aclose()
+        return response.status_code
+
+    async def test_tickets_are_single_use(self):
+        ticket = issue_stream_ticket(self.moderator)
+        self.assertEqual(await self.open(ticket=ticket), 200)
+        self.assertEqual(await self.open(ticket=ticket), 403)
+        self.assertEqual(await self.open(ticket='forged'), 403)
+        self.assertEqual(await self.open(ticket=issue_stream_ticket(self.student)), 403)
+
+    async def test_access_tokens_are_not_accepted_in_the_url(self):
+        access = ForumTokenObtainPairSerializer.get_token(self.moderator).access_token
+        self.assertEqual(await self.open(token=str(access)), 403)
+
+    async def test_session(self):
+        await self.async_client.aforce_login(self.moderator)
+        self.assertEqual(await self.open(), 200)
+
+
+class SubscriptionTests(SimpleTestCase):
+    """A slow client's queue overflows into one resync instead of a partial history"""
+
+    @override_settings(SSE_QUEUE_SIZE=2, SSE_HEARTBEAT_INTERVAL=0.01)
+    async def test_overflow_resync_and_heartbeat(self):
+        broker = LocalBroker()
+        subscription = broker.subscribe(['thread:1'])
+        stream = event_stream(subscription)
+        self.assertEqual(await anext(stream), 'retry: 5000\n\n')
+
+        for i in range(3):
+            broker.publish('thread:1', {'type': 'reply', 'data': {'n': i}})
+        broker.publish('thread:2', {'type': 'reply', 'data': {'n': 9}})
+        await asyncio.sleep(0)
+        self.assertTrue(subscription.overflowed)
+        self.assertEqual(await anext(stream), 'event: resync\ndata: {}\n\n')
+
+        broker.publish('thread:1', {'type': 'likes', 'data': {'like_count': 4}})
+        await asyncio.sleep(0)
+        self.assertEqual(await anext(stream), 'event: likes\ndata: {"like_count":4}\n\n')
+        self.assertEqual(await anext(stream), ': keepalive\n\n')
+
+        await stream.aclose()
+        self.assertEqual(broker.publish('thread:1', {'type': 'reply', 'data': {}}), 0)
+
+
+class ModerationQueueTests(APITestCase):
+    """One queue entry per reported thread or reply, most reported first"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.moderator = CustomUser.objects.create_user(
+            username='mod', email='mod@example.com', password='x', role='moderator'
+        )
+        cls.reporters = [
+            CustomUser.objects.create_user(username=f'user{i}', email=f'user{i}@example.com', password='x')
+            for i in range(5)
+        ]
+        category = Category.objects.create(name='General', slug='general')
+        cls.threads = [
+            Thread.objects.create(category=category, author=cls.reporters[0], title=f'Thread {i}', content='x')
+            for i in range(4)
+        ]
+        cls.reply = Reply.objects.create(thread=cls.threads[0], author=cls.reporters[0], content='Rude')
+        start = timezone.now() - timedelta(days=1)
+        reports = [
+            ('thread', cls.threads[0], None, 5), ('reply', None, cls.reply, 4), ('thread', cls.threads[1], None, 2),
+            ('thread', cls.threads[2], None, 1), ('thread', cls.threads[3], None, 2),
+        ]
+        minutes = 0
+        for content_type, thread, reply, count in reports:
+            for reporter in cls.reporters[:count]:
+                minutes += 1
+                report = Report.objects.create(
+                    reporter=reporter, content_type=content_type, thread=thread, reply=reply, reason=f'R{minutes}'
+                )
+                Report.objects.filter(pk=report.pk).update(created_at=start + timedelta(minutes=minutes))
+        Report.objects.filter(thread=cls.threads[3]).update(status='resolved')
+
+    def setUp(self):
+        self.client.force_login(self.moderator)
+
+    def page(self, **params):
+        response = self.client.get(reverse('report-queue'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_groups(self):
+        groups = self.page()['results']
+        self.assertEqual(
+            [(g['content_type'], g['thread_id'], g['reply_id'], g['report_count']) for g in groups],
+            [
+                ('thread', self.threads[0].pk, None, 5), ('reply', None, self.reply.pk, 4),
+                ('thread', self.threads[1].pk, None, 2), ('thread', self.threads[2].pk, None, 1),
+            ],
+        )
+        self.assertEqual([r['reason'] for r in groups[0]['recent_reports']], ['R5', 'R4', 'R3'])
+        self.assertEqual(groups[1]['reply']['content'], 'Rude')
+        self.assertEqual(groups[0]['thread']['title'], 'Thread 0')
+
+    def test_pages(self):
+        everything = [(g['content_type'], g['thread_id'], g['reply_id']) for g in self.page()['results']]
+        seen, cursor, counts = [], None, set()
+        while True:
+            with CaptureQueriesContext(connection) as queries:
+                data = self.page(page_size=1, **({'cursor': cursor} if cursor else {}))
+            counts.add(len(queries))
+            seen += [(g['content_type'], g['thread_id'], g['reply_id']) for g in data['results']]
+            cursor = data['next']
+            if not cursor:
+                break
+        self.assertEqual(seen, everything)
+        self.assertEqual(len(counts), 1)
+        self.assertEqual(self.client.get(reverse('report-queue'), {'cursor': encode_cursor(['x', 'y', 1])}).status_code, 400)
+
+    def test_moderators_only(self):
+        self.client.force_login(self.reporters[0])
+        self.assertEqual(self.client.get(reverse('report-queue')).status_code, 403)
+
+
+class BulkModerationTests(APITestCase):
+    """Bulk actions change many rows in one transaction and keep the counters right"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.moderator = CustomUser.objects.create_user(
+            username='mod', email='mod@example.com', password='x', role='moderator'
+        )
+        cls.author = CustomUser.objects.create_user(username='author', email='author@example.com', password='x')
+        cls.reporter = CustomUser.objects.create_user(username='reporter', email='reporter@example.com', password='x')
+        cls.category = Category.objects.create(name='General', slug='general')
+        cls.tag = Tag.objects.create(name='Algebra', slug='algebra')
+
+    def setUp(self):
+        self.client.force_login(self.author)
+        self.threads = []
+        for i in range(3):
+            response = self.client.post(reverse('thread-create'), {
+                'title': f'Thread {i}', 'content': 'x', 'category': self.category.pk, 'tags': [self.tag.pk],
+            }, content_type='application/json')
+            self.assertEqual(response.status_code, 201)
+            self.threads.append(Thread.objects.get(pk=response.json()['id']))
+        self.replies = []
+        for thread in self.threads[:2]:
+            for _ in range(2):
+                url = reverse('reply-create', kwargs={'thread_id': thread.pk})
+                response = self.client.post(url, {'content': 'answer'}, content_type='application/json')
+                self.assertEqual(response.status_code, 201)
+                self.replies.append(Reply.objects.get(pk=response.json()['id']))
+        self.client.force_login(self.moderator)
+
+    def report(self, thread=None, reply=None):
+        return Report.objects.create(
+            reporter=self.reporter, content_type='reply' if reply else 'thread', thread=thread, reply=reply, reason='spam'
+        )
+
+    def bulk(self, **data):
+        return self.client.post(reverse('moderation-bulk'), data, content_type='application/json')
+
+    def test_lock(self):
+        Thread.objects.filter(pk=self.threads[2].pk).update(is_locked=True)
+        reports = [self.report(thread=thread) for thread in self.threads]
+        other = self.report(thread=self.threads[0])
+        Report.objects.filter(pk=other.pk).update(status='dismissed')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.bulk(action='lock', thread_ids=[t.pk for t in self.threads[1:]] + [self.threads[0].pk])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'action': 'lock', 'reports': 3, 'threads': 2, 'replies': 0})
+        self.assertEqual(Thread.objects.filter(is_locked=True).count(), 3)
+        self.assertFalse(Report.objects.filter(pk__in=[r.pk for r in reports]).exclude(status='resolved').exists())
+        self.assertEqual(Report.objects.get(pk=other.pk).status, 'dismissed')
+        self.assertEqual(Notification.objects.filter(recipient=self.author, kind='status').count(), 2)
+
+    def test_lock_queries(self):
+        def queries(threads):
+            Thread.objects.update(is_locked=False)
+            with CaptureQueriesContext(connection) as captured:
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.assertEqual(self.bulk(action='lock', thread_ids=[t.pk for t in threads]).status_code, 200)
+            return len(captured)
+        self.assertEqual(queries(self.threads[:1]), queries(self.threads))
+
+    def test_delete(self):
+        deleted = self.replies[0]
+        deleted.soft_delete()
+        self.report(reply=self.replies[1])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.bulk(action='delete', reply_ids=[r.pk for r in self.replies])
+        self.assertEqual(response.json(), {'action': 'delete', 'reports': 1, 'threads': 0, 'replies': 3})
+        self.assertFalse(Reply.objects.filter(is_deleted=False).exists())
+        self.assertEqual([t.reply_count for t in Thread.objects.order_by('pk')], [0, 0, 0])
+        self.category.refresh_from_db()
+        self.tag.refresh_from_db()
+        self.assertEqual((self.category.reply_count, self.tag.reply_count), (0, 0))
+        fixed = counters.reconcile()
+        self.assertEqual({model: fixed[model] for model in ('thread', 'category', 'tag')},
+                         {'thread': 0, 'category': 0, 'tag': 0})
+
+    def test_dismiss(self):
+        reports = [self.report(thread=self.threads[0]), self.report(reply=self.replies[0])]
+        response = self.bulk(action='dismiss', report_ids=[r.pk for r in reports], notes='Not spam')
+        self.assertEqual(response.json()['reports'], 2)
+        for report in reports:
+            report.refresh_from_db()
+            self.assertEqual((report.status, report.moderator, report.resolution_notes),
+                             ('dismissed', self.moderator, 'Not spam'))
+        self.assertEqual(self.bulk(action='dismiss', report_ids=[r.pk for r in reports]).json()['reports'], 0)
+
+    def test_invalid(self):
+        self.assertEqual(self.bulk(action='lock').status_code, 400)
+        self.assertEqual(self.bulk(action='lock', reply_ids=[self.replies[0].pk]).status_code, 400)
+        self.assertEqual(self.bulk(action='delete', thread_ids=[self.threads[0].pk]).status_code, 400)
+        self.assertEqual(self.bulk(action='purge', thread_ids=[self.threads[0].pk]).status_code, 400)
+        self.client.force_login(self.author)
+        self.assertEqual(self.bulk(action='lock', thread_ids=[self.threads[0].pk]).status_code, 403)
+        self.assertFalse(Thread.objects.filter(is_locked=True).exists())
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    """Token users come from the cache, and role/staff/active/password changes revoke their tokens"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='user', email='user@example.com', password='x')
+
+    def setUp(self):
+        cache.clear()
+
+    def authenticate(self, token, method='get'):
+        request = getattr(RequestFactory(), method)('/', HTTP_AUTHORIZATION=f'Bearer {token.access_token}')
+        user, _ = CachedJWTAuthentication().authenticate(request)
+        return user
+
+    def change(self, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            for field, value in fields.items():
+                setattr(self.user, field, value)
+            self.user.save()
+
+    def test_cached(self):
+        token = ForumTokenObtainPairSerializer.get_token(self.user)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authenticate(token).pk, self.user.pk)
+        with self.assertNumQueries(0):
+            user = self.authenticate(token)
+        self.assertEqual((user.email, user.role, user.is_staff), ('user@example.com', 'student', False))
+
+    def test_revoked(self):
+        for field, value in [('role', 'moderator'), ('is_staff', True), ('is_active', False)]:
+            token = ForumTokenObtainPairSerializer.get_token(self.user)
+            self.authenticate(token)
+            self.change(**{field: value})
+            with self.assertRaises(AuthenticationFailed):
+                self.authenticate(token)
+            with self.assertRaises(InvalidToken):
+                ForumTokenRefreshSerializer(data={'refresh': str(token)}).is_valid(raise_exception=True)
+
+    def test_password(self):
+        token = ForumTokenObtainPairSerializer.get_token(self.user)
+        self.change(bio='Hello', department='Maths')
+        self.authenticate(token)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.set_password('y')
+            self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+    @override_settings(PASSWORD_HASHERS=[
+        'django.contrib.auth.hashers.PBKDF2PasswordHasher', 'django.contrib.auth.hashers.MD5PasswordHasher',
+    ])
+    def test_hash_upgrade_keeps_tokens(self):
+        CustomUser.objects.filter(pk=self.user.pk).update(password=make_password('x', hasher='md5'))
+        self.user.refresh_from_db()
+        token = ForumTokenObtainPairSerializer.get_token(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(self.user.check_password('x'))
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$'))
+        self.assertEqual(self.authenticate(token).pk, self.user.pk)
+
+    @override_settings(JWT_ROLE_CLAIMS=True)
+    def test_role_claims(self):
+        self.change(is_staff=True)
+        token = ForumTokenObtainPairSerializer.get_token(self.user)
+        with self.assertNumQueries(0):
+            user = self.authenticate(token)
+        self.assertEqual((user.pk, user.role, user.is_staff, user.is_superuser), (self.user.pk, 'student', True, False))
+        with self.assertNumQueries(1):
+            self.assertTrue(self.authenticate(token, 'post').is_staff)
+
+        self.change(is_staff=False)
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token)
+
+
+class MetricsTests(APITestCase):
+    """Every response reports its queries and serializer time, sync or async"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = CustomUser.objects.create_user(username='staff', email='staff@example.com', password='x', is_staff=True)
+        cls.student = CustomUser.objects.create_user(username='student', email='student@example.com', password='x')
+        Category.objects.create(name='General', slug='general')
+
+    def setUp(self):
+        self.registry = Registry()
+        for module in ('core.metrics', 'core.views'):
+            patcher = mock.patch(f'{module}.registry', self.registry)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def assertTimed(self, response, queries):
+        self.assertEqual(response.status_code, 200)
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'^db;dur=[\d.]+;desc="%d queries", ser;dur=[\d.]+, total;dur=[\d.]+$' % queries)
+
+    def metric(self, text, line):
+        return float(re.search(re.escape(line) + r' (\S+)', text).group(1))
+
+    def test_sync(self):
+        self.assertTimed(self.client.get(reverse('category-list')), 1)
+
+        self.client.force_login(self.student)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.client.force_login(self.staff)
+        text = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('studydeck_requests_total{view="category-list",status="200"} 1', text)
+        self.assertIn('studydeck_requests_total{view="metrics",status="403"} 1', text)
+        self.assertEqual(self.metric(text, 'studydeck_db_queries_sum{view="category-list"}'), 1)
+        self.assertEqual(self.metric(text, 'studydeck_serializer_duration_seconds_count{view="category-list"}'), 1)
+        self.assertGreater(self.metric(text, 'studydeck_serializer_duration_seconds_sum{view="category-list"}'), 0)
+        self.assertEqual(
+            self.metric(text, 'studydeck_response_size_bytes_bucket{view="category-list",le="1000"}'), 1
+        )
+
+    async def test_async(self):
+        response = await self.async_client.get(reverse('category-list'))
+        self.assertTimed(response, 1)
+        self.assertIn('studydeck_requests_total{view="category-list",status="200"} 1', self.registry.render())
+
+        async def get_response(request):
+            await sync_to_async(Category.objects.count)()
+            return HttpResponse('ok')
+        middleware = MetricsMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        self.assertTimed(await middleware(RequestFactory().get('/')), 1)
+
+    def test_nested_serializers_count_once(self):
+        class Inner(TimedSerializerMixin, drf_serializers.Serializer):
+            name = drf_serializers.CharField()
+
+        class Outer(TimedSerializerMixin, drf_serializers.Serializer):
+            inner = drf_serializers.SerializerMethodField()
+
+            def get_inner(self, obj):
+                return Inner([obj, obj], many=True).data
+
+        with measure() as sample, mock.patch('core.metrics.time.perf_counter', side_effect=[0, 1, 10]):
+            self.assertEqual(Outer({'name': 'x'}).data, {'inner': [{'name': 'x'}, {'name': 'x'}]})
+        self.assertEqual(sample.serializer, 10)
+
+
+SEED_SIZES = {
+    'users': 40, 'courses': 5, 'resources': 30, 'ratings': 80, 'categories': 4, 'tags': 15,
+    'threads': 80, 'replies': 400, 'likes': 500, 'reports': 30,
+}
+
+
+def seed(**options):
+    call_command('seed_forum', chunk_size=25, stdout=StringIO(), **SEED_SIZES, **options)
+
+
+class SeedForumTests(TestCase):
+    """seed_forum fills every table in chunks, skewed, with consistent counters"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed()
+
+    def test_sizes(self):
+        models = {
+            'users': CustomUser, 'courses': Course, 'resources': Resource, 'categories': Category, 'tags': Tag,
+            'threads': Thread, 'replies': Reply,
+        }
+        for name, model in models.items():
+            self.assertEqual(model.objects.count(), SEED_SIZES[name], name)
+        # Duplicate (user, target) picks are dropped
+        for name, model in (('ratings', ResourceRating), ('likes', Like), ('reports', Report)):
+            self.assertTrue(0 < model.objects.count() <= SEED_SIZES[name], name)
+
+    def test_skewed(self):
+        replies = sorted(Thread.objects.values_list('reply_count', flat=True), reverse=True)
+        self.assertGreater(replies[0], 4 * replies[len(replies) // 2])
+        tags = sorted(Tag.objects.values_list('thread_count', flat=True), reverse=True)
+        self.assertGreater(tags[0], 4 * tags[len(tags) // 2])
+
+    def test_counters_reconciled(self):
+        self.assertFalse(any(counters.reconcile().values()))
+
+    def test_seed_again(self):
+        seed(scale=0.5)
+        self.assertEqual(Thread.objects.count(), SEED_SIZES['threads'] * 3 // 2)
+        self.assertFalse(any(counters.reconcile().values()))
+
+
+# Benchmark requests run on their own threads and connections, which only see committed rows
+class BenchmarkCommandTests(TransactionTestCase):
+
+    def benchmark(self, **options):
+        stdout = StringIO()
+        options = {'requests': 6, 'concurrency': 2, 'warmup': 1, **options}
+        call_command('benchmark_api', stdout=stdout, stderr=StringIO(), **options)
+        return json.loads(stdout.getvalue())
+
+    def test_empty_database(self):
+        with self.assertRaisesMessage(CommandError, 'seed_forum'):
+            self.benchmark()
+
+    def test_report(self):
+        seed()
+        user = CustomUser.objects.filter(role='student').first()
+        report = self.benchmark(only=['thread-list', 'category-list', 'notification-list'], user=user.email)
+        self.assertEqual(report['user'], user.email)
+        labels = [result['scenario'] for result in report['scenarios']]
+        self.assertIn('notification-list', labels)
+        self.assertIn('thread-list popular', labels)
+        self.assertIn('thread-list long-tail tag', labels)
+        self.assertNotIn('thread-detail-api', labels)
+        for result in report['scenarios']:
+            self.assertEqual(result['statuses'], {'200': 6}, result['scenario'])
+            self.assertLessEqual(result['p50_ms'], result['p95_ms'])
+            self.assertLessEqual(result['p95_ms'], result['p99_ms'])
+            self.assertGreater(result['throughput_rps'], 0)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'before.json')
+            with open(path, 'w') as f:
+                json.dump(report, f)
+            stderr = StringIO()
+            call_command('benchmark_api', requests=2, concurrency=1, warmup=0, only=['category-list'], compare=path,
+                         output=os.path.join(directory, 'after.json'), stderr=stderr)
+            self.assertRegex(stderr.getvalue(), r'category-list .* p50 [+-]\d+% p95 [+-]\d+%')
+            with open(os.path.join(directory, 'after.json')) as f:
+                self.assertEqual([r['scenario'] for r in json.load(f)['scenarios']], ['category-list'])
+
+    def test_every_get_route(self):
+        seed()
+        labels = {result['scenario'] for result in self.benchmark(requests=1, concurrency=1, warmup=0)['scenarios']}
+        self.assertEqual({pattern.name for pattern in get_routes()} - labels, set())
+        self.assertFalse({'thread-events', 'report-events'} & labels)
+
+
+class ExplainQueriesTests(TestCase):
+    """explain_queries flags scans and sorts, and names the index that would serve them"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed()
+
+    def explain(self, **options):
+        stdout, stderr = StringIO(), StringIO()
+        call_command('explain_queries', min_rows=0, stdout=stdout, stderr=stderr, **options)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_report(self):
+        report = json.loads(self.explain(json=True)[0])
+        self.assertEqual(report['database'], connection.vendor)
+        cases = {case['case']: case for case in report['cases']}
+        self.assertLessEqual(
+            {'thread-list latest', 'thread-list popular', 'thread-list busy tag', 'category-detail', 'tag-threads',
+             'thread replies', 'pending reports', 'moderation queue', 'resource list'},
+            set(cases),
+        )
+        self.assertTrue(all(case['plan'] for case in cases.values()))
+        # Sorted on aggregates: flagged, but there is no index to propose
+        self.assertTrue(cases['moderation queue']['findings'])
+        self.assertNotIn('index', cases['moderation queue'])
+
+        only = json.loads(self.explain(json=True, only=['reports'])[0])
+        self.assertEqual({case['case'] for case in only['cases']}, {'pending reports', 'user reports'})
+
+    def test_missing_index_is_proposed(self):
+        proposal = Proposal(Thread, ['-reply_count', 'id'], 'core_thread_replies')
+        self.assertFalse(proposal.exists())
+        self.assertTrue(Proposal(Thread, ['-like_count', '-created_at', 'id'], 'core_thread_popular').exists())
+
+        case = AuditCase('most replied', page(Thread.objects.all(), ('-reply_count', 'id')), proposal)
+        result = Auditor(min_rows=0).audit(case)
+        self.assertEqual([finding['kind'] for finding in result['findings']], ['seq scan', 'sort'])
+        self.assertFalse(result['index_exists'])
+        self.assertIn(
+            "add to Thread.Meta.indexes: models.Index(fields=['-reply_count', 'id'], name='core_thread_replies')",
+            format_result(result),
+        )
+
+    def test_fail_on_findings(self):
+        with self.assertRaisesMessage(CommandError, 'Flagged: '):
+            self.explain(fail_on_findings=True)
+        stdout, stderr = StringIO(), StringIO()
+        call_command('explain_queries', min_rows=10 ** 9, fail_on_findings=True, stdout=stdout, stderr=stderr)
+        self.assertIn('0 of ', stderr.getvalue())
+
+    def test_empty_database(self):
+        Tag.objects.all().delete()
+        with self.assertRaisesMessage(CommandError, 'seed_forum'):
+            self.explain()
+
+    def test_postgres_findings(self):
+        plan = {
+            'Node Type': 'Limit', 'Plan Rows': 21, 'Actual Rows': 21, 'Plans': [{
+                'Node Type': 'Sort', 'Sort Key': ['like_count DESC'], 'Sort Method': 'top-N heapsort',
+                'Plan Rows': 5000, 'Actual Rows': 21, 'Plans': [{
+                    'Node Type': 'Nested Loop', 'Plan Rows': 50, 'Actual Rows': 5000, 'Plans': [
+                        {'Node Type': 'Seq Scan', 'Relation Name': 'core_tag', 'Plan Rows': 1, 'Actual Rows': 1,
+                         'Rows Removed by Filter': 199},
+                        {'Node Type': 'Index Scan', 'Relation Name': 'core_thread', 'Plan Rows': 50, 'Actual Rows': 5000},
+                    ],
+                }],
+            }],
+        }
+        findings = Auditor(min_rows=100, analyze=False).postgres_findings(plan)
+        self.assertEqual(findings, [
+            ('sort', 'Sort on like_count DESC over 5000 rows (top-N heapsort)'),
+            ('seq scan', 'Seq Scan on core_tag (200 rows examined)'),
+            # Reported where the misestimate starts, not again at the Nested Loop above it
+            ('estimate', 'Index Scan on core_thread: planned 50 rows, got 5000'),
+        ])
+
+    def test_sqlite_findings(self):
+        auditor = Auditor(min_rows=100, analyze=False)
+        auditor.sizes = {'core_thread': 5000, 'core_tag': 10}
+        self.assertEqual(
+            auditor.sqlite_findings('2 0 0 SCAN core_thread\n9 0 0 USE TEMP B-TREE FOR ORDER BY'),
+            [('seq scan', 'Full scan of core_thread (5000 rows)'),
+             ('sort', 'Sort without an index (USE TEMP B-TREE FOR ORDER BY, reading up to 5000 rows)')],
+        )
+        self.assertEqual(auditor.sqlite_findings('2 0 0 SCAN core_thread USING INDEX core_thread_popular'), [])
+        self.assertEqual(auditor.sqlite_findings('2 0 0 SCAN core_tag\n9 0 0 USE TEMP B-TREE FOR ORDER BY'), [])
+
+
+class ListIndexTests(TestCase):
+    """Every list ordering has an index the planner uses"""
+
+    INDEXES = {
+        'core_thread_created': (['created_at', 'id'], ['DESC', 'ASC']),
+        'core_thread_popular': (['like_count', 'created_at', 'id'], ['DESC', 'DESC', 'ASC']),
+        'core_thread_pinned': (['is_pinned', 'created_at', 'id'], ['DESC', 'DESC', 'ASC']),
+        'core_thread_category_created': (['category_id', 'created_at', 'id'], ['ASC', 'DESC', 'ASC']),
+        'core_thread_category_popular': (
+            ['category_id', 'like_count', 'created_at', 'id'], ['ASC', 'DESC', 'DESC', 'ASC'],
+        ),
+        'core_thread_category_pinned': (['category_id', 'is_pinned', 'created_at', 'id'], ['ASC', 'DESC', 'DESC', 'ASC']),
+        'core_reply_thread_visible': (['thread_id', 'is_answer', 'created_at', 'id'], ['ASC', 'DESC', 'DESC', 'ASC']),
+        'core_report_pending_created': (['created_at', 'id'], ['DESC', 'ASC']),
+    }
+    PARTIAL = {'core_reply_thread_visible', 'core_report_pending_created'}
+
+    def constraints(self, table):
+        with connection.cursor() as cursor:
+            return connection.introspection.get_constraints(cursor, table)
+
+    def definition(self, name):
+        sql = {
+            'postgresql': 'SELECT indexdef FROM pg_indexes WHERE indexname = %s',
+            'sqlite': 'SELECT sql FROM sqlite_master WHERE name = %s',
+        }[connection.vendor]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [name])
+            return cursor.fetchone()[0]
+
+    def test_schema(self):
+        indexes = {}
+        for table in ('core_thread', 'core_reply', 'core_report'):
+            indexes.update(self.constraints(table))
+        for name, (columns, orders) in self.INDEXES.items():
+            self.assertEqual((indexes[name]['columns'], indexes[name]['orders']), (columns, orders), name)
+            self.assertEqual(' WHERE ' in self.definition(name), name in self.PARTIAL, name)
+        # The category-first composites replace the plain foreign key index
+        self.assertFalse([
+            name for name, c in self.constraints('core_thread').items() if c['index'] and c['columns'] == ['category_id']
+        ])
+
+    def test_plans(self):
+        seed()
+        stdout = StringIO()
+        call_command('explain_queries', min_rows=0, json=True, stdout=stdout, stderr=StringIO())
+        findings = {case['case']: case['findings'] for case in json.loads(stdout.getvalue())['cases']}
+        for case in (
+            'thread-list latest', 'thread-list latest, page 100', 'thread-list popular', 'thread-list category',
+            'thread-list category popular', 'category-detail', 'thread replies', 'pending reports',
+        ):
+            self.assertEqual(findings[case], [], case)
+
+
+class ThreadDetailRepliesTests(APITestCase):
+    """thread_detail embeds one page of replies and hands off to reply_list"""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = CustomUser.objects.create_user(username='author', email='author@example.com', password='x')
+        category = Category.objects.create(name='General', slug='general')
+        cls.thread = Thread.objects.create(category=category, author=author, title='Thread', content='x')
+        cls.replies = [Reply.objects.create(thread=cls.thread, author=author, content=f'R{i}') for i in range(7)]
+        Reply.objects.filter(pk=cls.replies[0].pk).update(is_answer=True)
+        Reply.objects.filter(pk=cls.replies[3].pk).update(is_deleted=True)
+
+    def test_first_page_then_cursor(self):
+        detail = self.client.get(reverse('thread-detail-api', kwargs={'thread_id': self.thread.pk}), {'page_size': 3})
+        data = detail.json()
+        seen = [r['id'] for r in data['replies']]
+        self.assertEqual(len(seen), 3)
+        self.assertEqual(seen[0], self.replies[0].pk)
+        cursor = data['replies_next']
+        while cursor:
+            response = self.client.get(
+                reverse('reply-list', kwargs={'thread_id': self.thread.pk}), {'page_size': 3, 'cursor': cursor}
+            ).json()
+            seen += [r['id'] for r in response['results']]
+            cursor = response['next']
+        newest_first = [r.pk for r in reversed(self.replies[1:]) if r.pk != self.replies[3].pk]
+        self.assertEqual(seen, [self.replies[0].pk] + newest_first)
+
+    def test_query_count_does_not_grow_with_replies(self):
+        url = reverse('thread-detail-api', kwargs={'thread_id': self.thread.pk})
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(url, {'page_size': 3})
+        author_id = self.replies[0].author_id
+        Reply.objects.bulk_create([Reply(thread=self.thread, author_id=author_id, content='more') for _ in range(20)])
+        cache.clear()
+        with CaptureQueriesContext(connection) as after:
+            self.assertEqual(len(self.client.get(url, {'page_size': 3}).json()['replies']), 3)
+        self.assertEqual(len(before), len(after))
+
+
+class PostgresSearchTests(APITestCase):
+    """Thread search against the stored tsvector and the title trigram index"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = CustomUser.objects.create_user(username='author', email='author@example.com', password='x')
+        cls.category = Category.objects.create(name='General', slug='general')
+
+    def setUp(self):
+        patcher = mock.patch('core.search._backend', PostgresSearchBackend())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create(self, title, content='x'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Thread.objects.create(category=self.category, author=self.author, title=title, content=content)
+
+    def search(self, q, **params):
+        response = self.client.get(reverse('thread-list'), {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return [t['id'] for t in response.json()['results']]
+
+    @skipUnless(connection.vendor == 'postgresql', 'PostgreSQL full-text search')
+    def test_vector_follows_title_and_content(self):
+        thread = self.create('Integration by parts', 'worked examples')
+        self.assertEqual(self.search('integration'), [thread.pk])
+        thread.title = 'Eigenvalues'
+        with self.captureOnCommitCallbacks(execute=True):
+            thread.save()
+        self.assertEqual(self.search('integration'), [])
+        self.assertEqual(self.search('eigenvalues'), [thread.pk])
+
+    @skipUnless(connection.vendor == 'postgresql', 'PostgreSQL full-text search')
+    def test_websearch_syntax_and_title_typos(self):
+        notes = self.create('Revision notes', 'exam summary')
+        tips = self.create('Revision tips', 'exam prep')
+        self.assertEqual(self.search('exam -summary'), [tips.pk])
+        self.assertEqual(self.search('"exam prep"'), [tips.pk])
+        self.assertIn(notes.pk, self.search('revison notes'))
+
+    @skipUnless(connection.vendor == 'postgresql', 'PostgreSQL full-text search')
+    def test_relevance_ranks_title_hits_first_across_pages(self):
+        in_content = [self.create(f'Thread {i}', 'matrix rank question') for i in range(3)]
+        in_title = self.create('Matrix rank', 'see title')
+        seen, cursor = [], None
+        while True:
+            response = self.client.get(reverse('thread-list'), {
+                'q': 'matrix rank', 'page_size': 2, **({'cursor': cursor} if cursor else {}),
+            }).json()
+            seen += [t['id'] for t in response['results']]
+            cursor = response['next']
+            if not cursor:
+                break
+        self.assertEqual(seen[0], in_title.pk)
+        self.assertEqual(sorted(seen), sorted([in_title.pk] + [t.pk for t in in_content]))
+
+    def test_unranked_backend_falls_back_to_latest(self):
+        with mock.patch('core.search._backend', SubstringSearchBackend()):
+            older = self.create('Exam notes')
+            newer = self.create('exam tips')
+            self.create('Unrelated')
+            self.assertEqual(self.search('EXAM'), [newer.pk, older.pk])
+            self.assertEqual(self.search('exam', sort='relevance'), [newer.pk, older.pk])
+
+
+class BM25IndexTests(SimpleTestCase):
+
+    def setUp(self):
+        self.index = BM25Index()
+        self.index.add(1, [('matrix rank', 2.0), ('linear algebra', 1.0)])
+        self.index.add(2, [('eigenvalues', 2.0), ('matrix decomposition', 1.0)])
+        self.index.add(3, [('exam notes', 2.0), ('the rank of a matrix', 0.5)])
+
+    def test_weights_order_results(self):
+        self.assertEqual([pk for pk, _ in self.index.search('matrix rank')], [1, 3, 2])
+        self.assertEqual(self.index.search('the of'), [])
+
+    def test_candidates_compete_before_the_limit(self):
+        self.assertEqual([pk for pk, _ in self.index.search('matrix', limit=1)], [1])
+        self.assertEqual([pk for pk, _ in self.index.search('matrix', limit=1, candidates=[2, 3])], [2])
+        self.assertEqual(self.index.search('matrix', candidates=[]), [])
+
+    def test_reindex_and_remove(self):
+        self.index.add(1, [('calculus', 1.0)])
+        self.index.remove(2)
+        self.assertEqual([pk for pk, _ in self.index.search('matrix')], [3])
+        self.index.add(4, [('matrix', 1.0)])
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual({pk for pk, _ in self.index.search('matrix')}, {3, 4})
+
+    def test_snapshot_round_trip(self):
+        self.index.remove(2)
+        self.index.built_at = 1000.0
+        fd, path = tempfile.mkstemp(suffix='.npz')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        self.index.save(path)
+        loaded = BM25Index.load(path)
+        self.assertEqual(loaded.built_at, 1000.0)
+        for query in ('matrix rank', 'exam', 'eigenvalues'):
+            self.assertEqual(loaded.search(query), self.index.search(query))
+        loaded.add(5, [('exam', 3.0)])
+        self.assertEqual(loaded.search('exam')[0][0], 5)
+
+    def test_bulk_build_matches_incremental_adds(self):
+        built = BM25Index.from_documents(iter([
+            (1, [('matrix rank', 2.0), ('linear algebra', 1.0)]),
+            (2, [('eigenvalues', 2.0), ('matrix decomposition', 1.0)]),
+            (9, [('the of', 1.0)]),
+            (3, [('exam notes', 2.0), ('the rank of a matrix', 0.5)]),
+        ]))
+        self.assertEqual(len(built), 3)
+        for query in ('matrix rank', 'exam', 'eigenvalues', 'algebra notes'):
+            self.assertEqual(built.search(query), self.index.search(query))
+        built.remove(1)
+        built.add(4, [('matrix', 1.0)])
+        self.assertEqual({pk for pk, _ in built.search('matrix')}, {2, 3, 4})
+
+
+@override_settings(SEARCH_INDEX_PATH=None, SEARCH_SYNC_INTERVAL=0)
+class BM25SearchTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = CustomUser.objects.create_user(username='author', email='author@example.com', password='x')
+        cls.general = Category.objects.create(name='General', slug='general')
+        cls.exams = Category.objects.create(name='Exams', slug='exams')
+        cls.strong = [
+            Thread.objects.create(category=cls.general, author=cls.author, title=f'Matrix rank {i}', content='matrix')
+            for i in range(3)
+        ]
+        cls.weak = Thread.objects.create(category=cls.exams, author=cls.author, title='Exam', content='a matrix')
+
+    def setUp(self):
+        self.backend = BM25SearchBackend()
+        patcher = mock.patch('core.search._backend', self.backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def search(self, q, **params):
+        response = self.client.get(reverse('thread-list'), {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def ids(self, q, **params):
+        return [t['id'] for t in self.search(q, **params)['results']]
+
+    def test_filters_apply_before_the_result_cap(self):
+        with mock.patch.object(BM25SearchBackend, 'MAX_RESULTS', 2):
+            self.assertEqual(self.ids('matrix', category='exams'), [self.weak.pk])
+            self.assertEqual(len(self.ids('matrix')), 2)
+
+    def test_relevance_pages_walk_the_ranking(self):
+        seen, cursor = [], None
+        with CaptureQueriesContext(connection) as queries:
+            while True:
+                data = self.search('matrix', page_size=1, count=1, **({'cursor': cursor} if cursor else {}))
+                self.assertEqual(data['count'], 4)
+                seen += [t['id'] for t in data['results']]
+                cursor = data['next']
+                if not cursor:
+                    break
+        self.assertEqual(seen[-1], self.weak.pk)
+        self.assertEqual(sorted(seen), sorted([t.pk for t in self.strong] + [self.weak.pk]))
+        self.assertFalse([q for q in queries if 'CASE' in q['sql']])
+        self.assertEqual(self.search('matrix', page=1)['results'][0]['id'], seen[0])
+        for cursor in (encode_cursor(['x', 1]), encode_cursor([1.0, 'x']), encode_cursor([1.0])):
+            response = self.client.get(reverse('thread-list'), {'q': 'matrix', 'cursor': cursor})
+            self.assertEqual(response.status_code, 400)
+
+    def test_index_follows_writes(self):
+        self.assertEqual(self.ids('eigenvalues'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            thread = Thread.objects.create(category=self.general, author=self.author, title='Eigenvalues', content='x')
+        self.assertEqual(self.ids('eigenvalues'), [thread.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            reply = Reply.objects.create(thread=self.weak, author=self.author, content='spectral theorem')
+        self.assertEqual(self.ids('spectral'), [self.weak.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            reply.delete()
+            thread.delete()
+        self.assertEqual(self.ids('spectral'), [])
+        self.assertEqual(self.ids('eigenvalues'), [])
+
+    def test_sync_picks_up_writes_from_other_processes(self):
+        self.backend.index
+        Thread.objects.filter(pk=self.weak.pk).update(title='Determinants', updated_at=timezone.now())
+        self.assertEqual(self.ids('determinants'), [self.weak.pk])
+
+    def test_drops_threads_deleted_by_other_processes(self):
+        self.search('matrix')
+        deleted = self.strong[0].pk
+        # Deleted without the signal, as another worker's delete looks from here
+        with mock.patch.object(self.backend, 'thread_deleted'), self.captureOnCommitCallbacks(execute=True):
+            Thread.objects.filter(pk=deleted).delete()
+        with override_settings(SEARCH_SYNC_INTERVAL=3600):
+            self.assertIn(deleted, self.backend.index)
+            data = self.search('matrix', page_size=2, count=1)
+            self.assertEqual(data['count'], 3)
+            ids = [t['id'] for t in data['results']]
+            ids += [t['id'] for t in self.search('matrix', page_size=2, cursor=data['next'])['results']]
+            self.assertEqual(sorted(ids), sorted([t.pk for t in self.strong[1:]] + [self.weak.pk]))
+            data = self.search('matrix', page=1)
+            self.assertEqual((data['count'], len(data['results'])), (3, 3))
+        self.search('matrix')
+        self.assertNotIn(deleted, self.backend.index)
+        self.assertEqual(len(self.backend.index), 3)
+
+    def test_loads_snapshot(self):
+        fd, path = tempfile.mkstemp(suffix='.npz')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        call_command('build_search_index', path=path, stdout=StringIO())
+        Thread.objects.filter(pk=self.weak.pk).update(title='Determinants')
+        with override_settings(SEARCH_INDEX_PATH=path):
+            backend = BM25SearchBackend()
+            # The snapshot still has the old title until the next sync
+            self.assertEqual(backend.index.search('exam')[0][0], self.weak.pk)
+            self.assertEqual(len(backend.index), 4)
+
+
+class CounterTests(APITestCase):
+    """Category and tag totals kept incrementally must match what reconcile recomputes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = CustomUser.objects.create_user(username='author', email='author@example.com', password='x')
+        cls.general = Category.objects.create(name='General', slug='general')
+        cls.exams = Category.objects.create(name='Exams', slug='exams')
+        cls.algebra = Tag.objects.create(name='Algebra', slug='algebra')
+        cls.calculus = Tag.objects.create(name='Calculus', slug='calculus')
+
+    def setUp(self):
+        self.client.force_login(self.author)
+        response = self.client.post(reverse('thread-create'), {
+            'title': 'Matrices', 'content': 'x', 'category': self.general.pk, 'tags': [self.algebra.pk],
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.thread = Thread.objects.get(pk=response.json()['id'])
+
+    def reply(self):
+        url = reverse('reply-create', kwargs={'thread_id': self.thread.pk})
+        response = self.client.post(url, {'content': 'answer'}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        return Reply.objects.get(pk=response.json()['id'])
+
+    def assertTotals(self, obj, threads, replies):
+        obj.refresh_from_db()
+        self.assertEqual((obj.thread_count, obj.reply_count), (threads, replies))
+
+    def assertReconciled(self):
+        fixed = counters.reconcile()
+        self.assertEqual({model: fixed[model] for model in ('thread', 'category', 'tag')},
+                         {'thread': 0, 'category': 0, 'tag': 0})
+
+    def test_replies(self):
+        first, second, third = self.reply(), self.reply(), self.reply()
+        self.assertTotals(self.general, 1, 3)
+        self.assertTotals(self.algebra, 1, 3)
+
+        first.soft_delete()
+        first.soft_delete()
+        self.assertTotals(self.general, 1, 2)
+        self.assertTotals(self.algebra, 1, 2)
+        self.assertReconciled()
+
+        # Hard-deleting a soft-deleted reply must not count it off twice
+        self.assertEqual(self.client.delete(reverse('reply-delete', kwargs={'reply_id': first.pk})).status_code, 200)
+        self.assertEqual(self.client.delete(reverse('reply-delete', kwargs={'reply_id': second.pk})).status_code, 200)
+        self.assertTotals(self.general, 1, 1)
+        self.assertTotals(self.algebra, 1, 1)
+        self.assertReconciled()
+
+        third.soft_delete()
+        third.restore()
+        self.assertTotals(self.general, 1, 1)
+        self.thread.refresh_from_db()
+        self.assertEqual(self.thread.reply_count, 1)
+        self.assertReconciled()
+
+    def test_move_retag_and_delete(self):
+        self.reply()
+        self.reply()
+        url = reverse('thread-update', kwargs={'thread_id': self.thread.pk})
+        response = self.client.patch(url, {'category': self.exams.pk, 'tags': [self.calculus.pk]},
+                                     content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTotals(self.general, 0, 0)
+        self.assertTotals(self.exams, 1, 2)
+        self.assertTotals(self.algebra, 0, 0)
+        self.assertTotals(self.calculus, 1, 2)
+        self.assertReconciled()
+
+        self.assertEqual(self.client.delete(reverse('thread-delete', kwargs={'thread_id': self.thread.pk})).status_code, 204)
+        self.assertTotals(self.exams, 0, 0)
+        self.assertTotals(self.calculus, 0, 0)
+        self.assertReconciled()
+
+    def test_reconcile_repairs_drift(self):
+        self.reply()
+        Category.objects.filter(pk=self.general.pk).update(reply_count=40, thread_count=0)
+        self.assertEqual(counters.reconcile()['category'], 1)
+        self.assertTotals(self.general, 1, 1)
+
+
+@override_settings(RESPONSE_CACHE_TIMEOUT=300)
+class ResponseCacheTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='author', email='author@example.com', password='x')
+        cls.category = Category.objects.create(name='General', slug='general')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_hit_skips_database(self):
+        first = self.client.get(reverse('category-list'))
+        with self.assertNumQueries(0):
+            second = self.client.get(reverse('category-list'))
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second.json()['results'][0]['slug'], 'general')
+
+    def test_writes_bump_versions(self):
+        self.client.get(reverse('category-list'))
+        self.client.get(reverse('tag-list'))
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='Exams', slug='exams')
+        self.assertEqual([t['slug'] for t in self.client.get(reverse('tag-list')).json()['results']], ['exams'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Thread.objects.create(category=self.category, author=self.user, title='Hello', content='Hi')
+            Category.objects.filter(pk=self.category.pk).update(thread_count=1)
+        self.assertEqual(self.client.get(reverse('category-list')).json()['results'][0]['thread_count'], 1)
+
+
+@override_settings(RESPONSE_CACHE_TIMEOUT=300)
+class ThreadDetailCacheTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = CustomUser.objects.create_user(username='author', email='author@example.com', password='x')
+        cls.reader = CustomUser.objects.create_user(username='reader', email='reader@example.com', password='x')
+        category = Category.objects.create(name='General', slug='general')
+        cls.thread = Thread.objects.create(category=category, author=cls.author, title='Hello', content='Hi')
+        cls.replies = [Reply.objects.create(thread=cls.thread, author=cls.author, content=f'Reply {i}') for i in range(2)]
+        Like.objects.create(user=cls.reader, content_type='reply', reply=cls.replies[0])
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('thread-detail-api', kwargs={'thread_id': self.thread.pk})
+
+    def test_hits_overlay_each_viewers_likes(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            anonymous = self.client.get(self.url).json()
+        self.client.force_login(self.reader)
+        with self.assertNumQueries(3):  # session, user, likes
+            reader = self.client.get(self.url).json()
+        self.assertEqual([r['user_liked'] for r in anonymous['replies']], [False, False])
+        self.assertEqual({r['id']: r['user_liked'] for r in reader['replies']}, {
+            self.replies[0].pk: True, self.replies[1].pk: False,
+        })
+
+    def test_writes_invalidate(self):
+        self.client.force_login(self.reader)
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('thread-like', kwargs={'thread_id': self.thread.pk}))
+        data = self.client.get(self.url).json()
+        self.assertEqual((data['like_count'], data['user_liked']), (1, True))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Reply.objects.create(thread=self.thread, author=self.author, content='Reply 2')
+        self.assertEqual(len(self.client.get(self.url).json()['replies']), 3)
+
+
+class SharedMemoryStoreTests(SimpleTestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, self.path)
+
+    def test_buckets_are_shared_between_mappings(self):
+        # Two mappings of one file stand in for two worker processes
+        first, second = SharedMemoryStore(self.path, 64), SharedMemoryStore(self.path, 64)
+        allowed = [store.consume('throttle_burst_1', 5, 60, 1000.0)[0] for store in (first, second) * 3]
+        self.assertEqual(allowed, [True] * 5 + [False])
+        self.assertTrue(first.consume('throttle_burst_2', 5, 60, 1000.0)[0])
+
+    def test_bucket_refills(self):
+        store = SharedMemoryStore(self.path, 64)
+        for _ in range(5):
+            store.consume('throttle_burst_1', 5, 60, 1000.0)
+        allowed, wait = store.consume('throttle_burst_1', 5, 60, 1000.0)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 12.0)
+        self.assertTrue(store.consume('throttle_burst_1', 5, 60, 1012.0)[0])
+        self.assertFalse(store.consume('throttle_burst_1', 5, 60, 1012.0)[0])
+
+
+ANONYMOUS, STUDENT, MODERATOR = 'anonymous', 'student', 'moderator'
+
+# Routes that never finish a response (event streams) aren't budgeted
+UNBUDGETED = {'thread-events', 'report-events'}
+
+# Route name: (method, {role: (max queries, max response bytes)}).
+# Every call starts with a cold cache, so authenticated budgets include
+# resolving the token's user. Raise a budget only with the change that
+# needs it, and never for a query repeated per row.
+QUERY_BUDGETS = {
+    'token_obtain_pair': ('post', {ANONYMOUS: (1, 1000), STUDENT: (1, 1000), MODERATOR: (1, 1000)}),
+    'token_refresh': ('post', {ANONYMOUS: (2, 500), STUDENT: (2, 500), MODERATOR: (2, 500)}),
+    'user-profile': ('get', {ANONYMOUS: (0, 500), STUDENT: (2, 500), MODERATOR: (2, 500)}),
+    'notification-preferences': ('patch', {ANONYMOUS: (0, 500), STUDENT: (3, 500), MODERATOR: (3, 500)}),
+    'users-list': ('get', {ANONYMOUS: (1, 2000), STUDENT: (2, 2000), MODERATOR: (2, 2000)}),
+    'course-list': ('get', {ANONYMOUS: (1, 2500), STUDENT: (2, 2500), MODERATOR: (2, 2500)}),
+    'course-search': ('get', {ANONYMOUS: (1, 2500), STUDENT: (2, 2500), MODERATOR: (2, 2500)}),
+    'resource-list': ('get', {ANONYMOUS: (1, 5500), STUDENT: (2, 5500), MODERATOR: (2, 5500)}),
+    'resource-upload': ('post', {ANONYMOUS: (0, 500), STUDENT: (3, 500), MODERATOR: (3, 500)}),
+    'resource-rate': ('post', {ANONYMOUS: (0, 500), STUDENT: (9, 500), MODERATOR: (9, 500)}),
+    'resource-ratings': ('get', {ANONYMOUS: (2, 1000), STUDENT: (3, 1000), MODERATOR: (3, 1000)}),
+    'resource-view': ('post', {ANONYMOUS: (0, 500), STUDENT: (3, 500), MODERATOR: (3, 500)}),
+    'category-list': ('get', {ANONYMOUS: (1, 500), STUDENT: (2, 500), MODERATOR: (2, 500)}),
+    'category-detail': ('get', {ANONYMOUS: (3, 5500), STUDENT: (5, 5500), MODERATOR: (5, 5500)}),
+    'tag-list': ('get', {ANONYMOUS: (1, 500), STUDENT: (2, 500), MODERATOR: (2, 500)}),
+    'tag-threads': ('get', {ANONYMOUS: (3, 5500), STUDENT: (5, 5500), MODERATOR: (5, 5500)}),
+    'thread-list': ('get', {ANONYMOUS: (2, 5500), STUDENT: (4, 5500), MODERATOR: (4, 5500)}),
+    'thread-create': ('post', {ANONYMOUS: (0, 500), STUDENT: (10, 500), MODERATOR: (10, 500)}),
+    'thread-detail-api': ('get', {ANONYMOUS: (3, 2000), STUDENT: (5, 2000), MODERATOR: (5, 2000)}),
+    'thread-update': ('patch', {ANONYMOUS: (0, 500), STUDENT: (15, 2000), MODERATOR: (15, 2000)}),
+    'thread-delete': ('delete', {ANONYMOUS: (0, 500), STUDENT: (19, 500), MODERATOR: (19, 500)}),
+    'thread-lock': ('post', {ANONYMOUS: (0, 500), STUDENT: (2, 500), MODERATOR: (11, 500)}),
+    'thread-pin': ('post', {ANONYMOUS: (0, 500), STUDENT: (2, 500), MODERATOR: (11, 500)}),
+    'thread-like': ('post', {ANONYMOUS: (0, 500), STUDENT: (8, 500), MODERATOR: (11, 500)}),
+    'reply-list': ('get', {ANONYMOUS: (2, 1500), STUDENT: (4, 1500), MODERATOR: (4, 1500)}),
+    'reply-create': ('post', {ANONYMOUS: (0, 500), STUDENT: (10, 500), MODERATOR: (15, 500)}),
+    'reply-update': ('patch', {ANONYMOUS: (0, 500), STUDENT: (5, 500), MODERATOR: (5, 500)}),
+    'reply-delete': ('delete', {ANONYMOUS: (0, 500), STUDENT: (12, 500), MODERATOR: (12, 500)}),
+    'reply-like': ('post', {ANONYMOUS: (0, 500), STUDENT: (6, 500), MODERATOR: (9, 500)}),
+    'reply-mark-answer': ('post', {ANONYMOUS: (0, 500), STUDENT: (8, 500), MODERATOR: (4, 500)}),
+    'report-create': ('post', {ANONYMOUS: (0, 500), STUDENT: (3, 500), MODERATOR: (3, 500)}),
+    'report-pending': ('get', {ANONYMOUS: (0, 500), STUDENT: (1, 500), MODERATOR: (2, 1500)}),
+    'report-queue': ('get', {ANONYMOUS: (0, 500), STUDENT: (1, 500), MODERATOR: (5, 1500)}),
+    'moderation-bulk': ('post', {ANONYMOUS: (0, 500), STUDENT: (1, 500), MODERATOR: (4, 500)}),
+    'stream-ticket': ('post', {ANONYMOUS: (0, 500), STUDENT: (1, 500), MODERATOR: (1, 500)}),
+    'report-resolve': ('patch', {ANONYMOUS: (0, 500), STUDENT: (2, 500), MODERATOR: (5, 500)}),
+    'user-reports': ('get', {ANONYMOUS: (0, 500), STUDENT: (3, 500), MODERATOR: (3, 500)}),
+    'notification-list': ('get', {ANONYMOUS: (0, 500), STUDENT: (3, 2500), MODERATOR: (3, 500)}),
+    'notification-unread-count': ('get', {ANONYMOUS: (0, 500), STUDENT: (2, 500), MODERATOR: (2, 500)}),
+    'notification-read-all': ('post', {ANONYMOUS: (0, 500), STUDENT: (5, 500), MODERATOR: (4, 500)}),
+    'notification-read': ('post', {ANONYMOUS: (0, 500), STUDENT: (5, 500), MODERATOR: (4, 500)}),
+}
+
+
+def fingerprint(sql):
+    """SQL with literals and IN lists collapsed, so repeated queries group together"""
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+(?:\.\d+)?\b', '?', sql)
+    return re.sub(r'\(\s*\?(?:\s*,\s*\?)*\s*\)', '(...)', sql)
+
+
+# Views are written through, so the resource-view budget covers its UPDATE
+@override_settings(THROTTLE_STORE='core.throttling.LocalStore', VIEW_COUNT_FLUSH_INTERVAL=0)
+class QueryBudgetTests(APITestCase):
+    """Every API route, as every kind of user, within a declared query and payload budget"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = CustomUser.objects.create_user(username='student', email='student@example.com', password='x')
+        cls.moderator = CustomUser.objects.create_user(
+            username='moderator', email='moderator@example.com', password='x', role='moderator'
+        )
+        others = [
+            CustomUser.objects.create_user(username=f'user{i}', email=f'user{i}@example.com', password='x')
+            for i in range(8)
+        ]
+        people = [cls.student, *others]
+
+        courses = [
+            Course.objects.create(code=f'CS F{i:03d}', title=f'Course {i}', department='CS', semester=i % 2 + 1)
+            for i in range(6)
+        ]
+        resources = [
+            Resource.objects.create(
+                course=courses[i % 6], title=f'Resource {i}', resource_type='LINK',
+                url='https://example.com/', uploaded_by=people[i % 9],
+            )
+            for i in range(20)
+        ]
+        cls.resource = resources[0]
+        for user in others[:5]:
+            ResourceRating.objects.create(resource=cls.resource, user=user, rating=4, review='Useful')
+
+        # Category and tag share a slug so one `slug` argument fits both routes
+        category = Category.objects.create(name='Python', slug='python')
+        tags = [Tag.objects.create(name='python', slug='python'), Tag.objects.create(name='django', slug='django')]
+
+        threads = []
+        for i in range(20):
+            thread = Thread.objects.create(
+                category=category, course=courses[i % 6], author=people[i % 9],
+                title=f'Thread {i}', content=f'Question {i}', is_pinned=i == 0,
+            )
+            thread.tags.set(tags[:i % 2 + 1])
+            threads.append(thread)
+        cls.thread = threads[0]
+        replies = [
+            Reply.objects.create(thread=thread, author=people[(i + j) % 9], content=f'Answer {j}')
+            for i, thread in enumerate(threads) for j in range(5)
+        ]
+        cls.reply = replies[0]
+        Thread.objects.update(reply_count=5)
+
+        for user in people[:6]:
+            Like.objects.create(user=user, content_type='thread', thread=cls.thread)
+            Like.objects.create(user=user, content_type='reply', reply=cls.reply)
+
+        cls.report = Report.objects.create(reporter=others[0], content_type='thread', thread=threads[1], reason='Spam')
+        for user in others[1:4]:
+            Report.objects.create(reporter=user, content_type='reply', reply=replies[6], reason='Rude')
+
+        cls.notification = Notification.objects.create(
+            recipient=cls.student, actor=others[0], kind='reply', thread=cls.thread, message='New reply'
+        )
+        Notification.objects.bulk_create(
+            Notification(recipient=cls.student, actor=user, kind='reply', thread=cls.thread, message='New reply')
+            for user in others
+        )
+        CustomUser.objects.filter(pk=cls.student.pk).update(unread_notification_count=9)
+
+    def route_kwargs(self):
+        return {
+            'thread_id': self.thread.pk,
+            'reply_id': self.reply.pk,
+            'id': self.resource.pk,
+            'slug': 'python',
+            'report_id': self.report.pk,
+            'notification_id': self.notification.pk,
+        }
+
+    def request_data(self, name, role):
+        user = self.student if role == STUDENT else self.moderator
+        refresh = str(ForumTokenObtainPairSerializer.get_token(user))
+        return {
+            'token_obtain_pair': {'email': user.email, 'password': 'x'},
+            'token_refresh': {'refresh': refresh},
+            'notification-preferences': {'email_notifications': 'daily'},
+            'resource-upload': {
+                'course': self.resource.course_id, 'title': 'Notes', 'resource_type': 'LINK', 'url': 'https://example.com/',
+            },
+            'resource-rate': {'rating': 5, 'review': 'Great'},
+            'thread-create': {'title': 'New thread', 'content': 'Body', 'category': self.thread.category_id},
+            'thread-update': {'content': 'Edited'},
+            'reply-create': {'content': 'Another answer'},
+            'reply-update': {'content': 'Edited'},
+            'report-create': {'reason': 'Spam', 'content_type': 'thread', 'thread': self.thread.pk},
+            'moderation-bulk': {'action': 'dismiss', 'report_ids': [self.report.pk]},
+            'report-resolve': {'status': 'resolved', 'resolution_notes': 'Handled'},
+        }.get(name, {})
+
+    def headers(self, role):
+        if role == ANONYMOUS:
+            return {}
+        user = self.student if role == STUDENT else self.moderator
+        access = ForumTokenObtainPairSerializer.get_token(user).access_token
+        return {'HTTP_AUTHORIZATION': f'Bearer {access}'}
+
+    def call(self, name, pattern, method, role):
+        """Run one request in a rolled-back transaction; returns (response, captured queries)"""
+        url = reverse(name, kwargs={key: self.route_kwargs()[key] for key in pattern.pattern.converters})
+        headers = self.headers(role)
+        data = self.request_data(name, role)
+        cache.clear()
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as queries:
+                if method == 'get':
+                    response = self.client.get(url, data, **headers)
+                else:
+                    response = getattr(self.client, method)(url, data, content_type='application/json', **headers)
+            transaction.set_rollback(True)
+        return response, queries
+
+    def assertWithinBudget(self, role):
+        for pattern in urls.urlpatterns:
+            name = pattern.name
+            if name in UNBUDGETED:
+                continue
+            method, budgets = QUERY_BUDGETS[name]
+            max_queries, max_bytes = budgets[role]
+            with self.subTest(route=name, role=role):
+                response, queries = self.call(name, pattern, method, role)
+                self.assertLess(response.status_code, 500)
+                if len(queries) > max_queries:
+                    repeated = Counter(fingerprint(q['sql']) for q in queries).most_common()
+                    self.fail(
+                        f"{method.upper()} {name} as {role}: {len(queries)} queries, budget {max_queries}\n"
+                        + '\n'.join(f"  {count}x {sql[:300]}" for sql, count in repeated)
+                    )
+                self.assertLessEqual(
+                    len(response.content), max_bytes,
+                    f"{method.upper()} {name} as {role}: {len(response.content)} bytes, budget {max_bytes}",
+                )
+
+    def test_every_route_has_a_budget(self):
+        for pattern in urls.urlpatterns:
+            if pattern.name not in UNBUDGETED:
+                self.assertIn(pattern.name, QUERY_BUDGETS, f"Declare a query budget for {pattern.name}")
+
+    def test_anonymous(self):
+        self.assertWithinBudget(ANONYMOUS)
+
+    def test_student(self):
+        self.assertWithinBudget(STUDENT)
+
+    def test_moderator(self):
+        self.assertWithinBudget(MODERATOR)
@@ -0,0 +1,58 @@
+"""
+Viewer-independent thread detail payloads, cached per thread.
+
+thread_detail returns the same JSON to every reader except for `user_liked`
+on the thread and its replies. The shared part is cached under the thread's
+version (a core.response_cache scope), and `overlay_viewer` fills in
+`user_liked` for the requesting user with at most one query, so a hit is
+correct for everyone. Whatever changes the page calls `thread_changed`:
+core.signals does for saves and deletes of threads and replies (edits,
+new replies, lock, pin, mark answer), and likes and bulk moderation, which
+write with set-based UPDATEs, call it themselves.
+
+Author emails and tag or category names shown on the page can lag by up to
+RESPONSE_CACHE_TIMEOUT.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .response_cache import bump, get_versions
+from .viewer import viewer_state
+
+
+def thread_scope(thread_id):
+    return f'thread:{thread_id}'
+
+
+def thread_changed(*thread_ids):
+    """Invalidate the cached detail of `thread_ids` once the transaction commits"""
+    scopes = [thread_scope(pk) for pk in set(thread_ids) if pk]
+    if scopes:
+        transaction.on_commit(lambda: bump(*scopes))
+
+
+def cached_thread_detail(thread_id, page_size, build):
+    """The shared thread detail payload from the cache, or from `build()` on a miss"""
+    timeout = getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 0)
+    if not timeout:
+        return build()
+    # Read the version before the data, so a write committing meanwhile leaves the entry orphaned
+    version, = get_versions([thread_scope(thread_id)])
+    key = f'thread_detail:{thread_id}:{version}:{page_size}'
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data, timeout)
+    return data
+
+
+def overlay_viewer(data, user):
+    """Copy of a shared payload with `user_liked` set for `user`"""
+    replies = data['replies']
+    viewer = viewer_state(user, [data['id']], [reply['id'] for reply in replies])
+    return {
+        **data,
+        'user_liked': data['id'] in viewer.liked_thread_ids,
+        'replies': [{**reply, 'user_liked': reply['id'] in viewer.liked_reply_ids} for reply in replies],
+    }
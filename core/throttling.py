@@ -0,0 +1,203 @@
+"""
+Token-bucket request throttling shared by every worker on a host.
+
+DRF's SimpleRateThrottle keeps a list of request timestamps per client in
+the default cache, which is per process with LocMem (so limits multiply by
+the worker count) and rewrites the whole list on every check. These
+throttles keep one number per client instead: the bucket's theoretical
+arrival time in GCRA form, where a rate of N/period allows a burst of N
+and refills one request every period/N.
+
+Buckets live in THROTTLE_STORE. The default SharedMemoryStore is a fixed
+hash table in an mmap'd file that all processes on the host map, guarded
+by a POSIX record lock. Use CacheStore to share buckets across hosts
+through a shared Django cache, or LocalStore for a single process.
+"""
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from rest_framework.throttling import SimpleRateThrottle
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, one process only
+    fcntl = None
+
+DEFAULT_SHM_PATH = '/dev/shm/studydeck-throttle' if os.path.isdir('/dev/shm') else os.path.join(
+    tempfile.gettempdir(), 'studydeck-throttle'
+)
+
+# (key hash, theoretical arrival time); a zero hash marks an empty slot
+SLOT = struct.Struct('<Qd')
+PROBES = 8
+
+
+def gcra(tat, now, limit, period):
+    """
+    One token-bucket step. Returns (allowed, new_tat, wait): the new
+    theoretical arrival time to store if allowed, else the seconds until
+    the next request would be.
+    """
+    new_tat = max(tat, now) + period / limit
+    if new_tat - now > period:
+        return False, tat, new_tat - now - period
+    return True, new_tat, 0.0
+
+
+class ThrottleStore:
+    def consume(self, key, limit, period, now):
+        """Take one request from `key`'s bucket; returns (allowed, wait)"""
+        raise NotImplementedError
+
+
+class LocalStore(ThrottleStore):
+    """Buckets in a dict; limits hold per process only"""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def consume(self, key, limit, period, now):
+        with self._lock:
+            allowed, tat, wait = gcra(self._buckets.get(key, 0.0), now, limit, period)
+            if allowed:
+                self._buckets[key] = tat
+        return allowed, wait
+
+
+class NullStore(ThrottleStore):
+    """Never throttles; for benchmarks and load tests"""
+
+    def consume(self, key, limit, period, now):
+        return True, 0.0
+
+
+class CacheStore(ThrottleStore):
+    """
+    Buckets in the default cache, for throttling across hosts. The
+    read-modify-write isn't atomic, so concurrent requests from one client
+    can each spend the same token.
+    """
+
+    def consume(self, key, limit, period, now):
+        allowed, tat, wait = gcra(cache.get(key, 0.0), now, limit, period)
+        if allowed:
+            cache.set(key, tat, int(tat - now) + 1)
+        return allowed, wait
+
+
+class SharedMemoryStore(ThrottleStore):
+    """
+    Open-addressed table of THROTTLE_SLOTS buckets in the file at
+    THROTTLE_SHM_PATH (/dev/shm by default). A key lives in one of PROBES
+    slots from its hash; a slot whose bucket has refilled is as good as
+    empty and is reused. If all PROBES slots hold live buckets the one
+    closest to full is evicted, which can only be lenient to its owner.
+    """
+
+    def __init__(self, path=None, slots=None):
+        self.path = path or getattr(settings, 'THROTTLE_SHM_PATH', DEFAULT_SHM_PATH)
+        self.slots = slots or getattr(settings, 'THROTTLE_SLOTS', 65536)
+        size = self.slots * SLOT.size
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+        # Record locks are per process; threads of one process queue here first
+        self._lock = threading.Lock()
+
+    def _slot(self, digest, now):
+        """Offset of `digest`'s slot (claimed if new) and its stored arrival time"""
+        start = digest % self.slots
+        free = evict = None
+        for i in range(PROBES):
+            offset = (start + i) % self.slots * SLOT.size
+            owner, tat = SLOT.unpack_from(self._map, offset)
+            if owner == digest:
+                return offset, tat
+            if free is None and (owner == 0 or tat <= now):
+                free = offset
+            if evict is None or tat < evict[1]:
+                evict = offset, tat
+        return (free if free is not None else evict[0]), 0.0
+
+    def consume(self, key, limit, period, now):
+        digest = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little') or 1
+        with self._lock:
+            if fcntl:
+                fcntl.lockf(self._fd, fcntl.LOCK_EX)
+            try:
+                offset, tat = self._slot(digest, now)
+                allowed, tat, wait = gcra(tat, now, limit, period)
+                if allowed:
+                    SLOT.pack_into(self._map, offset, digest, tat)
+            finally:
+                if fcntl:
+                    fcntl.lockf(self._fd, fcntl.LOCK_UN)
+        return allowed, wait
+
+
+_store = None
+
+
+def get_store():
+    global _store
+    if _store is None:
+        _store = import_string(getattr(settings, 'THROTTLE_STORE', 'core.throttling.SharedMemoryStore'))()
+    return _store
+
+
+@receiver(setting_changed)
+def reset_store(setting, **kwargs):
+    global _store
+    if setting.startswith('THROTTLE_'):
+        _store = None
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """SimpleRateThrottle's rates and keys, checked against a token bucket in THROTTLE_STORE"""
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        key = self.get_cache_key(request, view)
+        if key is None:
+            return True
+        allowed, self.retry_after = get_store().consume(key, self.num_requests, self.duration, self.timer())
+        return allowed
+
+    def wait(self):
+        return self.retry_after
+
+
+class AnonRateThrottle(TokenBucketThrottle):
+    scope = 'anon'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+class UserRateThrottle(TokenBucketThrottle):
+    scope = 'user'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+
+class BurstRateThrottle(UserRateThrottle):
+    scope = 'burst'
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import views, streams
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
@@ -11,6 +11,7 @@ urlpatterns = [
 
     # AUTH & USERS
     path('me/', views.user_profile, name='user-profile'),
+    path('me/notifications/', views.notification_preferences, name='notification-preferences'),
     path('users/', views.users_list, name='users-list'),
     
     # RESOURCES
@@ -39,6 +40,8 @@ urlpatterns = [
     path('threads/<int:thread_id>/like/', views.like_thread, name='thread-like'),
 
     # REPLIES
+    path('threads/<int:thread_id>/replies/', views.reply_list, name='reply-list'),
+    path('threads/<int:thread_id>/events/', streams.thread_events, name='thread-events'),
     path('threads/<int:thread_id>/replies/create/', views.create_reply, name='reply-create'),
     path('replies/<int:reply_id>/update/', views.update_reply, name='reply-update'),
     path('replies/<int:reply_id>/delete/', views.delete_reply, name='reply-delete'),
@@ -48,6 +51,16 @@ urlpatterns = [
     # REPORTS
     path('reports/create/', views.create_report, name='report-create'),
     path('reports/pending/', views.pending_reports, name='report-pending'),
+    path('reports/queue/', views.moderation_queue, name='report-queue'),
+    path('moderation/bulk/', views.bulk_moderate, name='moderation-bulk'),
+    path('reports/events/', streams.moderation_events, name='report-events'),
+    path('streams/ticket/', views.stream_ticket, name='stream-ticket'),
     path('reports/<int:report_id>/resolve/', views.resolve_report, name='report-resolve'),
     path('my-reports/', views.user_reports, name='user-reports'),
+
+    # NOTIFICATIONS
+    path('notifications/', views.notification_list, name='notification-list'),
+    path('notifications/unread_count/', views.unread_notification_count, name='notification-unread-count'),
+    path('notifications/read_all/', views.mark_all_notifications_read, name='notification-read-all'),
+    path('notifications/<int:notification_id>/read/', views.mark_notification_read, name='notification-read'),
 ]
\ No newline at end of file
@@ -1,49 +1,42 @@
 import re
-from django.core.mail import send_mail
-from django.conf import settings
-from .models import CustomUser
+from .models import CustomUser, Notification
+from .digests import notify_user, notify_users
+from .notifications import notify, notify_each
+from .outbox import enqueue_email
 
 def send_async_mail(subject, message, recipient_list):
-    """Wrapper to send mail (Console for now, SMTP later)"""
+    """
+    Queue mail in the outbox; `manage.py send_outbox` delivers it.
+    Call inside the transaction that writes the post so both commit together.
+    """
     if not recipient_list:
         return
-    
-    try:
-        send_mail(
-            subject=subject,
-            message=message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=recipient_list,
-            fail_silently=True
-        )
-        print(f"Email sent to: {recipient_list}")
-    except Exception as e:
-        print(f"Email Failed: {e}")
+    enqueue_email(subject, message, recipient_list)
 
 def notify_mentions(content, sender, thread, context_url):
     """
-    Parses content for @username and sends emails.
+    Parses content for @username and notifies each mentioned user.
     """
     mentioned_usernames = set(re.findall(r'@(\w+)', content))
     
     if not mentioned_usernames:
         return
 
-    users_to_notify = CustomUser.objects.filter(
+    users_to_notify = list(CustomUser.objects.filter(
         username__in=mentioned_usernames
-    ).exclude(id=sender.id)
+    ).exclude(id=sender.id))
+    notify(users_to_notify, 'mention', f"{sender.username} mentioned you in {thread.title}", thread, sender)
 
-    emails = [u.email for u in users_to_notify]
-    if emails:
-        subject = f"You were mentioned in: {thread.title}"
-        message = (
-            f"Hello,\n\n"
-            f"{sender.username} mentioned you in a post on StudyDeck.\n\n"
-            f"Thread: {thread.title}\n"
-            f"Snippet: \"{content[:100]}...\"\n\n"
-            f"View here: http://127.0.0.1:8000/thread/{thread.id}/"
-        )
-        send_async_mail(subject, message, emails)
+    subject = f"You were mentioned in: {thread.title}"
+    message = (
+        f"Hello,\n\n"
+        f"{sender.username} mentioned you in a post on StudyDeck.\n\n"
+        f"Thread: {thread.title}\n"
+        f"Snippet: \"{content[:100]}...\"\n\n"
+        f"View here: http://127.0.0.1:8000/thread/{thread.id}/"
+    )
+    for user in users_to_notify:
+        notify_user(user, thread, 'mention', subject, message)
 
 def notify_thread_reply(thread, replier, content):
     """
@@ -59,19 +52,34 @@ def notify_thread_reply(thread, replier, content):
         f"Reply: \"{content[:100]}...\"\n\n"
         f"Check it out: http://127.0.0.1:8000/thread/{thread.id}/"
     )
-    send_async_mail(subject, message, [thread.author.email])
+    notify([thread.author], 'reply', f"{replier.username} replied to {thread.title}", thread, replier)
+    notify_user(thread.author, thread, 'reply', subject, message)
 
 def notify_thread_status(thread, action, moderator):
     """
     Notify author if their thread is Locked or Pinned.
     """
-    if thread.author == moderator:
-        return
+    notify_threads_status([thread], action, moderator)
 
-    subject = f"Your thread has been {action}"
-    message = (
-        f"Hello {thread.author.username},\n\n"
-        f"A moderator ({moderator.username}) has {action} your thread: '{thread.title}'.\n\n"
-        f"View status: http://127.0.0.1:8000/thread/{thread.id}/"
-    )
-    send_async_mail(subject, message, [thread.author.email])
\ No newline at end of file
+def notify_threads_status(threads, action, moderator):
+    """
+    Batch of notify_thread_status for many threads (bulk moderation).
+    """
+    in_app, emails = [], []
+    for thread in threads:
+        if thread.author == moderator:
+            continue
+
+        subject = f"Your thread has been {action}"
+        message = (
+            f"Hello {thread.author.username},\n\n"
+            f"A moderator ({moderator.username}) has {action} your thread: '{thread.title}'.\n\n"
+            f"View status: http://127.0.0.1:8000/thread/{thread.id}/"
+        )
+        in_app.append(Notification(
+            recipient=thread.author, actor=moderator, kind='status', thread=thread,
+            message=f"{moderator.username} {action.lower()} {thread.title}",
+        ))
+        emails.append((thread.author, thread, 'status', subject, message))
+    notify_each(in_app)
+    notify_users(emails)
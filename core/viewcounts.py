@@ -0,0 +1,102 @@
+"""
+Write-behind buffer for Resource.view_count.
+
+Views are counted in process memory and applied every
+VIEW_COUNT_FLUSH_INTERVAL seconds as one relative UPDATE per batch
+(`view_count = view_count + CASE id WHEN ... END`), plus a final flush when
+the worker exits. Between flushes the stored column lags; callers get an
+estimate of stored value + this process's pending views. Setting the
+interval to 0 writes every view straight through.
+"""
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Case, F, IntegerField, Value, When
+
+logger = logging.getLogger(__name__)
+
+FLUSH_BATCH_SIZE = 500
+
+
+class ViewCountBuffer:
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._flusher = None
+
+    @property
+    def interval(self):
+        return getattr(settings, 'VIEW_COUNT_FLUSH_INTERVAL', 10)
+
+    def record(self, resource_id, views=1):
+        """
+        Count `views` for a resource. Returns how many views to add to a
+        view_count loaded before this call to estimate the current total.
+        """
+        if self.interval <= 0:
+            self._apply({resource_id: views})
+            return views
+        with self._lock:
+            pending = self._pending[resource_id] = self._pending.get(resource_id, 0) + views
+        self._ensure_flusher()
+        return pending
+
+    def pending(self, resource_id):
+        with self._lock:
+            return self._pending.get(resource_id, 0)
+
+    def flush(self):
+        """Apply all buffered views; returns the number of resources updated"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            self._apply(pending)
+        except Exception:
+            logger.exception("View count flush failed; keeping %d resources buffered", len(pending))
+            with self._lock:
+                for resource_id, views in pending.items():
+                    self._pending[resource_id] = self._pending.get(resource_id, 0) + views
+            return 0
+        return len(pending)
+
+    def _apply(self, pending):
+        from .models import Resource
+
+        items = list(pending.items())
+        for start in range(0, len(items), FLUSH_BATCH_SIZE):
+            batch = items[start:start + FLUSH_BATCH_SIZE]
+            delta = Case(
+                *[When(pk=resource_id, then=Value(views)) for resource_id, views in batch],
+                output_field=IntegerField(),
+            )
+            Resource.objects.filter(pk__in=[resource_id for resource_id, _ in batch]).update(
+                view_count=F('view_count') + delta
+            )
+
+    def _ensure_flusher(self):
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._run, name='view-count-flusher', daemon=True)
+                self._flusher.start()
+
+    def _run(self):
+        while not self._wakeup.wait(self.interval):
+            self.flush()
+            # This thread owns its own DB connection; don't keep it open between flushes
+            connections.close_all()
+
+    def shutdown(self):
+        self._wakeup.set()
+        self.flush()
+
+
+view_buffer = ViewCountBuffer()
+atexit.register(view_buffer.shutdown)
@@ -0,0 +1,54 @@
+from django.db.models import Q
+
+from .models import Like, Thread, Reply
+
+
+class ViewerState:
+    """
+    Per-request state of the requesting user, resolved once per page.
+
+    Serializers look up `user_liked` here instead of querying Like per object.
+    """
+
+    def __init__(self, liked_thread_ids=(), liked_reply_ids=()):
+        self.liked_thread_ids = set(liked_thread_ids)
+        self.liked_reply_ids = set(liked_reply_ids)
+
+    def has_liked(self, obj):
+        if isinstance(obj, Thread):
+            return obj.pk in self.liked_thread_ids
+        if isinstance(obj, Reply):
+            return obj.pk in self.liked_reply_ids
+        return False
+
+
+def load_viewer_state(request, threads=(), replies=()):
+    """Load the user's likes for every thread and reply on the page in one query"""
+    return viewer_state(getattr(request, 'user', None), [t.pk for t in threads], [r.pk for r in replies])
+
+
+def viewer_state(user, thread_ids=(), reply_ids=()):
+    """load_viewer_state for ids, e.g. of a cached page"""
+    if not (user and user.is_authenticated) or not (thread_ids or reply_ids):
+        return ViewerState()
+
+    condition = Q()
+    if thread_ids:
+        condition |= Q(content_type='thread', thread_id__in=thread_ids)
+    if reply_ids:
+        condition |= Q(content_type='reply', reply_id__in=reply_ids)
+
+    liked_threads, liked_replies = set(), set()
+    for content_type, thread_id, reply_id in Like.objects.filter(condition, user=user).values_list(
+        'content_type', 'thread_id', 'reply_id'
+    ):
+        if content_type == 'thread':
+            liked_threads.add(thread_id)
+        else:
+            liked_replies.add(reply_id)
+    return ViewerState(liked_threads, liked_replies)
+
+
+def viewer_context(request, threads=(), replies=()):
+    """Serializer context carrying the request and the preloaded ViewerState"""
+    return {'request': request, 'viewer': load_viewer_state(request, threads, replies)}
@@ -1,56 +1,126 @@
 
 from .utils import notify_mentions, notify_thread_reply, notify_thread_status # <--- ADD THIS
 from rest_framework.decorators import api_view, permission_classes, authentication_classes, throttle_classes
-from rest_framework.permissions import IsAuthenticated, AllowAny
-from rest_framework.throttling import UserRateThrottle, AnonRateThrottle
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from rest_framework.response import Response
 from rest_framework import status
 from django.shortcuts import get_object_or_404
-from django.db.models import Q, Count
+from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import Q
 from django.utils import timezone
 from django.core.mail import send_mail
 from django.conf import settings
-from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework.authentication import SessionAuthentication, BasicAuthentication
 
-
-# Postgres Specific Search
-from django.contrib.postgres.search import TrigramSimilarity
-
 from .models import (
     CustomUser, Course, Resource, ResourceRating,
-    Category, Tag, Thread, Reply, Like, Report
+    Category, Tag, Thread, Reply, Like, Report, Notification
 )
 from .serializers import (
-    CustomUserSerializer, CourseSerializer, ResourceSerializer, ResourceRatingSerializer,
+    CustomUserSerializer, NotificationPreferencesSerializer, CourseSerializer, ResourceSerializer, ResourceRatingSerializer,
     CategorySerializer, TagSerializer, ThreadListSerializer, ThreadDetailSerializer,
     ThreadCreateSerializer, ReplySerializer, LikeSerializer, ReportSerializer,
-    ReportCreateSerializer, ReportUpdateSerializer
+    ReportCreateSerializer, ReportUpdateSerializer, NotificationSerializer, ModerationGroupSerializer,
+    BulkModerationSerializer, reply_page
+)
+from .pagination import InvalidCursor, paginate_keyset, paginate_ranked, get_page_size, wants_total
+from .authentication import CachedJWTAuthentication
+from .throttling import BurstRateThrottle
+from .metrics import registry
+from .response_cache import versioned_response
+from .thread_cache import cached_thread_detail, overlay_viewer
+from .viewer import ViewerState, viewer_context
+from . import counters
+from .likes import toggle_thread_like, toggle_reply_like
+from . import ratings
+from . import notifications
+from .events import publish, thread_channel, MODERATION_CHANNEL
+from .streams import issue_stream_ticket
+from .moderation import queue_page, apply_bulk_action
+from .search import search_threads, rank_threads, is_ranked, RELEVANCE_ORDERING
+
+# Keyset orderings; each ends on the primary key so cursors are unambiguous
+PINNED_ORDERING = ('-is_pinned', '-created_at', 'id')
+LATEST_ORDERING = ('-created_at', 'id')
+POPULAR_ORDERING = ('-like_count', '-created_at', 'id')
+COURSE_ORDERING = ('code', 'id')
+RESOURCE_ORDERING = ('-created_at', 'id')
+USER_ORDERING = ('id',)
+
+# Columns ResourceSerializer reads, so catalog pages skip unused user/course data
+RESOURCE_LIST_FIELDS = (
+    'id', 'course', 'course__code', 'title', 'description', 'resource_type', 'file', 'url',
+    'uploaded_by', 'uploaded_by__email', 'view_count', 'created_at', 'rating_sum', 'rating_count',
+    'rating_1_count', 'rating_2_count', 'rating_3_count', 'rating_4_count', 'rating_5_count',
 )
-class BurstRateThrottle(UserRateThrottle):
-    scope = 'burst'
+
+
+def cursor_page(request, queryset, ordering, serializer_class):
+    """One keyset page of `queryset` serialized with `serializer_class`"""
+    page, next_cursor = paginate_keyset(
+        queryset, ordering, request.query_params.get('cursor'), get_page_size(request)
+    )
+    data = {'next': next_cursor, 'results': serializer_class(page, many=True).data}
+    if wants_total(request):
+        data['count'] = queryset.count()
+    return data
 
 
 @api_view(['GET'])
-@authentication_classes([JWTAuthentication, SessionAuthentication])
+@authentication_classes([CachedJWTAuthentication, SessionAuthentication])
 @permission_classes([IsAuthenticated])
 def user_profile(request):
-    serializer = CustomUserSerializer(request.user)
+    # request.user only has the fields authentication caches; load the profile in one query
+    user = CustomUser.objects.only(*CustomUserSerializer.Meta.fields).get(pk=request.user.pk)
+    serializer = CustomUserSerializer(user)
     return Response(serializer.data)
 
+@api_view(['GET', 'PATCH'])
+@authentication_classes([CachedJWTAuthentication, SessionAuthentication])
+@permission_classes([IsAuthenticated])
+def notification_preferences(request):
+    """Email notifications: instant, hourly or daily digest, or off"""
+    # Load (and on save, write) only this column, never cached authentication fields
+    user = CustomUser.objects.only('id', 'email_notifications').get(pk=request.user.pk)
+    if request.method == 'GET':
+        return Response(NotificationPreferencesSerializer(user).data)
+    serializer = NotificationPreferencesSerializer(user, data=request.data, partial=True)
+    if serializer.is_valid():
+        serializer.save()
+        return Response(serializer.data)
+    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def users_list(request):
-    users = CustomUser.objects.all()
-    serializer = CustomUserSerializer(users, many=True)
-    return Response(serializer.data)
+    users = CustomUser.objects.only(*CustomUserSerializer.Meta.fields)
+    try:
+        data = cursor_page(request, users, USER_ORDERING, CustomUserSerializer)
+    except InvalidCursor as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(data)
+
+def filter_courses(request, courses):
+    """Filters shared by the course catalog endpoints"""
+    department = request.GET.get('department', '')
+    semester = request.GET.get('semester', '')
+    if department:
+        courses = courses.filter(department=department)
+    if semester:
+        courses = courses.filter(semester=semester)
+    return courses
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@versioned_response('course')
 def course_list(request):
-    courses = Course.objects.filter(is_active=True)
-    serializer = CourseSerializer(courses, many=True)
-    return Response(serializer.data)
+    try:
+        courses = filter_courses(request, Course.objects.filter(is_active=True))
+        data = cursor_page(request, courses, COURSE_ORDERING, CourseSerializer)
+    except (InvalidCursor, ValueError) as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(data)
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
@@ -60,21 +130,36 @@ def search_courses(request):
         Q(code__icontains=query) | Q(title__icontains=query),
         is_active=True,
     )
-    serializer = CourseSerializer(courses, many=True)
-    return Response(serializer.data)
+    try:
+        data = cursor_page(request, filter_courses(request, courses), COURSE_ORDERING, CourseSerializer)
+    except (InvalidCursor, ValueError) as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(data)
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def resource_list(request):
     course_code = request.GET.get('course', '')
-    resources = Resource.objects.all()
+    department = request.GET.get('department', '')
+    resource_type = request.GET.get('resource_type', '')
+    semester = request.GET.get('semester', '')
+    resources = Resource.objects.select_related('course', 'uploaded_by').only(*RESOURCE_LIST_FIELDS)
     if course_code:
         resources = resources.filter(course__code=course_code)
-    serializer = ResourceSerializer(resources, many=True)
-    return Response(serializer.data)
+    if department:
+        resources = resources.filter(course__department=department)
+    if resource_type:
+        resources = resources.filter(resource_type=resource_type)
+    try:
+        if semester:
+            resources = resources.filter(course__semester=semester)
+        data = cursor_page(request, resources, RESOURCE_ORDERING, ResourceSerializer)
+    except (InvalidCursor, ValueError) as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(data)
 
 @api_view(['POST'])
-@authentication_classes([JWTAuthentication, SessionAuthentication])
+@authentication_classes([CachedJWTAuthentication, SessionAuthentication])
 @permission_classes([IsAuthenticated])
 def upload_resource(request):
     serializer = ResourceSerializer(data=request.data)
@@ -84,49 +169,97 @@ def upload_resource(request):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 @api_view(['POST'])
-@authentication_classes([JWTAuthentication, SessionAuthentication])
+@authentication_classes([CachedJWTAuthentication, SessionAuthentication])
 @permission_classes([IsAuthenticated])
 def rate_resource(request, id):
-    resource = get_object_or_404(Resource, pk=id)
+    """Create or replace the user's rating (one per user and resource)"""
+    resource = get_object_or_404(Resource.objects.only('pk'), pk=id)
     serializer = ResourceRatingSerializer(data=request.data)
     if serializer.is_valid():
-        serializer.save(user=request.user, resource=resource)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        rating, created = ratings.rate_resource(
+            resource, request.user, serializer.validated_data['rating'], serializer.validated_data.get('review')
+        )
+        return Response(
+            ResourceRatingSerializer(rating).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def resource_ratings(request, id):
-    resource = get_object_or_404(Resource, pk=id)
-    ratings = resource.ratings.all()
-    serializer = ResourceRatingSerializer(ratings, many=True)
+    resource = get_object_or_404(Resource.objects.only('pk'), pk=id)
+    serializer = ResourceRatingSerializer(resource.ratings.select_related('user'), many=True)
     return Response(serializer.data)
 
 @api_view(['POST'])
-@authentication_classes([JWTAuthentication, SessionAuthentication])
+@authentication_classes([CachedJWTAuthentication, SessionAuthentication])
 @permission_classes([IsAuthenticated])
 def increment_view_count(request, id):
-    resource = get_object_or_404(Resource, pk=id)
+    resource = get_object_or_404(Resource.objects.only('pk', 'view_count'), pk=id)
     resource.increment_view_count()
     return Response({'view_count': resource.view_count})
 
+def with_list_relations(threads):
+    """Everything ThreadListSerializer touches, loaded in a fixed number of queries"""
+    return threads.select_related('author', 'category').prefetch_related('tags').defer('search_vector')
+
+def thread_cursor_page(request, threads, ordering):
+    """One keyset page of threads; `count` is only computed when asked for"""
+    page, next_cursor = paginate_keyset(
+        with_list_relations(threads), ordering, request.query_params.get('cursor'), get_page_size(request)
+    )
+    serializer = ThreadListSerializer(page, many=True, context=viewer_context(request, threads=page))
+    data = {'next': next_cursor, 'results': serializer.data}
+    if wants_total(request):
+        data['count'] = threads.count()
+    return data
+
+def ranked_threads(threads, hits):
+    """The threads of `hits` ([(pk, score), ...]) in that order, each with its `rank`"""
+    by_pk = {thread.pk: thread for thread in with_list_relations(threads.filter(pk__in=[pk for pk, _ in hits]))}
+    page = []
+    for pk, score in hits:
+        if pk in by_pk:
+            by_pk[pk].rank = score
+            page.append(by_pk[pk])
+    return page
+
+def ranked_cursor_page(request, threads, hits):
+    """thread_cursor_page for a ranking made outside the database, paged in Python"""
+    page_hits, next_cursor = paginate_ranked(hits, request.query_params.get('cursor'), get_page_size(request))
+    page = ranked_threads(threads, page_hits)
+    serializer = ThreadListSerializer(page, many=True, context=viewer_context(request, threads=page))
+    data = {'next': next_cursor, 'results': serializer.data}
+    if wants_total(request):
+        data['count'] = len(hits)
+    return data
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@versioned_response('category')
 def category_list(request):
-    categories = Category.objects.annotate(thread_count=Count('threads'))
-    serializer = CategorySerializer(categories, many=True)
-    return Response({'count': categories.count(), 'results': serializer.data})
+    serializer = CategorySerializer(Category.objects.all(), many=True)
+    return Response({'count': len(serializer.data), 'results': serializer.data})
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def category_detail(request, slug):
     category = get_object_or_404(Category, slug=slug)
+    if 'page' not in request.query_params:
+        try:
+            data = thread_cursor_page(request, category.threads.all(), PINNED_ORDERING)
+        except InvalidCursor as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'category': CategorySerializer(category).data, **data})
+
+    # Legacy page-number mode (OFFSET + COUNT)
     page = int(request.query_params.get('page', 1))
     page_size = 10
     start = (page - 1) * page_size
     end = start + page_size
-    threads = category.threads.all()[start:end]
-    serializer = ThreadListSerializer(threads, many=True, context={'request': request})
+    threads = list(with_list_relations(category.threads.all())[start:end])
+    serializer = ThreadListSerializer(threads, many=True, context=viewer_context(request, threads=threads))
     total = category.threads.count()
     total_pages = (total + page_size - 1) // page_size
     return Response({
@@ -137,58 +270,84 @@ def category_detail(request, slug):
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@versioned_response('tag')
 def tag_list(request):
-    tags = Tag.objects.all()
-    serializer = TagSerializer(tags, many=True)
-    return Response({'count': tags.count(), 'results': serializer.data})
+    serializer = TagSerializer(Tag.objects.all(), many=True)
+    return Response({'count': len(serializer.data), 'results': serializer.data})
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def tag_threads(request, slug):
     tag = get_object_or_404(Tag, slug=slug)
-    threads = tag.threads.all()
-    serializer = ThreadListSerializer(threads, many=True, context={'request': request})
-    return Response({'tag': TagSerializer(tag).data, 'results': serializer.data})
-
-@api_view(['GET'])
-@permission_classes([AllowAny])
-def thread_list(request):
-    """List threads with Fuzzy Search & Sorting"""
-    search_query = request.query_params.get('q', '')
-    category = request.query_params.get('category', '')
-    tag_slug = request.query_params.get('tag', '')
-    sort_by = request.query_params.get('sort', 'latest') # 'latest' or 'popular'
+    try:
+        data = thread_cursor_page(request, tag.threads.all(), PINNED_ORDERING)
+    except InvalidCursor as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'tag': TagSerializer(tag).data, **data})
+
+def filter_threads(params):
+    """
+    The (queryset, ordering, hits) thread_list serves for these query
+    parameters. `hits` is the backend's [(pk, score), ...] ranking when it
+    ranks outside the database, and relevance pages are then cut from it.
+    """
+    search_query = params.get('q', '')
+    category = params.get('category', '')
+    tag_slug = params.get('tag', '')
+    sort_by = params.get('sort', 'relevance' if search_query else 'latest') # 'latest', 'popular' or 'relevance'
     
     threads = Thread.objects.all()
     
-    if search_query:
-        try:
-            threads = threads.annotate(
-                similarity=TrigramSimilarity('title', search_query) + TrigramSimilarity('content', search_query)
-            ).filter(similarity__gt=0.1).order_by('-similarity')
-        except Exception:
-            threads = threads.filter(Q(title__icontains=search_query) | Q(content__icontains=search_query))
-    
     if category:
         threads = threads.filter(category__slug=category)
     if tag_slug:
         threads = threads.filter(tags__slug=tag_slug)
+
+    # After the filters, so a capped ranking only holds threads that pass them
+    hits = None
+    if search_query:
+        hits = rank_threads(threads, search_query)
+        if hits is None:
+            threads = search_threads(threads, search_query)
+        else:
+            threads = threads.filter(pk__in=[pk for pk, _ in hits])
         
     # 2. Sorting Logic
     if sort_by == 'popular':
-        threads = threads.order_by('-like_count', '-created_at')
+        ordering = POPULAR_ORDERING
+    elif sort_by == 'relevance' and (hits is not None or is_ranked(threads)):
+        ordering = RELEVANCE_ORDERING
     else:
-        threads = threads.order_by('-created_at')
+        ordering = LATEST_ORDERING
+    return threads, ordering, hits if ordering == RELEVANCE_ORDERING else None
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def thread_list(request):
+    """List threads with Full-Text Search & Sorting"""
+    threads, ordering, hits = filter_threads(request.query_params)
+
+    # Cursor pagination unless the client asks for a page number
+    if 'page' not in request.query_params:
+        try:
+            if hits is not None:
+                return Response(ranked_cursor_page(request, threads, hits))
+            return Response(thread_cursor_page(request, threads, ordering))
+        except InvalidCursor as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-    # Pagination
     page = int(request.query_params.get('page', 1))
     page_size = 10
     start = (page - 1) * page_size
     end = start + page_size
-    total = threads.count()
-    threads_page = threads[start:end]
+    if hits is not None:
+        total = len(hits)
+        threads_page = ranked_threads(threads, hits[start:end])
+    else:
+        total = threads.count()
+        threads_page = list(with_list_relations(threads.order_by(*ordering))[start:end])
     
-    serializer = ThreadListSerializer(threads_page, many=True, context={'request': request})
+    serializer = ThreadListSerializer(threads_page, many=True, context=viewer_context(request, threads=threads_page))
     total_pages = (total + page_size - 1) // page_size
     
     return Response({
@@ -199,12 +358,33 @@ def thread_list(request):
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def thread_detail(request, thread_id):
-    thread = get_object_or_404(Thread, pk=thread_id)
-    serializer = ThreadDetailSerializer(thread, context={'request': request})
-    return Response(serializer.data)
+    page_size = get_page_size(request)
+
+    def build():
+        thread = get_object_or_404(
+            Thread.objects.select_related('author', 'category').defer('search_vector').prefetch_related('tags'),
+            pk=thread_id,
+        )
+        # Shared by every reader; overlay_viewer adds their likes
+        context = {'request': request, 'viewer': ViewerState(), 'reply_page': reply_page(thread, page_size=page_size)}
+        return ThreadDetailSerializer(thread, context=context).data
+
+    return Response(overlay_viewer(cached_thread_detail(thread_id, page_size, build), request.user))
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def reply_list(request, thread_id):
+    """Cursor-paginated replies of a thread (continues from `replies_next`)"""
+    thread = get_object_or_404(Thread.objects.only('pk'), pk=thread_id)
+    try:
+        replies, next_cursor = reply_page(thread, request.query_params.get('cursor'), get_page_size(request))
+    except InvalidCursor as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    serializer = ReplySerializer(replies, many=True, context=viewer_context(request, replies=replies))
+    return Response({'next': next_cursor, 'results': serializer.data})
 
 @api_view(['POST'])
-@authentication_classes([JWTAuthentication, SessionAuthentication]) # <--- ADDED SessionAuthentication
+@authentication_classes([CachedJWTAuthentication, SessionAuthentication]) # <--- ADDED SessionAuthentication
 @permission_classes([IsAuthenticated])
 @throttle_classes([BurstRateThrottle])
 def create_thread(request):
@@ -212,13 +392,14 @@ def create_thread(request):
     # ... keep your existing logic ...
     serializer = ThreadCreateSerializer(data=request.data)
     if serializer.is_valid():
-        thread = serializer.save(author=request.user)
-        notify_mentions(thread.content, request.user, thread, f"/thread/{thread.id}/")
+        with transaction.atomic():
+            thread = serializer.save(author=request.user)
+            notify_mentions(thread.content, request.user, thread, f"/thread/{thread.id}/")
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 @api_view(['POST'])
-@authentication_classes([JWTAuthentication, SessionAuthentication])
+@authentication_classes([CachedJWTAuthentication, SessionAuthentication])
 @permission_classes([IsAuthenticated])
 @throttle_classes([BurstRateThrottle])
 def create_reply(request, thread_id):
@@ -230,27 +411,36 @@ def create_reply(request, thread_id):
         
         serializer = ReplySerializer(data=request.data)
         if serializer.is_valid():
-            reply = serializer.save(author=request.user, thread=thread)
-            
-            # Update count
-            thread.reply_count += 1
-            thread.save(update_fields=['reply_count'])
-            
-            # --- NOTIFICATION LOGIC ---
-            # 1. Notify Thread Author
-            notify_thread_reply(thread, request.user, reply.content)
-            
-            # 2. Notify anyone mentioned in the reply (@username)
-            notify_mentions(reply.content, request.user, thread, f"/thread/{thread.id}/")
-            # --------------------------
+            with transaction.atomic():
+                reply = serializer.save(author=request.user, thread=thread)
+
+                # Update count
+                thread.reply_count += 1
+                thread.save(update_fields=['reply_count'])
+                counters.thread_activity(thread, replies=1)
+
+                # --- NOTIFICATION LOGIC (queued in the outbox with the reply) ---
+                # 1. Notify Thread Author
+                notify_thread_reply(thread, request.user, reply.content)
+
+                # 2. Notify anyone mentioned in the reply (@username)
+                notify_mentions(reply.content, request.user, thread, f"/thread/{thread.id}/")
+                # --------------------------
+
+                publish(thread_channel(thread.id), 'reply', {
+                    'reply': ReplySerializer(reply).data, 'reply_count': thread.reply_count,
+                })
 
             return Response(ReplySerializer(reply, context={'request': request}).data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+def publish_thread_status(thread):
+    publish(thread_channel(thread.id), 'status', {'is_locked': thread.is_locked, 'is_pinned': thread.is_pinned})
+
 @api_view(['POST'])
-@authentication_classes([JWTAuthentication, SessionAuthentication])
+@authentication_classes([CachedJWTAuthentication, SessionAuthentication])
 @permission_classes([IsAuthenticated])
 def lock_thread(request, thread_id):
     """Lock + Notify"""
@@ -258,14 +448,16 @@ def lock_thread(request, thread_id):
     if not request.user.is_moderator():
         return Response({'error': 'Only moderators can lock threads'}, status=status.HTTP_403_FORBIDDEN)
     
-    thread.lock_thread()
-    # Notify Author
-    notify_thread_status(thread, "LOCKED", request.user)
+    with transaction.atomic():
+        thread.lock_thread()
+        # Notify Author
+        notify_thread_status(thread, "LOCKED", request.user)
+        publish_thread_status(thread)
     
     return Response({'message': 'Thread locked'}, status=status.HTTP_200_OK)
 
 @api_view(['POST'])
-@authentication_classes([JWTAuthentication, SessionAuthentication])
+@authentication_classes([CachedJWTAuthentication, SessionAuthentication])
 @permission_classes([IsAuthenticated])
 def pin_thread(request, thread_id):
     """Pin + Notify"""
@@ -273,17 +465,19 @@ def pin_thread(request, thread_id):
     if not request.user.is_moderator():
         return Response({'error': 'Only moderators can pin threads'}, status=status.HTTP_403_FORBIDDEN)
     
-    thread.is_pinned = not thread.is_pinned
-    thread.save()
-    
-    # Notify Author
-    action = "PINNED" if thread.is_pinned else "UNPINNED"
-    notify_thread_status(thread, action, request.user)
+    with transaction.atomic():
+        thread.is_pinned = not thread.is_pinned
+        thread.save()
+
+        # Notify Author
+        action = "PINNED" if thread.is_pinned else "UNPINNED"
+        notify_thread_status(thread, action, request.user)
+        publish_thread_status(thread)
 
     return Response({'message': f'Thread {action.lower()}'}, status=status.HTTP_200_OK)
 
 @api_view(['PATCH'])
-@authentication_classes([JWTAuthentication, SessionAuthentication])
+@authentication_classes([CachedJWTAuthentication, SessionAuthentication])
 @permission_classes([IsAuthenticated])
 def update_thread(request, thread_id):
     thread = get_object_or_404(Thread, pk=thread_id)
@@ -296,18 +490,20 @@ def update_thread(request, thread_id):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 @api_view(['DELETE'])
-@authentication_classes([JWTAuthentication, SessionAuthentication])
+@authentication_classes([CachedJWTAuthentication, SessionAuthentication])
 @permission_classes([IsAuthenticated])
 def delete_thread(request, thread_id):
     thread = get_object_or_404(Thread, pk=thread_id)
     if thread.author != request.user and not request.user.is_moderator():
         return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
-    thread.delete()
+    with transaction.atomic():
+        counters.thread_removed(thread)
+        thread.delete()
     return Response({'message': 'Thread deleted'}, status=status.HTTP_204_NO_CONTENT)
 
 
 @api_view(['PATCH'])
-@authentication_classes([JWTAuthentication, SessionAuthentication])
+@authentication_classes([CachedJWTAuthentication, SessionAuthentication])
 @permission_classes([IsAuthenticated])
 def update_reply(request, reply_id):
     reply = get_object_or_404(Reply, pk=reply_id)
@@ -320,20 +516,24 @@ def update_reply(request, reply_id):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 @api_view(['DELETE'])
-@authentication_classes([JWTAuthentication, SessionAuthentication])
+@authentication_classes([CachedJWTAuthentication, SessionAuthentication])
 @permission_classes([IsAuthenticated])
 def delete_reply(request, reply_id):
     reply = get_object_or_404(Reply, pk=reply_id)
     if reply.author != request.user and not request.user.is_moderator():
         return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
     thread = reply.thread
-    reply.delete()
-    thread.reply_count = max(0, thread.reply_count - 1)
-    thread.save(update_fields=['reply_count'])
+    with transaction.atomic():
+        reply.delete()
+        # Reply.soft_delete already took soft-deleted replies off every count
+        if not reply.is_deleted:
+            thread.reply_count = max(0, thread.reply_count - 1)
+            thread.save(update_fields=['reply_count'])
+            counters.thread_activity(thread, replies=-1)
     return Response({'message': 'Reply permanently deleted'}, status=status.HTTP_200_OK)
 
 @api_view(['POST'])
-@authentication_classes([JWTAuthentication, SessionAuthentication])
+@authentication_classes([CachedJWTAuthentication, SessionAuthentication])
 @permission_classes([IsAuthenticated])
 def mark_answer(request, reply_id):
     reply = get_object_or_404(Reply, pk=reply_id)
@@ -348,61 +548,79 @@ def mark_answer(request, reply_id):
     return Response(ReplySerializer(reply, context={'request': request}).data)
 
 @api_view(['POST'])
-@authentication_classes([JWTAuthentication, SessionAuthentication])
+@authentication_classes([CachedJWTAuthentication, SessionAuthentication])
 @permission_classes([IsAuthenticated])
 def like_thread(request, thread_id):
-    thread = get_object_or_404(Thread, pk=thread_id)
-    like, created = Like.objects.get_or_create(user=request.user, content_type='thread', thread=thread)
-    if not created:
-        like.delete()
-        thread.like_count = max(0, thread.like_count - 1)
-        action = 'unliked'
-    else:
-        thread.like_count += 1
-        action = 'liked'
-    thread.save(update_fields=['like_count'])
-    return Response({'message': f'Thread {action}', 'like_count': thread.like_count, 'user_liked': created})
+    thread = get_object_or_404(Thread.objects.only('pk', 'category_id', 'is_pinned', 'like_count'), pk=thread_id)
+    liked, like_count = toggle_thread_like(request.user, thread)
+    publish(thread_channel(thread.pk), 'likes', {'thread': thread.pk, 'like_count': like_count})
+    action = 'liked' if liked else 'unliked'
+    return Response({'message': f'Thread {action}', 'like_count': like_count, 'user_liked': liked})
 
 @api_view(['POST'])
-@authentication_classes([JWTAuthentication, SessionAuthentication])
+@authentication_classes([CachedJWTAuthentication, SessionAuthentication])
 @permission_classes([IsAuthenticated])
 def like_reply(request, reply_id):
-    reply = get_object_or_404(Reply, pk=reply_id)
-    like, created = Like.objects.get_or_create(user=request.user, content_type='reply', reply=reply)
-    if not created:
-        like.delete()
-        reply.like_count = max(0, reply.like_count - 1)
-        action = 'unliked'
-    else:
-        reply.like_count += 1
-        action = 'liked'
-    reply.save(update_fields=['like_count'])
-    return Response({'message': f'Reply {action}', 'like_count': reply.like_count, 'user_liked': created})
+    reply = get_object_or_404(Reply.objects.only('pk', 'thread_id'), pk=reply_id)
+    liked, like_count = toggle_reply_like(request.user, reply)
+    publish(thread_channel(reply.thread_id), 'likes', {'reply': reply.pk, 'like_count': like_count})
+    action = 'liked' if liked else 'unliked'
+    return Response({'message': f'Reply {action}', 'like_count': like_count, 'user_liked': liked})
 
 @api_view(['POST'])
-@authentication_classes([JWTAuthentication, SessionAuthentication])
+@authentication_classes([CachedJWTAuthentication, SessionAuthentication])
 @permission_classes([IsAuthenticated])
 @throttle_classes([BurstRateThrottle]) # <--- RATE LIMITING APPLIED
 def create_report(request):
     serializer = ReportCreateSerializer(data=request.data)
     if serializer.is_valid():
         report = serializer.save(reporter=request.user)
-        return Response(ReportSerializer(report).data, status=status.HTTP_201_CREATED)
+        data = ReportSerializer(report).data
+        publish(MODERATION_CHANNEL, 'report', data)
+        return Response(data, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 @api_view(['GET'])
-@authentication_classes([JWTAuthentication, SessionAuthentication])
+@authentication_classes([CachedJWTAuthentication, SessionAuthentication])
 @permission_classes([IsAuthenticated])
 def pending_reports(request):
     if not request.user.is_moderator():
         return Response({'error': 'Only moderators can view reports'}, status=status.HTTP_403_FORBIDDEN)
-    reports = Report.objects.filter(status='pending').order_by('-created_at')
-    # ... (pagination simplified)
-    serializer = ReportSerializer(reports, many=True)
-    return Response({'count': reports.count(), 'results': serializer.data})
+    reports = Report.objects.filter(status='pending').select_related('reporter', 'thread', 'reply')
+    try:
+        data = cursor_page(request, reports, LATEST_ORDERING, ReportSerializer)
+    except InvalidCursor as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(data)
+
+@api_view(['GET'])
+@authentication_classes([CachedJWTAuthentication, SessionAuthentication])
+@permission_classes([IsAuthenticated])
+def moderation_queue(request):
+    """Pending reports grouped per reported thread/reply, most reported first"""
+    if not request.user.is_moderator():
+        return Response({'error': 'Only moderators can view reports'}, status=status.HTTP_403_FORBIDDEN)
+    try:
+        groups, next_cursor = queue_page(request.query_params.get('cursor'), get_page_size(request))
+    except InvalidCursor as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'next': next_cursor, 'results': ModerationGroupSerializer(groups, many=True).data})
+
+@api_view(['POST'])
+@authentication_classes([CachedJWTAuthentication, SessionAuthentication])
+@permission_classes([IsAuthenticated])
+def bulk_moderate(request):
+    """Resolve/dismiss reports, lock/pin threads or soft-delete replies in one transaction"""
+    if not request.user.is_moderator():
+        return Response({'error': 'Only moderators can moderate content'}, status=status.HTTP_403_FORBIDDEN)
+    serializer = BulkModerationSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    changed = apply_bulk_action(request.user, **serializer.validated_data)
+    return Response({'action': serializer.validated_data['action'], **changed}, status=status.HTTP_200_OK)
 
 @api_view(['PATCH'])
-@authentication_classes([JWTAuthentication, SessionAuthentication])
+@authentication_classes([CachedJWTAuthentication, SessionAuthentication])
 @permission_classes([IsAuthenticated])
 def resolve_report(request, report_id):
     report = get_object_or_404(Report, pk=report_id)
@@ -411,13 +629,71 @@ def resolve_report(request, report_id):
     serializer = ReportUpdateSerializer(report, data=request.data, partial=True)
     if serializer.is_valid():
         serializer.save(moderator=request.user, resolved_at=timezone.now())
+        publish(MODERATION_CHANNEL, 'report_resolved', {'id': report.id, 'status': report.status})
         return Response(ReportSerializer(report).data)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 @api_view(['GET'])
-@authentication_classes([JWTAuthentication, SessionAuthentication])
+@authentication_classes([CachedJWTAuthentication, SessionAuthentication])
 @permission_classes([IsAuthenticated])
 def user_reports(request):
-    reports = Report.objects.filter(reporter=request.user)
+    reports = Report.objects.filter(reporter=request.user).select_related('reporter', 'thread', 'reply')
     serializer = ReportSerializer(reports, many=True)
-    return Response({'count': reports.count(), 'results': serializer.data})
\ No newline at end of file
+    return Response({'count': reports.count(), 'results': serializer.data})
+
+@api_view(['GET'])
+@authentication_classes([CachedJWTAuthentication, SessionAuthentication])
+@permission_classes([IsAuthenticated])
+def notification_list(request):
+    """Newest first; `?unread=1` for unread only"""
+    inbox = Notification.objects.filter(recipient=request.user).select_related('actor', 'thread').only(
+        'id', 'kind', 'message', 'is_read', 'created_at', 'actor__username', 'thread__title'
+    )
+    if request.GET.get('unread', '').lower() in ('1', 'true', 'yes'):
+        inbox = inbox.filter(is_read=False)
+    try:
+        data = cursor_page(request, inbox, LATEST_ORDERING, NotificationSerializer)
+    except InvalidCursor as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    data['unread'] = request.user.unread_notification_count
+    return Response(data)
+
+@api_view(['GET'])
+@authentication_classes([CachedJWTAuthentication, SessionAuthentication])
+@permission_classes([IsAuthenticated])
+def unread_notification_count(request):
+    """
+    Badge count, from the authenticated user row: the session's user query,
+    or the cached JWT user (no query on a hit)
+    """
+    return Response({'unread': request.user.unread_notification_count})
+
+@api_view(['POST'])
+@authentication_classes([CachedJWTAuthentication, SessionAuthentication])
+@permission_classes([IsAuthenticated])
+def mark_notification_read(request, notification_id):
+    notifications.mark_read(request.user, [notification_id])
+    return Response({'message': 'Notification marked read'}, status=status.HTTP_200_OK)
+
+@api_view(['POST'])
+@authentication_classes([CachedJWTAuthentication, SessionAuthentication])
+@permission_classes([IsAuthenticated])
+def mark_all_notifications_read(request):
+    changed = notifications.mark_read(request.user)
+    return Response({'message': f'{changed} notification(s) marked read'}, status=status.HTTP_200_OK)
+
+@api_view(['POST'])
+@authentication_classes([CachedJWTAuthentication, SessionAuthentication])
+@permission_classes([IsAuthenticated])
+def stream_ticket(request):
+    """Single-use `?ticket=` for opening an event stream (see core.streams)"""
+    ticket = issue_stream_ticket(request.user)
+    return Response({'ticket': ticket, 'expires_in': getattr(settings, 'STREAM_TICKET_TIMEOUT', 30)})
+
+@api_view(['GET'])
+@authentication_classes([CachedJWTAuthentication, SessionAuthentication])
+@permission_classes([IsAdminUser])
+@throttle_classes([])
+def metrics(request):
+    """Request histograms of this worker process, in Prometheus text format"""
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
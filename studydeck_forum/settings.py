@@ -37,6 +37,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware', 
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -81,12 +82,12 @@ AUTH_USER_MODEL = 'core.CustomUser'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle'
+        'core.throttling.AnonRateThrottle',
+        'core.throttling.UserRateThrottle'
     ],
     'DEFAULT_THROTTLE_RATES': {
         'anon': '100/day',      
@@ -98,8 +99,77 @@ REST_FRAMEWORK = {
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
+    'TOKEN_OBTAIN_SERIALIZER': 'core.serializers.ForumTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'core.serializers.ForumTokenRefreshSerializer',
 }
 
+# --- CACHE ---
+# Without REDIS_URL each worker process gets its own in-memory cache, which
+# is only correct with a single worker: JWT user invalidations, stream
+# tickets and response cache versions must be seen by every worker.
+REDIS_URL = os.environ.get('REDIS_URL', '')
+if REDIS_URL:
+    CACHES = {
+        'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': REDIS_URL},
+    }
+
+# --- METRICS ---
+# Per-view timings in a Server-Timing header and on the staff-only /metrics endpoint
+REQUEST_METRICS = os.environ.get('REQUEST_METRICS', '1') == '1'
+
+# --- THROTTLING ---
+# Token buckets shared by all workers on the host (core.throttling). Use
+# 'core.throttling.CacheStore' with a shared CACHES backend across hosts.
+THROTTLE_STORE = os.environ.get('THROTTLE_STORE', 'core.throttling.SharedMemoryStore')
+THROTTLE_SLOTS = 65536  # 16 bytes each
+
+# JWT users are resolved from the cache for this many seconds (core.authentication).
+# Set REDIS_URL with several workers so invalidations reach all of them.
+AUTH_USER_CACHE_TIMEOUT = 60
+# Carry email/username/role in access tokens so read-only requests skip the user lookup
+JWT_ROLE_CLAIMS = os.environ.get('JWT_ROLE_CLAIMS', '') == '1'
+
+# Rendered course/category/tag list responses and shared thread detail payloads
+# are cached for this many seconds, or until a write bumps their version
+# (core.response_cache, core.thread_cache); 0 disables. Off by default without
+# REDIS_URL, where a worker would keep serving entries another worker's write
+# invalidated.
+RESPONSE_CACHE_TIMEOUT = int(os.environ.get('RESPONSE_CACHE_TIMEOUT', 300 if REDIS_URL else 0))
+
+# --- SEARCH ---
+# Dotted path to a core.search.SearchBackend; empty picks PostgreSQL full-text
+# search on PostgreSQL and the in-process BM25 index on other databases.
+SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', '')
+SEARCH_INDEX_PATH = os.environ.get('SEARCH_INDEX_PATH', str(BASE_DIR / 'search_index.npz'))
+SEARCH_SYNC_INTERVAL = 30  # seconds between catch-up syncs of the BM25 index
+
+# --- LIKES ---
+# Spread like-count updates on pinned threads over shard rows; fold them
+# into Thread.like_count and the category and tag totals with
+# `manage.py fold_like_shards` (e.g. every minute).
+LIKE_SHARD_PINNED_THREADS = os.environ.get('LIKE_SHARD_PINNED_THREADS', '') == '1'
+LIKE_COUNTER_SHARDS = 8
+
+# --- RESOURCE VIEWS ---
+# Buffer view counts in memory and flush them every N seconds (0 = write through)
+VIEW_COUNT_FLUSH_INTERVAL = 10
+
+# --- EMAIL OUTBOX ---
+# Notifications are queued in core_outboxemail and sent by `manage.py send_outbox`
+EMAIL_OUTBOX_BATCH_SIZE = 50
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_RETRY_DELAY = 60  # seconds before the first retry, doubled after each failure
+EMAIL_OUTBOX_LEASE = 300  # seconds a claimed batch stays hidden from other workers
+# Notifications for users on 'instant' wait this long so a burst becomes one email (0 = no coalescing)
+EMAIL_COALESCE_WINDOW = 120
+
+# --- LIVE EVENTS (SSE, needs ASGI) ---
+# Dotted path to a core.events.EventBroker; LocalBroker only reaches streams in the same process
+EVENT_BROKER = 'core.events.LocalBroker'
+SSE_HEARTBEAT_INTERVAL = 15  # seconds between keepalive comments
+SSE_QUEUE_SIZE = 100  # events buffered per client before it is told to resync
+STREAM_TICKET_TIMEOUT = 30  # seconds a single-use stream ticket stays valid (needs REDIS_URL with several workers)
+
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 DEFAULT_FROM_EMAIL = 'noreply@studydeck.com'
 
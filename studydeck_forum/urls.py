@@ -7,10 +7,13 @@ from django.http import HttpResponse
 from django.contrib.auth import get_user_model
 from django.db import connection
 
+from core import views as core_views
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('core.urls')),      # Connects the API URLs above
     path('accounts/', include('allauth.urls')), # Connects Google Login
+    path('metrics', core_views.metrics, name='metrics'),
 
     # --- FRONTEND PAGES ---
     # Login & Home